@@ -19,6 +19,7 @@ limitations under the License.
 #include "neuropod/internal/config_utils.hh"
 #include "neuropod/internal/error_utils.hh"
 #include "neuropod/internal/neuropod_loader.hh"
+#include "neuropod/internal/prefetch.hh"
 
 namespace neuropod
 {
@@ -224,6 +225,14 @@ NeuropodBackend::NeuropodBackend(const std::string &neuropod_path, const Runtime
       sealer_(stdx::make_unique<Sealer>(get_device_mapping(*model_config_, options_)))
 {
     loader_ = get_loader(neuropod_path);
+
+    const auto num_prefetch_threads = get_prefetch_threads();
+    if (num_prefetch_threads > 0)
+    {
+        // Start reading the model files while the backend initializes
+        prefetcher_ =
+            stdx::make_unique<Prefetcher>(loader_->get_prefetch_ranges(get_prefetch_patterns()), num_prefetch_threads);
+    }
 }
 
 void NeuropodBackend::load_model()
@@ -232,6 +241,12 @@ void NeuropodBackend::load_model()
     {
         load_model_internal();
         is_model_loaded_ = true;
+
+        if (prefetcher_)
+        {
+            prefetcher_->finish();
+            prefetcher_.reset();
+        }
     }
     else
     {
@@ -104,6 +104,9 @@ private:
     bool is_model_loaded_ = false;
 
     std::unique_ptr<Sealer> sealer_;
+
+    // Reads the model files into the page cache while the backend initializes (if prefetching is enabled)
+    std::unique_ptr<Prefetcher> prefetcher_;
 };
 
 template <template <class> class TensorImpl>
@@ -22,6 +22,7 @@ limitations under the License.
 #include <json/json.h>
 
 #include <algorithm>
+#include <cstdlib>
 #include <fstream>
 #include <iostream>
 #include <mutex>
@@ -92,10 +93,49 @@ void check_tf_status(const tensorflow::Status &status)
     }
 }
 
+// By default, TF only clusters ops for XLA on GPU. This flag is read the first time
+// a graph is optimized so it must be set before any session runs
+void enable_xla_cpu_jit()
+{
+    static std::once_flag flag;
+    std::call_once(flag, []() {
+        const char *existing  = std::getenv("TF_XLA_FLAGS");
+        std::string xla_flags = existing == nullptr ? "" : existing;
+        if (xla_flags.find("--tf_xla_cpu_global_jit") == std::string::npos)
+        {
+            xla_flags += " --tf_xla_cpu_global_jit";
+            setenv("TF_XLA_FLAGS", xla_flags.c_str(), 1);
+        }
+    });
+}
+
 // Get TF session options given Neuropod RuntimeOptions
-tensorflow::SessionOptions get_tf_opts(const RuntimeOptions & /*unused*/)
+tensorflow::SessionOptions get_tf_opts(const RuntimeOptions &options)
 {
     tensorflow::SessionOptions opts;
+    const auto &               tf_options = options.tf_options;
+
+    // Thread pool configuration
+    opts.config.set_intra_op_parallelism_threads(tf_options.intra_op_parallelism_threads);
+    opts.config.set_inter_op_parallelism_threads(tf_options.inter_op_parallelism_threads);
+    if (tf_options.use_shared_thread_pool)
+    {
+        // Sessions with the same `global_name` share a thread pool. All sessions using a pool must
+        // request the same number of threads so we include that in the name
+        auto pool = opts.config.add_session_inter_op_thread_pool();
+        pool->set_num_threads(tf_options.inter_op_parallelism_threads);
+        pool->set_global_name("neuropod_shared_inter_op_pool_" +
+                              std::to_string(tf_options.inter_op_parallelism_threads));
+    }
+
+    // Graph optimizer configuration
+    auto optimizer_opts = opts.config.mutable_graph_options()->mutable_optimizer_options();
+    optimizer_opts->set_opt_level(static_cast<tensorflow::OptimizerOptions::Level>(tf_options.graph_optimizer_level));
+    if (tf_options.enable_xla_jit)
+    {
+        optimizer_opts->set_global_jit_level(tensorflow::OptimizerOptions::ON_1);
+        enable_xla_cpu_jit();
+    }
 
     // Don't preallocate the entire GPU
     auto gpu_opts = opts.config.mutable_gpu_options();
@@ -16,10 +16,23 @@ limitations under the License.
 #include "torch_backend.hh"
 
 #include "neuropod/backends/torchscript/type_utils.hh"
+#include "neuropod/internal/logging.hh"
 #include "neuropod/internal/tensor_types.hh"
 
+#include <ATen/Parallel.h>
 #include <caffe2/core/macros.h>
 
+#if CAFFE2_NIGHTLY_VERSION >= 20200421
+#include <torch/csrc/jit/passes/freeze_module.h>
+#include <torch/csrc/jit/runtime/graph_executor.h>
+#else
+#include <torch/csrc/jit/graph_executor.h>
+#endif
+
+#if CAFFE2_NIGHTLY_VERSION >= 20210615
+#include <c10/core/InferenceMode.h>
+#endif
+
 #include <iostream>
 #include <mutex>
 #include <sstream>
@@ -118,6 +131,47 @@ std::shared_ptr<torch::jit::script::Module> load_model_from_path(std::istream &
     return model;
 }
 
+// Apply the process-wide torch threading options
+void set_torch_threads(const RuntimeOptions::TorchScriptOptions &options)
+{
+    if (options.num_threads > 0)
+    {
+        at::set_num_threads(options.num_threads);
+    }
+
+    if (options.num_interop_threads > 0 && options.num_interop_threads != at::get_num_interop_threads())
+    {
+        // Torch only allows the number of interop threads to be set once (and before
+        // any interop work has started)
+        try
+        {
+            at::set_num_interop_threads(options.num_interop_threads);
+        }
+        catch (const c10::Error &e)
+        {
+            SPDLOG_WARN("Torch: Could not set the number of interop threads to {}: {}",
+                        options.num_interop_threads,
+                        e.what_without_backtrace());
+        }
+    }
+}
+
+// Sets whether the graph executor optimizes graphs on the current thread and
+// restores the previous value on destruction
+class GraphExecutorOptimizeGuard
+{
+private:
+    bool prev_;
+
+public:
+    explicit GraphExecutorOptimizeGuard(bool optimize) : prev_(torch::jit::getGraphExecutorOptimize())
+    {
+        torch::jit::setGraphExecutorOptimize(optimize);
+    }
+
+    ~GraphExecutorOptimizeGuard() { torch::jit::setGraphExecutorOptimize(prev_); }
+};
+
 // insert IValue to the output map at key with some type validation
 void insert_value_in_output(NeuropodValueMap & output,
                             const std::string  name,
@@ -233,8 +287,12 @@ TorchNeuropodBackend::TorchNeuropodBackend(const std::string &neuropod_path, con
 
 void TorchNeuropodBackend::load_model_internal()
 {
+    // Apply threading options before any work is done in this process
+    set_torch_threads(options_.torchscript_options);
+
     // Get the model from the neuropod
-    auto graph_stream = loader_->get_istream_for_file("0/data/model.pt");
+    // TorchScript archives are read with random access so we need a stream that can seek efficiently
+    auto graph_stream = loader_->get_seekable_istream_for_file("0/data/model.pt");
 
     // Custom ops
     // Make sure we don't load a custom op twice
@@ -265,6 +323,22 @@ void TorchNeuropodBackend::load_model_internal()
         NEUROPOD_ERROR("Failed to load TorchScript graph for neuropod {}", neuropod_path_);
     }
 
+    if (options_.torchscript_options.freeze)
+    {
+#if CAFFE2_NIGHTLY_VERSION >= 20200421
+        // Freezing requires the module to be in eval mode
+        model_->eval();
+        model_ = std::make_shared<torch::jit::script::Module>(torch::jit::freeze_module(*model_));
+#if CAFFE2_NIGHTLY_VERSION >= 20211101
+        // Apply the optimizations that are only valid for inference (e.g. folding batchnorms into
+        // convolutions). This matches `torch.jit.optimize_for_inference` in the python backend
+        model_ = std::make_shared<torch::jit::script::Module>(torch::jit::optimize_for_inference(*model_));
+#endif
+#else
+        NEUROPOD_ERROR("Freezing TorchScript models requires torch >= 1.5. Neuropod: {}", neuropod_path_);
+#endif
+    }
+
     for (const auto &tensor_spec : model_config_->outputs)
     {
         output_specs_.emplace_back(tensor_spec);
@@ -297,6 +371,13 @@ std::unique_ptr<NeuropodValueMap> TorchNeuropodBackend::infer_internal(const Neu
 {
     torch::NoGradGuard guard;
 
+#if CAFFE2_NIGHTLY_VERSION >= 20210615
+    c10::InferenceMode inference_mode_guard(options_.torchscript_options.use_inference_mode);
+#endif
+
+    // This setting is thread local so we need to set it on every inference call
+    GraphExecutorOptimizeGuard optimize_guard(options_.torchscript_options.graph_executor_optimize);
+
     // Get inference schema
     const auto &method    = model_->get_method("forward");
     const auto &schema    = SCHEMA(method);
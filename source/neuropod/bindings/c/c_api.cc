@@ -27,6 +27,41 @@ limitations under the License.
 #include <string>
 #include <vector>
 
+namespace
+{
+
+// Convert C runtime options to C++ runtime options
+neuropod::RuntimeOptions to_runtime_options(const NP_RuntimeOptions &options)
+{
+    neuropod::RuntimeOptions out;
+
+    out.use_ope                         = options.use_ope;
+    out.visible_device                  = static_cast<neuropod::NeuropodDevice>(options.visible_device);
+    out.load_model_at_construction      = options.load_model_at_construction;
+    out.disable_shape_and_type_checking = options.disable_shape_and_type_checking;
+
+    out.ope_options.free_memory_every_cycle = options.ope_options.free_memory_every_cycle;
+    out.ope_options.control_queue_name      = options.ope_options.control_queue_name;
+
+    out.tf_options.intra_op_parallelism_threads = options.tf_options.intra_op_parallelism_threads;
+    out.tf_options.inter_op_parallelism_threads = options.tf_options.inter_op_parallelism_threads;
+    out.tf_options.use_shared_thread_pool       = options.tf_options.use_shared_thread_pool;
+    out.tf_options.graph_optimizer_level        = options.tf_options.graph_optimizer_level;
+    out.tf_options.enable_xla_jit               = options.tf_options.enable_xla_jit;
+
+    out.torchscript_options.num_threads             = options.torchscript_options.num_threads;
+    out.torchscript_options.num_interop_threads     = options.torchscript_options.num_interop_threads;
+    out.torchscript_options.graph_executor_optimize = options.torchscript_options.graph_executor_optimize;
+    out.torchscript_options.freeze                  = options.torchscript_options.freeze;
+    out.torchscript_options.use_inference_mode      = options.torchscript_options.use_inference_mode;
+
+    out.python_options.num_replicas = options.python_options.num_replicas;
+
+    return out;
+}
+
+} // namespace
+
 void NP_LoadNeuropodWithOpts(const char *             neuropod_path,
                              const NP_RuntimeOptions *options,
                              NP_Neuropod **           model,
@@ -35,7 +70,7 @@ void NP_LoadNeuropodWithOpts(const char *             neuropod_path,
     try
     {
         *model          = new NP_Neuropod();
-        (*model)->model = std::make_unique<neuropod::Neuropod>(neuropod_path);
+        (*model)->model = std::make_unique<neuropod::Neuropod>(neuropod_path, to_runtime_options(*options));
         NP_ClearStatus(status);
     }
     catch (std::exception &e)
@@ -62,6 +97,22 @@ NP_RuntimeOptions NP_DefaultRuntimeOptions()
     // This is what is expected by default.
     ope_options->control_queue_name[0] = '\0';
 
+    auto tf_options                          = &options.tf_options;
+    tf_options->intra_op_parallelism_threads = default_options.tf_options.intra_op_parallelism_threads;
+    tf_options->inter_op_parallelism_threads = default_options.tf_options.inter_op_parallelism_threads;
+    tf_options->use_shared_thread_pool       = default_options.tf_options.use_shared_thread_pool;
+    tf_options->graph_optimizer_level        = default_options.tf_options.graph_optimizer_level;
+    tf_options->enable_xla_jit               = default_options.tf_options.enable_xla_jit;
+
+    auto torchscript_options                     = &options.torchscript_options;
+    torchscript_options->num_threads             = default_options.torchscript_options.num_threads;
+    torchscript_options->num_interop_threads     = default_options.torchscript_options.num_interop_threads;
+    torchscript_options->graph_executor_optimize = default_options.torchscript_options.graph_executor_optimize;
+    torchscript_options->freeze                  = default_options.torchscript_options.freeze;
+    torchscript_options->use_inference_mode      = default_options.torchscript_options.use_inference_mode;
+
+    options.python_options.num_replicas = default_options.python_options.num_replicas;
+
     return options;
 }
 
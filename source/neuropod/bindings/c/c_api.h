@@ -24,6 +24,7 @@ limitations under the License.
 #include "neuropod/bindings/c/np_valuemap.h"
 
 #include <stdbool.h>
+#include <stdint.h>
 
 #ifdef __cplusplus
 extern "C" {
@@ -64,6 +65,32 @@ typedef struct NP_RuntimeOptions
 
     bool load_model_at_construction;
     bool disable_shape_and_type_checking;
+
+    // These options are only used by the TensorFlow backend.
+    struct NP_TFOptions
+    {
+        int32_t intra_op_parallelism_threads;
+        int32_t inter_op_parallelism_threads;
+        bool    use_shared_thread_pool;
+        int32_t graph_optimizer_level;
+        bool    enable_xla_jit;
+    } tf_options;
+
+    // These options are only used by the TorchScript backend.
+    struct NP_TorchScriptOptions
+    {
+        int32_t num_threads;
+        int32_t num_interop_threads;
+        bool    graph_executor_optimize;
+        bool    freeze;
+        bool    use_inference_mode;
+    } torchscript_options;
+
+    // These options are only used by the python backend.
+    struct NP_PythonOptions
+    {
+        int32_t num_replicas;
+    } python_options;
 } NP_RuntimeOptions;
 
 // Creates default runtime options that used implicitly when load model w/o options.
@@ -78,6 +78,78 @@ public class RuntimeOptions {
      */
     public boolean disableShapeAndTypeChecking = false;
 
+    /**
+     * The number of TensorFlow intra-op threads.
+     * <p>
+     * The number of threads used to parallelize the execution of a single op. If this is 0,
+     * TF will pick an appropriate number (usually the number of cores). Only used by the
+     * TensorFlow backend.
+     */
+    public int tfIntraOpParallelismThreads = 0;
+
+    /**
+     * The number of TensorFlow inter-op threads.
+     * <p>
+     * The number of threads used to run independent ops concurrently. If this is 0,
+     * TF will pick an appropriate number (usually the number of cores). Only used by the
+     * TensorFlow backend.
+     */
+    public int tfInterOpParallelismThreads = 0;
+
+    /**
+     * Is use a shared TensorFlow thread pool.
+     * <p>
+     * If this is set, all TF models in the process that also set it (and use the same
+     * tfInterOpParallelismThreads) share a single inter-op thread pool.
+     */
+    public boolean tfUseSharedThreadPool = false;
+
+    /**
+     * The TensorFlow graph optimizer level.
+     * <p>
+     * See `OptimizerOptions::Level` in TF. `0` is the TF default (L1) and `-1` (L0) disables
+     * common subexpression elimination and constant folding.
+     */
+    public int tfGraphOptimizerLevel = 0;
+
+    /**
+     * Is enable TensorFlow XLA JIT.
+     * <p>
+     * Whether or not to JIT compile clusters of ops with XLA (including on CPU).
+     */
+    public boolean tfEnableXlaJit = false;
+
+    /**
+     * The number of TorchScript intra-op threads.
+     * <p>
+     * Torch uses a process-wide thread pool so this affects all TorchScript models in the
+     * process. If this is 0, the current setting is left unchanged.
+     */
+    public int torchscriptNumThreads = 0;
+
+    /**
+     * The number of TorchScript inter-op threads.
+     * <p>
+     * This can only be set before any inter-op work has started in the process.
+     * If this is 0, the current setting is left unchanged.
+     */
+    public int torchscriptNumInteropThreads = 0;
+
+    /**
+     * Is enable TorchScript graph executor optimizations.
+     * <p>
+     * Disabling this can reduce the latency of the first few inference runs at the cost of
+     * steady state performance.
+     */
+    public boolean torchscriptGraphExecutorOptimize = true;
+
+    /**
+     * Is freeze the TorchScript model at load time.
+     * <p>
+     * This requires torch &gt;= 1.5. With torch &gt;= 1.11, the frozen model is also optimized for inference.
+     */
+    public boolean torchscriptFreeze = false;
+
     /**
      * Instantiates a new Runtime options.
      */
@@ -95,7 +167,16 @@ public class RuntimeOptions {
                 controlQueueName,
                 visibleDevice,
                 loadModelAtConstruction,
-                disableShapeAndTypeChecking);
+                disableShapeAndTypeChecking,
+                tfIntraOpParallelismThreads,
+                tfInterOpParallelismThreads,
+                tfUseSharedThreadPool,
+                tfGraphOptimizerLevel,
+                tfEnableXlaJit,
+                torchscriptNumThreads,
+                torchscriptNumInteropThreads,
+                torchscriptGraphExecutorOptimize,
+                torchscriptFreeze);
     }
 
     /**
@@ -112,19 +193,46 @@ public class RuntimeOptions {
          * @param visibleDevice               the visible device
          * @param loadModelAtConstruction     the load model at construction
          * @param disableShapeAndTypeChecking the disable shape and type checking
+         * @param tfIntraOpParallelismThreads the TF intra-op parallelism threads
+         * @param tfInterOpParallelismThreads the TF inter-op parallelism threads
+         * @param tfUseSharedThreadPool       the TF use shared thread pool
+         * @param tfGraphOptimizerLevel       the TF graph optimizer level
+         * @param tfEnableXlaJit              the TF enable XLA JIT
+         * @param torchscriptNumThreads            the TorchScript intra-op threads
+         * @param torchscriptNumInteropThreads     the TorchScript inter-op threads
+         * @param torchscriptGraphExecutorOptimize the TorchScript enable graph executor optimizations
+         * @param torchscriptFreeze                the TorchScript freeze model
          */
         RuntimeOptionsNative(boolean useOpe,
                              boolean freeMemoryEveryCycle,
                              String controlQueueName,
                              int visibleDevice,
                              boolean loadModelAtConstruction,
-                             boolean disableShapeAndTypeChecking) {
+                             boolean disableShapeAndTypeChecking,
+                             int tfIntraOpParallelismThreads,
+                             int tfInterOpParallelismThreads,
+                             boolean tfUseSharedThreadPool,
+                             int tfGraphOptimizerLevel,
+                             boolean tfEnableXlaJit,
+                             int torchscriptNumThreads,
+                             int torchscriptNumInteropThreads,
+                             boolean torchscriptGraphExecutorOptimize,
+                             boolean torchscriptFreeze) {
             super(nativeCreate(useOpe,
                     freeMemoryEveryCycle,
                     controlQueueName,
                     visibleDevice,
                     loadModelAtConstruction,
-                    disableShapeAndTypeChecking));
+                    disableShapeAndTypeChecking,
+                    tfIntraOpParallelismThreads,
+                    tfInterOpParallelismThreads,
+                    tfUseSharedThreadPool,
+                    tfGraphOptimizerLevel,
+                    tfEnableXlaJit,
+                    torchscriptNumThreads,
+                    torchscriptNumInteropThreads,
+                    torchscriptGraphExecutorOptimize,
+                    torchscriptFreeze));
         }
 
         static private native long nativeCreate(boolean useOpe,
@@ -132,7 +240,16 @@ public class RuntimeOptions {
                                                 String controlQueueName,
                                                 int visibleDevice,
                                                 boolean loadModelAtConstruction,
-                                                boolean disableShapeAndTypeChecking);
+                                                boolean disableShapeAndTypeChecking,
+                                                int tfIntraOpParallelismThreads,
+                                                int tfInterOpParallelismThreads,
+                                                boolean tfUseSharedThreadPool,
+                                                int tfGraphOptimizerLevel,
+                                                boolean tfEnableXlaJit,
+                                                int torchscriptNumThreads,
+                                                int torchscriptNumInteropThreads,
+                                                boolean torchscriptGraphExecutorOptimize,
+                                                boolean torchscriptFreeze);
 
         @Override
         protected native void nativeDelete(long handle);
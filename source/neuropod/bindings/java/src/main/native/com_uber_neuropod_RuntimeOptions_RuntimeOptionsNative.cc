@@ -33,18 +33,36 @@ Java_com_uber_neuropod_RuntimeOptions_00024RuntimeOptionsNative_nativeCreate(JNI
                                                                              jstring  jControlQueueName,
                                                                              jint     visibleDevice,
                                                                              jboolean loadModelAtConstruction,
-                                                                             jboolean disableShapeAndTypeChecking)
+                                                                             jboolean disableShapeAndTypeChecking,
+                                                                             jint     tfIntraOpParallelismThreads,
+                                                                             jint     tfInterOpParallelismThreads,
+                                                                             jboolean tfUseSharedThreadPool,
+                                                                             jint     tfGraphOptimizerLevel,
+                                                                             jboolean tfEnableXlaJit,
+                                                                             jint     torchscriptNumThreads,
+                                                                             jint     torchscriptNumInteropThreads,
+                                                                             jboolean torchscriptGraphExecutorOptimize,
+                                                                             jboolean torchscriptFreeze)
 {
     try
     {
-        std::string controlQueueName              = toString(env, jControlQueueName);
-        auto        opts                          = new neuropod::RuntimeOptions();
-        opts->use_ope                             = (useOpe == JNI_TRUE);
-        opts->ope_options.free_memory_every_cycle = (freeMemoryEveryCycle == JNI_TRUE);
-        opts->ope_options.control_queue_name      = controlQueueName;
-        opts->visible_device                      = static_cast<int32_t>(visibleDevice);
-        opts->load_model_at_construction          = (loadModelAtConstruction == JNI_TRUE);
-        opts->disable_shape_and_type_checking     = (disableShapeAndTypeChecking == JNI_TRUE);
+        std::string controlQueueName                      = toString(env, jControlQueueName);
+        auto        opts                                  = new neuropod::RuntimeOptions();
+        opts->use_ope                                     = (useOpe == JNI_TRUE);
+        opts->ope_options.free_memory_every_cycle         = (freeMemoryEveryCycle == JNI_TRUE);
+        opts->ope_options.control_queue_name              = controlQueueName;
+        opts->visible_device                              = static_cast<int32_t>(visibleDevice);
+        opts->load_model_at_construction                  = (loadModelAtConstruction == JNI_TRUE);
+        opts->disable_shape_and_type_checking             = (disableShapeAndTypeChecking == JNI_TRUE);
+        opts->tf_options.intra_op_parallelism_threads     = static_cast<int32_t>(tfIntraOpParallelismThreads);
+        opts->tf_options.inter_op_parallelism_threads     = static_cast<int32_t>(tfInterOpParallelismThreads);
+        opts->tf_options.use_shared_thread_pool           = (tfUseSharedThreadPool == JNI_TRUE);
+        opts->tf_options.graph_optimizer_level            = static_cast<int32_t>(tfGraphOptimizerLevel);
+        opts->tf_options.enable_xla_jit                   = (tfEnableXlaJit == JNI_TRUE);
+        opts->torchscript_options.num_threads             = static_cast<int32_t>(torchscriptNumThreads);
+        opts->torchscript_options.num_interop_threads     = static_cast<int32_t>(torchscriptNumInteropThreads);
+        opts->torchscript_options.graph_executor_optimize = (torchscriptGraphExecutorOptimize == JNI_TRUE);
+        opts->torchscript_options.freeze                  = (torchscriptFreeze == JNI_TRUE);
         return reinterpret_cast<jlong>(opts);
     }
     catch (const std::exception &e)
@@ -25,10 +25,25 @@ extern "C" {
 /*
  * Class:     com_uber_neuropod_RuntimeOptions_RuntimeOptionsNative
  * Method:    nativeCreate
- * Signature: (ZZLjava/lang/String;IZZ)J
+ * Signature: (ZZLjava/lang/String;IZZIIZIZIIZZ)J
  */
-JNIEXPORT jlong JNICALL Java_com_uber_neuropod_RuntimeOptions_00024RuntimeOptionsNative_nativeCreate(
-    JNIEnv *, jclass, jboolean, jboolean, jstring, jint, jboolean, jboolean);
+JNIEXPORT jlong JNICALL Java_com_uber_neuropod_RuntimeOptions_00024RuntimeOptionsNative_nativeCreate(JNIEnv *,
+                                                                                                     jclass,
+                                                                                                     jboolean,
+                                                                                                     jboolean,
+                                                                                                     jstring,
+                                                                                                     jint,
+                                                                                                     jboolean,
+                                                                                                     jboolean,
+                                                                                                     jint,
+                                                                                                     jint,
+                                                                                                     jboolean,
+                                                                                                     jint,
+                                                                                                     jboolean,
+                                                                                                     jint,
+                                                                                                     jint,
+                                                                                                     jboolean,
+                                                                                                     jboolean);
 
 /*
  * Class:     com_uber_neuropod_RuntimeOptions_RuntimeOptionsNative
@@ -131,6 +131,50 @@ RuntimeOptions get_options_from_kwargs(py::kwargs &kwargs)
         {
             options.use_ope = value.cast<bool>();
         }
+        else if (key == "intra_op_parallelism_threads")
+        {
+            options.tf_options.intra_op_parallelism_threads = value.cast<int32_t>();
+        }
+        else if (key == "inter_op_parallelism_threads")
+        {
+            options.tf_options.inter_op_parallelism_threads = value.cast<int32_t>();
+        }
+        else if (key == "use_shared_thread_pool")
+        {
+            options.tf_options.use_shared_thread_pool = value.cast<bool>();
+        }
+        else if (key == "graph_optimizer_level")
+        {
+            options.tf_options.graph_optimizer_level = value.cast<int32_t>();
+        }
+        else if (key == "enable_xla_jit")
+        {
+            options.tf_options.enable_xla_jit = value.cast<bool>();
+        }
+        else if (key == "num_threads")
+        {
+            options.torchscript_options.num_threads = value.cast<int32_t>();
+        }
+        else if (key == "num_interop_threads")
+        {
+            options.torchscript_options.num_interop_threads = value.cast<int32_t>();
+        }
+        else if (key == "graph_executor_optimize")
+        {
+            options.torchscript_options.graph_executor_optimize = value.cast<bool>();
+        }
+        else if (key == "freeze")
+        {
+            options.torchscript_options.freeze = value.cast<bool>();
+        }
+        else if (key == "use_inference_mode")
+        {
+            options.torchscript_options.use_inference_mode = value.cast<bool>();
+        }
+        else if (key == "num_replicas")
+        {
+            options.python_options.num_replicas = value.cast<int32_t>();
+        }
         else
         {
             NEUROPOD_ERROR("Got unexpected keyword argument {}", key);
@@ -0,0 +1,172 @@
+/* Copyright (c) 2020 UATC, LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+#include "neuropod/internal/content_store.hh"
+
+#include "neuropod/internal/error_utils.hh"
+#include "neuropod/internal/hash_utils.hh"
+#include "neuropod/internal/logging.hh"
+
+#include <ghc/filesystem.hpp>
+#include <sys/stat.h>
+
+#include <atomic>
+#include <cerrno>
+#include <cstdlib>
+#include <cstring>
+#include <ctime>
+
+#include <unistd.h>
+
+namespace neuropod
+{
+
+namespace
+{
+
+namespace fs = ghc::filesystem;
+
+constexpr char TMP_SUFFIX[] = ".tmp-";
+
+// Temporary files older than this (in seconds) were left behind by a process that crashed
+constexpr time_t ABANDONED_TMP_AGE = 60 * 60;
+
+std::string get_tmp_path(const std::string &path)
+{
+    static std::atomic<uint64_t> counter{0};
+    return path + TMP_SUFFIX + std::to_string(getpid()) + "-" + std::to_string(counter++);
+}
+
+// Atomically creates or replaces `dst` with a hard link to `src`. Returns false if `src` doesn't exist or if they're
+// on different filesystems (the store isn't used in that case)
+bool make_link(const std::string &src, const std::string &dst)
+{
+    const auto tmp = get_tmp_path(dst);
+    if (link(src.c_str(), tmp.c_str()) != 0)
+    {
+        if (errno == ENOENT)
+        {
+            return false;
+        }
+
+        if (errno == EXDEV)
+        {
+            static std::atomic_flag warned = ATOMIC_FLAG_INIT;
+            if (!warned.test_and_set())
+            {
+                SPDLOG_WARN("Can't hard link '{}' to '{}' because they're on different filesystems. Extracting without "
+                            "the content store",
+                            src,
+                            dst);
+            }
+
+            return false;
+        }
+
+        NEUROPOD_ERROR("Error linking '{}' to '{}': {}", src, dst, strerror(errno));
+    }
+
+    if (rename(tmp.c_str(), dst.c_str()) != 0)
+    {
+        const auto err = errno;
+        unlink(tmp.c_str());
+        NEUROPOD_ERROR("Error renaming '{}' to '{}': {}", tmp, dst, strerror(err));
+    }
+
+    return true;
+}
+
+} // namespace
+
+std::string get_content_store_dir()
+{
+    const char *store_dir = std::getenv("NEUROPOD_CONTENT_STORE_DIR");
+    return store_dir == nullptr ? "" : store_dir;
+}
+
+bool is_storable(const std::string &path)
+{
+    return path.rfind("0/data/", 0) == 0 || path.rfind("0/ops/", 0) == 0;
+}
+
+bool link_from_content_store(const std::string &store_dir, const std::string &sha256, const std::string &dest)
+{
+    return make_link((fs::path(store_dir) / sha256).string(), dest);
+}
+
+bool add_to_content_store(const std::string &store_dir, const std::string &path, const std::string &sha256)
+{
+    const auto actual = sha256_file(path);
+    if (actual != sha256)
+    {
+        SPDLOG_WARN(
+            "Not adding '{}' to the content store: expected a SHA-256 hash of {}, but got {}", path, sha256, actual);
+        return false;
+    }
+
+    fs::create_directories(store_dir);
+
+    // The contents of the file are shared with other neuropods
+    fs::permissions(
+        path, fs::perms::owner_write | fs::perms::group_write | fs::perms::others_write, fs::perm_options::remove);
+
+    return make_link(path, (fs::path(store_dir) / sha256).string());
+}
+
+uint64_t gc_content_store(const std::string &store_dir)
+{
+    uint64_t freed = 0;
+    if (!fs::is_directory(store_dir))
+    {
+        // Nothing was ever added to the store
+        return freed;
+    }
+
+    const time_t now = std::time(nullptr);
+    for (const auto &item : fs::directory_iterator(store_dir))
+    {
+        const auto  path = item.path().string();
+        struct stat st;
+        if (lstat(path.c_str(), &st) != 0)
+        {
+            // Removed by another process
+            continue;
+        }
+
+        if (item.path().filename().string().find(TMP_SUFFIX) != std::string::npos)
+        {
+            // Creating a link updates the ctime
+            if (now - st.st_ctime < ABANDONED_TMP_AGE)
+            {
+                continue;
+            }
+        }
+        else if (st.st_nlink > 1)
+        {
+            // In use
+            continue;
+        }
+
+        if (unlink(path.c_str()) == 0)
+        {
+            SPDLOG_DEBUG("Removed '{}' from the content store", path);
+            freed += static_cast<uint64_t>(st.st_size);
+        }
+    }
+
+    return freed;
+}
+
+} // namespace neuropod
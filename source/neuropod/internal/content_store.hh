@@ -0,0 +1,55 @@
+/* Copyright (c) 2020 UATC, LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+#pragma once
+
+#include <cstdint>
+#include <string>
+
+namespace neuropod
+{
+
+// A content-addressed store of the data files and custom ops of extracted neuropods. This uses the same
+// layout as `neuropod/utils/content_store.py`:
+//
+//     <store_dir>/<sha256>         A file (hard linked into every extracted neuropod that contains it)
+//     <store_dir>/<sha256>.tmp-*   A file that's being added
+//
+// The store is enabled by setting the `NEUROPOD_CONTENT_STORE_DIR` environment variable. When a neuropod is
+// extracted, files in `0/data` and `0/ops` that are already in the store (by the hash in the manifest of the
+// neuropod) are hard linked from it instead of being extracted. Other files in those directories are added
+// to the store once they're extracted. The number of links to a file is its reference count. The store must be on
+// the same filesystem as the directories neuropods are extracted to. Otherwise, neuropods are extracted without it
+// (and a warning is logged).
+
+// Returns the store directory or an empty string if the store is disabled
+std::string get_content_store_dir();
+
+// Whether or not a file in a neuropod is shared through the store
+bool is_storable(const std::string &path);
+
+// If the store has a file with the hash `sha256`, atomically hard link it to `dest`.
+// Returns whether or not the file was linked
+bool link_from_content_store(const std::string &store_dir, const std::string &sha256, const std::string &dest);
+
+// Add a file to the store and make it read-only. Files whose contents don't match `sha256` are not added.
+// Returns whether or not the file was added (files aren't added if the store is on a different filesystem)
+bool add_to_content_store(const std::string &store_dir, const std::string &path, const std::string &sha256);
+
+// Removes files that aren't used by any extracted neuropod (i.e. the only link to them is from the store).
+// Returns the number of bytes freed
+uint64_t gc_content_store(const std::string &store_dir);
+
+} // namespace neuropod
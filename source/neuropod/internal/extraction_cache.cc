@@ -0,0 +1,286 @@
+/* Copyright (c) 2020 UATC, LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+#include "neuropod/internal/extraction_cache.hh"
+
+#include "neuropod/internal/content_store.hh"
+#include "neuropod/internal/error_utils.hh"
+#include "neuropod/internal/hash_utils.hh"
+#include "neuropod/internal/logging.hh"
+
+#include <ghc/filesystem.hpp>
+#include <sys/file.h>
+
+#include <algorithm>
+#include <cerrno>
+#include <cstdlib>
+#include <cstring>
+#include <tuple>
+#include <vector>
+
+#include <fcntl.h>
+#include <unistd.h>
+#include <utime.h>
+
+namespace neuropod
+{
+
+namespace
+{
+
+namespace fs = ghc::filesystem;
+
+constexpr uint64_t DEFAULT_CACHE_MAX_SIZE = 10ULL * 1024 * 1024 * 1024;
+
+constexpr char LOCK_SUFFIX[]     = ".lock";
+constexpr char TMP_SUFFIX[]      = ".tmp-";
+constexpr char EVICT_LOCK_NAME[] = ".evict.lock";
+
+int open_lock_file(const std::string &path)
+{
+    int fd = open(path.c_str(), O_CREAT | O_RDWR | O_CLOEXEC, 0644);
+    if (fd < 0)
+    {
+        NEUROPOD_ERROR("Error opening lock file '{}': {}", path, strerror(errno));
+    }
+
+    return fd;
+}
+
+void lock_file(int fd, int operation)
+{
+    while (flock(fd, operation) != 0)
+    {
+        if (errno != EINTR)
+        {
+            NEUROPOD_ERROR("Error locking extraction cache: {}", strerror(errno));
+        }
+    }
+}
+
+bool ends_with(const std::string &str, const std::string &suffix)
+{
+    return str.size() >= suffix.size() && str.compare(str.size() - suffix.size(), suffix.size(), suffix) == 0;
+}
+
+// Files can be removed by other processes while we scan so missing files are skipped. `ec` is set if `path` itself
+// doesn't exist
+uint64_t dir_size(const fs::path &path, std::error_code &ec)
+{
+    uint64_t total = 0;
+    for (fs::recursive_directory_iterator it(path, ec), end; !ec && it != end; it.increment(ec))
+    {
+        std::error_code size_ec;
+        if (fs::is_regular_file(it->symlink_status(size_ec)))
+        {
+            const auto size = fs::file_size(it->path(), size_ec);
+            if (!size_ec)
+            {
+                total += size;
+            }
+        }
+    }
+
+    if (ec == std::errc::no_such_file_or_directory && fs::exists(path))
+    {
+        // Something inside the directory was removed
+        ec.clear();
+    }
+
+    return total;
+}
+
+std::string make_tempdir(const fs::path &dir, const std::string &prefix)
+{
+    std::string tmpl = (dir / (prefix + "XXXXXX")).string();
+    if (mkdtemp(&tmpl[0]) == nullptr)
+    {
+        NEUROPOD_ERROR("Error creating temporary directory in '{}': {}", dir.string(), strerror(errno));
+    }
+
+    return tmpl;
+}
+
+// Removes an entry (or an abandoned extraction) if no process is using it
+bool try_remove(const fs::path &cache_dir, const std::string &key, const std::string &name)
+{
+    int  fd      = open_lock_file((cache_dir / (key + LOCK_SUFFIX)).string());
+    bool removed = false;
+    if (flock(fd, LOCK_EX | LOCK_NB) == 0)
+    {
+        // Move the entry out of the way before deleting it so other processes never
+        // see a partially deleted entry
+        const auto      trash = fs::path(make_tempdir(cache_dir, ".trash-"));
+        std::error_code ec;
+        fs::rename(cache_dir / name, trash / name, ec);
+
+        // The entry may already be gone
+        removed = !ec;
+        fs::remove_all(trash, ec);
+    }
+
+    close(fd);
+    return removed;
+}
+
+} // namespace
+
+std::string get_extraction_cache_dir()
+{
+    const char *cache_dir = std::getenv("NEUROPOD_CACHE_DIR");
+    return cache_dir == nullptr ? "" : cache_dir;
+}
+
+uint64_t get_extraction_cache_max_size()
+{
+    const char *max_size = std::getenv("NEUROPOD_CACHE_MAX_SIZE_BYTES");
+    return max_size == nullptr ? DEFAULT_CACHE_MAX_SIZE : std::stoull(max_size);
+}
+
+ExtractionCacheEntry::ExtractionCacheEntry(const std::string &                             cache_dir,
+                                           const std::string &                             archive_path,
+                                           const std::function<void(const std::string &)> &extract)
+{
+    fs::create_directories(cache_dir);
+
+    const auto key    = sha256_file(archive_path);
+    const auto target = fs::path(cache_dir) / key;
+    path_             = target.string();
+
+    lock_fd_ = open_lock_file(path_ + LOCK_SUFFIX);
+    lock_file(lock_fd_, LOCK_SH);
+
+    bool created = false;
+    if (!fs::is_directory(target))
+    {
+        // Upgrade to an exclusive lock so only one process extracts this archive
+        lock_file(lock_fd_, LOCK_EX);
+        if (!fs::is_directory(target))
+        {
+            const auto tmpdir = make_tempdir(cache_dir, key + TMP_SUFFIX);
+            try
+            {
+                extract(tmpdir);
+                fs::rename(tmpdir, target);
+            }
+            catch (...)
+            {
+                std::error_code ec;
+                fs::remove_all(tmpdir, ec);
+                close(lock_fd_);
+                throw;
+            }
+
+            SPDLOG_DEBUG("Extracted '{}' into the extraction cache at '{}'", archive_path, path_);
+            created = true;
+        }
+
+        lock_file(lock_fd_, LOCK_SH);
+    }
+
+    // Mark this entry as recently used
+    utime(path_.c_str(), nullptr);
+
+    if (created)
+    {
+        try
+        {
+            evict_extraction_cache(cache_dir, get_extraction_cache_max_size());
+        }
+        catch (...)
+        {
+            close(lock_fd_);
+            throw;
+        }
+    }
+}
+
+ExtractionCacheEntry::~ExtractionCacheEntry()
+{
+    close(lock_fd_);
+}
+
+void evict_extraction_cache(const std::string &cache_dir, uint64_t max_size)
+{
+    int evict_fd = open_lock_file((fs::path(cache_dir) / EVICT_LOCK_NAME).string());
+    try
+    {
+        lock_file(evict_fd, LOCK_EX);
+
+        // (mtime, name, size)
+        std::vector<std::tuple<fs::file_time_type, std::string, uint64_t>> entries;
+        uint64_t                                                           total = 0;
+        for (const auto &item : fs::directory_iterator(cache_dir))
+        {
+            const auto name = item.path().filename().string();
+            if (name.front() == '.' || ends_with(name, LOCK_SUFFIX))
+            {
+                continue;
+            }
+
+            std::error_code ec;
+            const auto      size  = dir_size(item.path(), ec);
+            const auto      mtime = ec ? fs::file_time_type{} : fs::last_write_time(item.path(), ec);
+            if (ec == std::errc::no_such_file_or_directory)
+            {
+                // Renamed or removed by another process (e.g. a finished extraction)
+                continue;
+            }
+
+            if (ec)
+            {
+                NEUROPOD_ERROR(
+                    "Error scanning the extraction cache entry '{}': {}", item.path().string(), ec.message());
+            }
+
+            total += size;
+            entries.emplace_back(mtime, name, size);
+        }
+
+        // Oldest first
+        std::sort(entries.begin(), entries.end());
+        for (const auto &entry : entries)
+        {
+            if (total <= max_size)
+            {
+                break;
+            }
+
+            const auto &name = std::get<1>(entry);
+            const auto  key  = name.substr(0, name.find(TMP_SUFFIX));
+            if (try_remove(cache_dir, key, name))
+            {
+                SPDLOG_DEBUG("Evicted '{}' from the extraction cache", name);
+                total -= std::get<2>(entry);
+            }
+        }
+    }
+    catch (...)
+    {
+        close(evict_fd);
+        throw;
+    }
+
+    close(evict_fd);
+
+    const auto store_dir = get_content_store_dir();
+    if (!store_dir.empty())
+    {
+        // Remove the files that were only used by the evicted entries
+        gc_content_store(store_dir);
+    }
+}
+
+} // namespace neuropod
@@ -0,0 +1,71 @@
+/* Copyright (c) 2020 UATC, LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+#pragma once
+
+#include <cstdint>
+#include <functional>
+#include <string>
+
+namespace neuropod
+{
+
+// A persistent on-disk cache of extracted neuropods that is shared across processes.
+// This uses the same layout and locking protocol as `neuropod/utils/extraction_cache.py`:
+//
+//     <cache_dir>/<sha256 of archive>         An extracted neuropod
+//     <cache_dir>/<sha256 of archive>.lock    Held with a shared lock while the extracted neuropod is in use
+//                                             and with an exclusive lock while it's being created or evicted
+//     <cache_dir>/<sha256 of archive>.tmp-*   An extraction in progress
+//     <cache_dir>/.evict.lock                 Held while evicting entries
+//
+// The cache is enabled by setting the `NEUROPOD_CACHE_DIR` environment variable. Once the total size of
+// the cache exceeds `NEUROPOD_CACHE_MAX_SIZE_BYTES` (default 10 GiB), the least recently used entries that
+// are not in use are evicted.
+
+// Returns the cache directory or an empty string if the cache is disabled
+std::string get_extraction_cache_dir();
+
+// Returns the maximum size of the cache in bytes
+uint64_t get_extraction_cache_max_size();
+
+// An entry in the cache. This holds a shared lock on the entry so it's not evicted while in use
+class ExtractionCacheEntry
+{
+private:
+    int         lock_fd_;
+    std::string path_;
+
+public:
+    // Get the cache entry for `archive_path`. If it doesn't exist, `extract` is called with a temporary
+    // directory to extract the archive into. The directory is then atomically moved into place
+    ExtractionCacheEntry(const std::string &                             cache_dir,
+                         const std::string &                             archive_path,
+                         const std::function<void(const std::string &)> &extract);
+
+    ~ExtractionCacheEntry();
+
+    ExtractionCacheEntry(const ExtractionCacheEntry &) = delete;
+    ExtractionCacheEntry &operator=(const ExtractionCacheEntry &) = delete;
+
+    // The path of the extracted archive
+    const std::string &get_path() const { return path_; }
+};
+
+// Evicts the least recently used entries that aren't in use until the size of the cache is at most
+// `max_size` bytes
+void evict_extraction_cache(const std::string &cache_dir, uint64_t max_size);
+
+} // namespace neuropod
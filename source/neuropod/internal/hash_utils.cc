@@ -0,0 +1,53 @@
+/* Copyright (c) 2020 UATC, LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+#include "neuropod/internal/hash_utils.hh"
+
+#include "neuropod/internal/error_utils.hh"
+
+#include <fstream>
+#include <vector>
+
+#include <picosha2.h>
+
+namespace neuropod
+{
+
+std::string sha256_stream(std::istream &stream)
+{
+    picosha2::hash256_one_by_one hasher;
+    std::vector<char>            buffer(128 * 1024);
+    while (stream)
+    {
+        stream.read(buffer.data(), static_cast<std::streamsize>(buffer.size()));
+        hasher.process(buffer.begin(), buffer.begin() + stream.gcount());
+    }
+
+    hasher.finish();
+    return picosha2::get_hash_hex_string(hasher);
+}
+
+std::string sha256_file(const std::string &path)
+{
+    std::ifstream file(path, std::ios::binary);
+    if (!file)
+    {
+        NEUROPOD_ERROR("Error opening file '{}' to hash", path);
+    }
+
+    return sha256_stream(file);
+}
+
+} // namespace neuropod
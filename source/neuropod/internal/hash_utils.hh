@@ -0,0 +1,30 @@
+/* Copyright (c) 2020 UATC, LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+#pragma once
+
+#include <istream>
+#include <string>
+
+namespace neuropod
+{
+
+// Get the hex encoded SHA256 of the remaining contents of a stream
+std::string sha256_stream(std::istream &stream);
+
+// Get the hex encoded SHA256 of a file
+std::string sha256_file(const std::string &path);
+
+} // namespace neuropod
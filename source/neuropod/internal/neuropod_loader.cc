@@ -15,17 +15,32 @@ limitations under the License.
 
 #include "neuropod/internal/neuropod_loader.hh"
 
+#include "neuropod/internal/content_store.hh"
 #include "neuropod/internal/error_utils.hh"
+#include "neuropod/internal/extraction_cache.hh"
+#include "neuropod/internal/hash_utils.hh"
 #include "neuropod/internal/memory_utils.hh"
 
 #include <ghc/filesystem.hpp>
+#include <json/json.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 
+#include <algorithm>
+#include <cerrno>
+#include <cstring>
+#include <exception>
 #include <fstream>
-#include <iterator>
-#include <sstream>
+#include <mutex>
+#include <thread>
+#include <unordered_map>
+#include <unordered_set>
+#include <vector>
 
-#include <picosha2.h>
-#include <unzipper.h>
+#include <fcntl.h>
+#include <fnmatch.h>
+#include <unistd.h>
+#include <unzip.h>
 
 namespace neuropod
 {
@@ -35,6 +50,14 @@ namespace
 
 namespace fs = ghc::filesystem;
 
+// Whether or not a relative path in a neuropod matches any of `patterns`
+bool matches_any(const std::string &path, const std::vector<std::string> &patterns)
+{
+    return std::any_of(patterns.begin(), patterns.end(), [&path](const std::string &pattern) {
+        return fnmatch(pattern.c_str(), path.c_str(), FNM_PATHNAME) == 0;
+    });
+}
+
 // Load a neuropod from a local directory on disk
 class LocalLoader : public NeuropodLoader
 {
@@ -64,27 +87,772 @@ public:
         return fs::absolute(neuropod_path_) / path;
     }
 
+    bool has_file(const std::string &path) { return fs::is_regular_file(get_file_path(path)); }
+
     std::string ensure_local() { return neuropod_path_; }
+
+    std::vector<PrefetchRange> get_prefetch_ranges(const std::vector<std::string> &patterns)
+    {
+        std::vector<PrefetchRange> out;
+        for (const auto &item : fs::recursive_directory_iterator(neuropod_path_))
+        {
+            const auto relpath = fs::relative(item.path(), neuropod_path_).generic_string();
+            if (item.is_regular_file() && matches_any(relpath, patterns))
+            {
+                out.push_back({item.path().string(), 0, item.file_size()});
+            }
+        }
+
+        return out;
+    }
+};
+
+// The maximum number of threads used to extract an archive
+constexpr size_t MAX_EXTRACT_THREADS = 8;
+
+// The size of the buffer used when inflating entries
+constexpr size_t INFLATE_BUFFER_SIZE = 1024 * 1024;
+
+// An entry in a zip archive
+struct ZipEntry
+{
+    std::string    name;
+    unz64_file_pos pos;
+    uint64_t       uncompressed_size;
+    uint64_t       compressed_size;
+    int            compression_method;
+};
+
+// A zip archive on disk or in memory
+struct ZipSource
+{
+    // The path to the archive (or the path it was registered with if it's in memory)
+    std::string path;
+
+    // The contents of the archive if it's in memory. Otherwise, nullptr
+    std::shared_ptr<const std::string> buffer;
 };
 
+// The read position of a minizip handle to an archive in memory
+struct MemoryFile
+{
+    const std::string *data;
+    uint64_t           pos;
+};
+
+// minizip IO functions for archives in memory. `opaque` is the buffer containing the archive
+voidpf ZCALLBACK memory_open(voidpf opaque, const void * /*unused*/, int /*unused*/)
+{
+    return new MemoryFile{static_cast<const std::string *>(opaque), 0};
+}
+
+uLong ZCALLBACK memory_read(voidpf /*unused*/, voidpf stream, void *buf, uLong size)
+{
+    auto       file      = static_cast<MemoryFile *>(stream);
+    const auto available = file->pos < file->data->size() ? file->data->size() - file->pos : 0;
+    const auto num_read  = std::min<uint64_t>(size, available);
+    std::memcpy(buf, file->data->data() + file->pos, num_read);
+    file->pos += num_read;
+    return static_cast<uLong>(num_read);
+}
+
+uLong ZCALLBACK memory_write(voidpf /*unused*/, voidpf /*unused*/, const void * /*unused*/, uLong /*unused*/)
+{
+    // Archives in memory are read-only
+    return 0;
+}
+
+ZPOS64_T ZCALLBACK memory_tell(voidpf /*unused*/, voidpf stream)
+{
+    return static_cast<MemoryFile *>(stream)->pos;
+}
+
+long ZCALLBACK memory_seek(voidpf /*unused*/, voidpf stream, ZPOS64_T offset, int origin)
+{
+    auto     file = static_cast<MemoryFile *>(stream);
+    uint64_t base = 0;
+    if (origin == ZLIB_FILEFUNC_SEEK_CUR)
+    {
+        base = file->pos;
+    }
+    else if (origin == ZLIB_FILEFUNC_SEEK_END)
+    {
+        base = file->data->size();
+    }
+
+    file->pos = base + offset;
+    return 0;
+}
+
+int ZCALLBACK memory_close(voidpf /*unused*/, voidpf stream)
+{
+    delete static_cast<MemoryFile *>(stream);
+    return 0;
+}
+
+int ZCALLBACK memory_error(voidpf /*unused*/, voidpf /*unused*/)
+{
+    return 0;
+}
+
+unzFile open_archive(const ZipSource &source)
+{
+    if (!source.buffer)
+    {
+        return unzOpen64(source.path.c_str());
+    }
+
+    zlib_filefunc64_def funcs{};
+    funcs.zopen64_file = memory_open;
+    funcs.zread_file   = memory_read;
+    funcs.zwrite_file  = memory_write;
+    funcs.ztell64_file = memory_tell;
+    funcs.zseek64_file = memory_seek;
+    funcs.zclose_file  = memory_close;
+    funcs.zerror_file  = memory_error;
+    funcs.opaque       = const_cast<std::string *>(source.buffer.get());
+    return unzOpen2_64(source.path.c_str(), &funcs);
+}
+
+// Owns a minizip handle to an archive. Handles are not threadsafe so each thread
+// (and each stream) uses its own
+class UnzFile
+{
+private:
+    unzFile     handle_;
+    std::string path_;
+
+    // Keeps the archive alive if it's in memory
+    std::shared_ptr<const std::string> buffer_;
+
+public:
+    explicit UnzFile(const ZipSource &source)
+        : handle_(open_archive(source)), path_(source.path), buffer_(source.buffer)
+    {
+        if (handle_ == nullptr)
+        {
+            NEUROPOD_ERROR("Error opening zip archive '{}'", path_);
+        }
+    }
+
+    ~UnzFile() { unzClose(handle_); }
+
+    UnzFile(const UnzFile &) = delete;
+    UnzFile &operator=(const UnzFile &) = delete;
+
+    // Get all the entries in the archive
+    std::vector<ZipEntry> list_entries()
+    {
+        std::vector<ZipEntry> out;
+        for (int err = unzGoToFirstFile(handle_); err != UNZ_END_OF_LIST_OF_FILE; err = unzGoToNextFile(handle_))
+        {
+            unz_file_info64 info;
+            if (err != UNZ_OK || unzGetCurrentFileInfo64(handle_, &info, nullptr, 0, nullptr, 0, nullptr, 0) != UNZ_OK)
+            {
+                NEUROPOD_ERROR("Error reading the entries of zip archive '{}'", path_);
+            }
+
+            std::string name(info.size_filename, '\0');
+            ZipEntry    entry;
+            if (unzGetCurrentFileInfo64(handle_, &info, &name[0], name.size(), nullptr, 0, nullptr, 0) != UNZ_OK ||
+                unzGetFilePos64(handle_, &entry.pos) != UNZ_OK)
+            {
+                NEUROPOD_ERROR("Error reading the entries of zip archive '{}'", path_);
+            }
+
+            entry.name               = std::move(name);
+            entry.uncompressed_size  = info.uncompressed_size;
+            entry.compressed_size    = info.compressed_size;
+            entry.compression_method = static_cast<int>(info.compression_method);
+            out.emplace_back(std::move(entry));
+        }
+
+        return out;
+    }
+
+    // Start reading an entry
+    void open_entry(const ZipEntry &entry)
+    {
+        if (unzGoToFilePos64(handle_, &entry.pos) != UNZ_OK || unzOpenCurrentFile(handle_) != UNZ_OK)
+        {
+            NEUROPOD_ERROR("Error opening entry '{}' in zip archive '{}'", entry.name, path_);
+        }
+    }
+
+    // Read up to `size` uncompressed bytes from the current entry. Returns the number of bytes read
+    size_t read(char *buffer, size_t size)
+    {
+        const int num_read = unzReadCurrentFile(handle_, buffer, static_cast<unsigned>(size));
+        if (num_read < 0)
+        {
+            NEUROPOD_ERROR("Error reading from zip archive '{}'. Error code: {}", path_, num_read);
+        }
+
+        return static_cast<size_t>(num_read);
+    }
+
+    // Stop reading the current entry. Returns UNZ_CRCERROR if the entry was read completely and its CRC
+    // doesn't match
+    int close_entry() { return unzCloseCurrentFile(handle_); }
+
+    // Get the offset of the (possibly compressed) data of an entry within the archive
+    uint64_t get_data_offset(const ZipEntry &entry)
+    {
+        open_entry(entry);
+        const auto offset = unzGetCurrentFileZStreamPos64(handle_);
+        close_entry();
+        return offset;
+    }
+};
+
+// A read-only memory mapping of a file
+class MappedFile
+{
+private:
+    void * data_;
+    size_t size_;
+
+public:
+    explicit MappedFile(const std::string &path)
+    {
+        int fd = open(path.c_str(), O_RDONLY | O_CLOEXEC);
+        if (fd < 0)
+        {
+            NEUROPOD_ERROR("Error opening '{}': {}", path, strerror(errno));
+        }
+
+        struct stat st;
+        if (fstat(fd, &st) != 0)
+        {
+            close(fd);
+            NEUROPOD_ERROR("Error getting the size of '{}': {}", path, strerror(errno));
+        }
+
+        size_ = static_cast<size_t>(st.st_size);
+        data_ = mmap(nullptr, size_, PROT_READ, MAP_SHARED, fd, 0);
+        close(fd);
+
+        if (data_ == MAP_FAILED)
+        {
+            NEUROPOD_ERROR("Error memory mapping '{}': {}", path, strerror(errno));
+        }
+    }
+
+    ~MappedFile() { munmap(data_, size_); }
+
+    MappedFile(const MappedFile &) = delete;
+    MappedFile &operator=(const MappedFile &) = delete;
+
+    const char *data() const { return static_cast<const char *>(data_); }
+    size_t      size() const { return size_; }
+};
+
+// A read-only, seekable streambuf over a region of memory
+class MemoryStreamBuf : public std::streambuf
+{
+protected:
+    pos_type seekoff(off_type off, std::ios_base::seekdir dir, std::ios_base::openmode which) override
+    {
+        off_type base = 0;
+        if (dir == std::ios_base::cur)
+        {
+            base = gptr() - eback();
+        }
+        else if (dir == std::ios_base::end)
+        {
+            base = egptr() - eback();
+        }
+
+        return seekpos(pos_type(base + off), which);
+    }
+
+    pos_type seekpos(pos_type pos, std::ios_base::openmode which) override
+    {
+        const off_type target = pos;
+        if (!(which & std::ios_base::in) || target < 0 || target > egptr() - eback())
+        {
+            return pos_type(off_type(-1));
+        }
+
+        setg(eback(), eback() + target, egptr());
+        return pos;
+    }
+
+public:
+    MemoryStreamBuf(const char *data, size_t size)
+    {
+        // The data is never written to
+        auto start = const_cast<char *>(data);
+        setg(start, start, start + size);
+    }
+};
+
+// An istream over a file stored uncompressed in an archive that is memory mapped or in memory
+class MappedIStream : public std::istream
+{
+private:
+    // Keeps the archive alive for the lifetime of the stream
+    std::shared_ptr<const char> archive_;
+    MemoryStreamBuf             buf_;
+
+public:
+    MappedIStream(std::shared_ptr<const char> archive, uint64_t offset, uint64_t size)
+        : std::istream(nullptr), archive_(std::move(archive)), buf_(archive_.get() + offset, size)
+    {
+        rdbuf(&buf_);
+    }
+};
+
+// A read-only streambuf that inflates a zip entry on demand instead of decompressing it into memory up front.
+// Seeking is supported, but seeking backwards requires inflating the entry again from the beginning so
+// consumers that need random access should use a file on disk instead
+class ZipEntryStreamBuf : public std::streambuf
+{
+private:
+    UnzFile           zf_;
+    ZipEntry          entry_;
+    std::vector<char> buffer_;
+
+    // The number of uncompressed bytes read from the entry so far (i.e. the position of `egptr()`)
+    uint64_t read_pos_ = 0;
+
+    // A seek that has not been applied yet. Seeks are applied lazily so that getting the size of
+    // the stream (seek to the end and back) doesn't inflate anything
+    int64_t pending_seek_ = -1;
+
+    uint64_t position() const
+    {
+        return pending_seek_ >= 0 ? static_cast<uint64_t>(pending_seek_) : read_pos_ - (egptr() - gptr());
+    }
+
+    void skip(uint64_t count)
+    {
+        while (count > 0)
+        {
+            const auto num_read = zf_.read(buffer_.data(), std::min<uint64_t>(count, buffer_.size()));
+            if (num_read == 0)
+            {
+                break;
+            }
+
+            read_pos_ += num_read;
+            count -= num_read;
+        }
+    }
+
+protected:
+    int_type underflow() override
+    {
+        if (pending_seek_ >= 0)
+        {
+            const auto target = static_cast<uint64_t>(pending_seek_);
+            pending_seek_     = -1;
+            if (target < read_pos_)
+            {
+                // Start over
+                zf_.close_entry();
+                zf_.open_entry(entry_);
+                read_pos_ = 0;
+            }
+
+            skip(target - read_pos_);
+        }
+
+        const auto num_read = zf_.read(buffer_.data(), buffer_.size());
+        setg(buffer_.data(), buffer_.data(), buffer_.data() + num_read);
+        read_pos_ += num_read;
+        if (num_read == 0)
+        {
+            return traits_type::eof();
+        }
+
+        return traits_type::to_int_type(*gptr());
+    }
+
+    pos_type seekoff(off_type off, std::ios_base::seekdir dir, std::ios_base::openmode which) override
+    {
+        int64_t base = 0;
+        if (dir == std::ios_base::cur)
+        {
+            base = static_cast<int64_t>(position());
+        }
+        else if (dir == std::ios_base::end)
+        {
+            base = static_cast<int64_t>(entry_.uncompressed_size);
+        }
+
+        return seekpos(pos_type(base + off), which);
+    }
+
+    pos_type seekpos(pos_type pos, std::ios_base::openmode which) override
+    {
+        const int64_t target = pos;
+        if (!(which & std::ios_base::in) || target < 0 || static_cast<uint64_t>(target) > entry_.uncompressed_size)
+        {
+            return pos_type(off_type(-1));
+        }
+
+        const int64_t buffer_start = static_cast<int64_t>(read_pos_) - (egptr() - eback());
+        if (pending_seek_ < 0 && target >= buffer_start && target <= static_cast<int64_t>(read_pos_))
+        {
+            // The target is in the current buffer
+            setg(eback(), eback() + (target - buffer_start), egptr());
+        }
+        else
+        {
+            setg(buffer_.data(), buffer_.data(), buffer_.data());
+            pending_seek_ = target;
+        }
+
+        return pos;
+    }
+
+public:
+    ZipEntryStreamBuf(const ZipSource &source, const ZipEntry &entry)
+        : zf_(source), entry_(entry), buffer_(INFLATE_BUFFER_SIZE)
+    {
+        zf_.open_entry(entry_);
+        setg(buffer_.data(), buffer_.data(), buffer_.data());
+    }
+
+    ~ZipEntryStreamBuf() { zf_.close_entry(); }
+};
+
+// An istream that owns its streambuf
+class ZipEntryIStream : public std::istream
+{
+private:
+    ZipEntryStreamBuf buf_;
+
+public:
+    ZipEntryIStream(const ZipSource &source, const ZipEntry &entry) : std::istream(nullptr), buf_(source, entry)
+    {
+        rdbuf(&buf_);
+    }
+};
+
+// Get the path that an entry should be extracted to
+fs::path get_dest_path(const ZipEntry &entry, const fs::path &dest_dir)
+{
+    // Make sure the entry can't write outside of `dest_dir`
+    const fs::path rel(entry.name);
+    if (rel.is_absolute() || std::find(rel.begin(), rel.end(), fs::path("..")) != rel.end())
+    {
+        NEUROPOD_ERROR("Refusing to extract zip entry with unsafe path '{}'", entry.name);
+    }
+
+    return dest_dir / rel;
+}
+
+// Extract a single entry into `dest_dir`
+void extract_entry(UnzFile &zf, const ZipEntry &entry, const fs::path &dest_dir, std::vector<char> &buffer)
+{
+    const auto dest = get_dest_path(entry, dest_dir);
+    if (entry.name.back() == '/')
+    {
+        fs::create_directories(dest);
+        return;
+    }
+
+    fs::create_directories(dest.parent_path());
+
+    std::ofstream out(dest.string(), std::ios::binary | std::ios::trunc);
+    if (!out)
+    {
+        NEUROPOD_ERROR("Error creating file '{}'", dest.string());
+    }
+
+    zf.open_entry(entry);
+    for (auto num_read = zf.read(buffer.data(), buffer.size()); num_read > 0;
+         num_read      = zf.read(buffer.data(), buffer.size()))
+    {
+        out.write(buffer.data(), static_cast<std::streamsize>(num_read));
+    }
+
+    if (zf.close_entry() == UNZ_CRCERROR)
+    {
+        NEUROPOD_ERROR("CRC mismatch while extracting '{}'. The neuropod may be corrupt", entry.name);
+    }
+
+    if (!out)
+    {
+        NEUROPOD_ERROR("Error writing file '{}'", dest.string());
+    }
+}
+
+// Extract entries from an archive into `dest_dir` in parallel. Each thread uses its own handle to the archive
+void extract_entries(const ZipSource &source, const std::vector<const ZipEntry *> &entries, const fs::path &dest_dir)
+{
+    const size_t num_threads = std::max<size_t>(
+        1, std::min({static_cast<size_t>(std::thread::hardware_concurrency()), MAX_EXTRACT_THREADS, entries.size()}));
+
+    // Create the directories up front so threads don't race to create them
+    for (const auto entry : entries)
+    {
+        fs::create_directories(get_dest_path(*entry, dest_dir).parent_path());
+    }
+
+    // Balance the work by assigning the largest remaining entry to the thread with the least work
+    std::vector<const ZipEntry *> sorted(entries);
+    std::sort(sorted.begin(), sorted.end(), [](const ZipEntry *a, const ZipEntry *b) {
+        return a->uncompressed_size > b->uncompressed_size;
+    });
+
+    std::vector<std::vector<const ZipEntry *>> work(num_threads);
+    std::vector<uint64_t>                      work_size(num_threads);
+    for (const auto entry : sorted)
+    {
+        const auto idx = std::min_element(work_size.begin(), work_size.end()) - work_size.begin();
+        work[idx].emplace_back(entry);
+        work_size[idx] += entry->uncompressed_size;
+    }
+
+    std::vector<std::exception_ptr> errors(num_threads);
+    const auto                      run = [&](size_t idx) {
+        try
+        {
+            UnzFile           zf(source);
+            std::vector<char> buffer(INFLATE_BUFFER_SIZE);
+            for (const auto entry : work[idx])
+            {
+                extract_entry(zf, *entry, dest_dir, buffer);
+            }
+        }
+        catch (...)
+        {
+            errors[idx] = std::current_exception();
+        }
+    };
+
+    std::vector<std::thread> threads;
+    for (size_t i = 1; i < num_threads; i++)
+    {
+        threads.emplace_back(run, i);
+    }
+
+    run(0);
+    for (auto &thread : threads)
+    {
+        thread.join();
+    }
+
+    for (const auto &error : errors)
+    {
+        if (error)
+        {
+            std::rethrow_exception(error);
+        }
+    }
+}
+
+// The index of files stored uncompressed so they can be memory mapped (see `mmap_data` in the python packager)
+constexpr char DATA_INDEX_NAME[] = "data_index.json";
+
+// The manifest of file hashes and sizes written at packaging time (see `neuropod/utils/manifest_utils.py`)
+constexpr char MANIFEST_NAME[] = "manifest.json";
+
 // Loads a neuropod from a zipfile
+// Files are only extracted when a path to them is requested. Streams for files inflate
+// the entry as it is read unless the file was stored uncompressed and can be memory mapped
 class ZipLoader : public NeuropodLoader
 {
 private:
-    zipper::Unzipper unzipper_;
+    ZipSource source_;
+
+    // A handle used to extract individual entries
+    UnzFile unzfile_;
 
-    // Whether or not we unzipped the archive
+    // The entries in the archive
+    std::vector<ZipEntry>                   entries_;
+    std::unordered_map<std::string, size_t> entry_index_;
+
+    std::mutex mutex_;
+
+    // Whether or not we unzipped the whole archive
     bool did_unzip_;
 
-    // A temp dir that we unzipped to
+    // A temp dir that we unzipped to (empty if we haven't extracted anything yet)
     std::string tempdir_;
 
+    // The entries we've extracted to `tempdir_`
+    std::unordered_set<std::string> extracted_;
+
+    // The entry in the extraction cache that we're using (if the cache is enabled)
+    std::unique_ptr<ExtractionCacheEntry> cache_entry_;
+
+    // The content store directory (empty if the store is disabled)
+    std::string store_dir_;
+
+    // The contents of the archive (memory mapped or in memory) and the (offset, size) of files that
+    // can be read from it directly
+    std::shared_ptr<const char>                                    archive_data_;
+    uint64_t                                                       archive_size_ = 0;
+    std::unordered_map<std::string, std::pair<uint64_t, uint64_t>> mapped_files_;
+
+    // Load the data index (if any) and map the archive
+    void load_data_index()
+    {
+        if (entry_index_.count(DATA_INDEX_NAME) == 0)
+        {
+            return;
+        }
+
+        ZipEntryIStream         stream(source_, get_entry(DATA_INDEX_NAME));
+        Json::CharReaderBuilder rbuilder;
+        Json::Value             obj;
+        std::string             parse_err;
+        if (!Json::parseFromStream(rbuilder, stream, &obj, &parse_err))
+        {
+            NEUROPOD_ERROR("Error parsing the data index of neuropod '{}': {}", source_.path, parse_err);
+        }
+
+        if (source_.buffer)
+        {
+            archive_data_ = std::shared_ptr<const char>(source_.buffer, source_.buffer->data());
+            archive_size_ = source_.buffer->size();
+        }
+        else
+        {
+            auto mapping  = std::make_shared<MappedFile>(source_.path);
+            archive_data_ = std::shared_ptr<const char>(mapping, mapping->data());
+            archive_size_ = mapping->size();
+        }
+
+        const Json::Value &files = obj["files"];
+        for (const auto &name : files.getMemberNames())
+        {
+            const auto &   entry  = get_entry(name);
+            const uint64_t offset = files[name]["offset"].asUInt64();
+            const uint64_t size   = files[name]["size"].asUInt64();
+
+            // Sanity check the index against the archive
+            if (entry.compression_method != 0 || entry.uncompressed_size != size ||
+                unzfile_.get_data_offset(entry) != offset || offset + size > archive_size_)
+            {
+                NEUROPOD_ERROR("The data index of neuropod '{}' does not match '{}'", source_.path, name);
+            }
+
+            mapped_files_[name] = std::make_pair(offset, size);
+        }
+    }
+
+    std::unique_ptr<std::istream> get_mapped_istream(const std::string &path)
+    {
+        const auto it = mapped_files_.find(path);
+        if (it == mapped_files_.end())
+        {
+            return nullptr;
+        }
+
+        return stdx::make_unique<MappedIStream>(archive_data_, it->second.first, it->second.second);
+    }
+
+    const ZipEntry &get_entry(const std::string &path)
+    {
+        const auto it = entry_index_.find(path);
+        if (it == entry_index_.end())
+        {
+            NEUROPOD_ERROR("No file '{}' in neuropod '{}'", path, source_.path);
+        }
+
+        return entries_[it->second];
+    }
+
+    // Create the tempdir if necessary. Must be called with `mutex_` held
+    const std::string &get_tempdir()
+    {
+        if (tempdir_.empty())
+        {
+            char tempdir[] = "/tmp/neuropod_tmp_XXXXXX";
+            if (mkdtemp(tempdir) == nullptr)
+            {
+                NEUROPOD_ERROR("Error creating temporary directory");
+            }
+
+            tempdir_ = tempdir;
+        }
+
+        return tempdir_;
+    }
+
+    // If the content store is enabled and `entry` is in it, hard link it into `dir` from the store and return true.
+    // Otherwise, `sha256` is set if the entry should be added to the store once it's extracted
+    bool link_from_store(const ZipEntry &entry, const fs::path &dir, std::string &sha256)
+    {
+        sha256.clear();
+        if (store_dir_.empty() || !is_storable(entry.name))
+        {
+            return false;
+        }
+
+        sha256 = get_manifest_hash(entry.name);
+        if (sha256.empty())
+        {
+            return false;
+        }
+
+        const auto dest = get_dest_path(entry, dir);
+        fs::create_directories(dest.parent_path());
+        if (link_from_content_store(store_dir_, sha256, dest.string()))
+        {
+            sha256.clear();
+            return true;
+        }
+
+        return false;
+    }
+
+    // Extract everything that hasn't been extracted yet into `dir`
+    void extract_all(const std::string &dir)
+    {
+        std::vector<const ZipEntry *>                    to_extract;
+        std::vector<std::pair<std::string, std::string>> to_store;
+        for (const auto &entry : entries_)
+        {
+            std::string sha256;
+            if (extracted_.count(entry.name) > 0 || link_from_store(entry, dir, sha256))
+            {
+                continue;
+            }
+
+            to_extract.emplace_back(&entry);
+            if (!sha256.empty())
+            {
+                to_store.emplace_back(get_dest_path(entry, dir).string(), sha256);
+            }
+        }
+
+        extract_entries(source_, to_extract, dir);
+
+        for (const auto &item : to_store)
+        {
+            add_to_content_store(store_dir_, item.first, item.second);
+        }
+    }
+
 public:
-    ZipLoader(const std::string neuropod_path) : unzipper_(neuropod_path), did_unzip_(false) {}
+    ZipLoader(ZipSource source) : source_(std::move(source)), unzfile_(source_), did_unzip_(false)
+    {
+        entries_ = unzfile_.list_entries();
+        for (size_t i = 0; i < entries_.size(); i++)
+        {
+            entry_index_[entries_[i].name] = i;
+        }
+
+        load_data_index();
+
+        store_dir_ = get_content_store_dir();
+        if (!store_dir_.empty())
+        {
+            // Load the manifest now because it's read using `get_istream_for_file` which can't be
+            // called while extracting (with `mutex_` held)
+            get_manifest_hash(MANIFEST_NAME);
+        }
+    }
 
     ~ZipLoader()
     {
-        if (did_unzip_)
+        if (!tempdir_.empty() && !cache_entry_)
         {
             // Delete the folder
             fs::remove_all(tempdir_);
@@ -93,9 +861,33 @@ public:
 
     std::unique_ptr<std::istream> get_istream_for_file(const std::string &path)
     {
-        auto out = stdx::make_unique<std::stringstream>();
-        unzipper_.extractEntryToStream(path, *out);
-        return out;
+        if (auto mapped = get_mapped_istream(path))
+        {
+            // Read directly from the archive
+            return mapped;
+        }
+
+        {
+            std::lock_guard<std::mutex> lock(mutex_);
+            if (did_unzip_ || extracted_.count(path) > 0)
+            {
+                // Read the extracted copy
+                return stdx::make_unique<std::ifstream>(fs::path(tempdir_) / path, std::ios::binary);
+            }
+        }
+
+        return stdx::make_unique<ZipEntryIStream>(source_, get_entry(path));
+    }
+
+    std::unique_ptr<std::istream> get_seekable_istream_for_file(const std::string &path)
+    {
+        if (auto mapped = get_mapped_istream(path))
+        {
+            return mapped;
+        }
+
+        // Seeking an inflating stream is expensive so read from an extracted copy instead
+        return stdx::make_unique<std::ifstream>(get_file_path(path), std::ios::binary);
     }
 
     std::string get_file_path(const std::string &path)
@@ -108,58 +900,186 @@ public:
             NEUROPOD_ERROR("paths passed to get_file_path must be relative");
         }
 
-        if (did_unzip_)
+        if (!source_.buffer && !get_extraction_cache_dir().empty())
         {
-            return fs::absolute(tempdir_) / path;
+            // Cached entries are always fully extracted
+            return fs::absolute(ensure_local()) / path;
         }
-        else
+
+        std::lock_guard<std::mutex> lock(mutex_);
+        const auto                  tempdir = get_tempdir();
+        if (!did_unzip_ && extracted_.count(path) == 0)
         {
-            // TODO(vip): only extract the requested file
-            // This extracts the entire archive
-            ensure_local();
-            return get_file_path(path);
+            // Only extract the requested file
+            const auto &entry = get_entry(path);
+            std::string sha256;
+            if (!link_from_store(entry, tempdir, sha256))
+            {
+                std::vector<char> buffer(INFLATE_BUFFER_SIZE);
+                extract_entry(unzfile_, entry, tempdir, buffer);
+                if (!sha256.empty())
+                {
+                    add_to_content_store(store_dir_, get_dest_path(entry, tempdir).string(), sha256);
+                }
+            }
+
+            extracted_.insert(path);
         }
+
+        return fs::absolute(tempdir) / path;
     }
 
+    bool has_file(const std::string &path) { return entry_index_.count(path) > 0; }
+
     std::string ensure_local()
     {
-        // Create a tempdir
-        char tempdir[] = "/tmp/neuropod_tmp_XXXXXX";
-        if (mkdtemp(tempdir) == nullptr)
+        std::lock_guard<std::mutex> lock(mutex_);
+        if (did_unzip_)
+        {
+            return tempdir_;
+        }
+
+        // Archives in memory aren't cached because the cache is keyed by the hash of the archive on disk
+        const auto cache_dir = source_.buffer ? std::string() : get_extraction_cache_dir();
+        if (!cache_dir.empty())
         {
-            NEUROPOD_ERROR("Error creating temporary directory");
+            // Use the persistent extraction cache shared with other processes
+            cache_entry_ = stdx::make_unique<ExtractionCacheEntry>(
+                cache_dir, source_.path, [this](const std::string &dir) { extract_all(dir); });
+
+            did_unzip_ = true;
+            tempdir_   = cache_entry_->get_path();
+            return tempdir_;
         }
 
-        // Unzip into the tempdir
-        unzipper_.extract(tempdir);
+        // Unzip everything we haven't already extracted into the tempdir
+        extract_all(get_tempdir());
 
         // Update metadata to make sure we cleanup
         did_unzip_ = true;
-        tempdir_   = tempdir;
 
-        return tempdir;
+        return tempdir_;
+    }
+
+    std::vector<PrefetchRange> get_prefetch_ranges(const std::vector<std::string> &patterns)
+    {
+        std::vector<PrefetchRange> out;
+        if (source_.buffer)
+        {
+            // Already in memory
+            return out;
+        }
+
+        std::lock_guard<std::mutex> lock(mutex_);
+        for (const auto &entry : entries_)
+        {
+            if (!matches_any(entry.name, patterns))
+            {
+                continue;
+            }
+
+            if (did_unzip_ || extracted_.count(entry.name) > 0)
+            {
+                // Read the extracted copy
+                const auto path = fs::path(tempdir_) / entry.name;
+                out.push_back({path.string(), 0, fs::file_size(path)});
+            }
+            else
+            {
+                // Read the (possibly compressed) data from the archive
+                out.push_back({source_.path, unzfile_.get_data_offset(entry), entry.compressed_size});
+            }
+        }
+
+        return out;
     }
 };
 
+// The prefix of the paths that neuropods in memory are registered with
+constexpr char MEMORY_PATH_PREFIX[] = "memory://";
+
+// Neuropods in memory by the path they were registered with
+std::mutex                                                          registry_mutex;
+std::unordered_map<std::string, std::shared_ptr<const std::string>> registered_buffers;
+uint64_t                                                            next_buffer_id = 0;
+
+std::shared_ptr<const std::string> get_registered_buffer(const std::string &path)
+{
+    std::lock_guard<std::mutex> lock(registry_mutex);
+    const auto                  it = registered_buffers.find(path);
+    return it == registered_buffers.end() ? nullptr : it->second;
+}
+
 } // namespace
 
 NeuropodLoader::~NeuropodLoader() = default;
 
+std::unique_ptr<std::istream> NeuropodLoader::get_seekable_istream_for_file(const std::string &path)
+{
+    return get_istream_for_file(path);
+}
+
+std::vector<PrefetchRange> NeuropodLoader::get_prefetch_ranges(const std::vector<std::string> & /*unused*/)
+{
+    return {};
+}
+
+std::string NeuropodLoader::get_manifest_hash(const std::string &path)
+{
+    std::call_once(manifest_loaded_, [this]() {
+        if (!has_file(MANIFEST_NAME))
+        {
+            // This neuropod was packaged before manifests were added
+            return;
+        }
+
+        auto                    stream = get_istream_for_file(MANIFEST_NAME);
+        Json::CharReaderBuilder rbuilder;
+        Json::Value             obj;
+        std::string             parse_err;
+        if (!Json::parseFromStream(rbuilder, *stream, &obj, &parse_err))
+        {
+            NEUROPOD_ERROR("Error parsing the manifest of the neuropod: {}", parse_err);
+        }
+
+        const Json::Value &files = obj["files"];
+        for (const auto &name : files.getMemberNames())
+        {
+            manifest_hashes_[name] = files[name]["sha256"].asString();
+        }
+    });
+
+    const auto it = manifest_hashes_.find(path);
+    return it == manifest_hashes_.end() ? "" : it->second;
+}
+
 // Get the SHA256 of a file
 std::string NeuropodLoader::get_hash_for_file(const std::string &path)
 {
-    auto                       stream = get_istream_for_file(path);
-    std::vector<unsigned char> hash(picosha2::k_digest_size);
-    picosha2::hash256(
-        std::istreambuf_iterator<char>(*stream), std::istreambuf_iterator<char>(), hash.begin(), hash.end());
+    auto hash = get_manifest_hash(path);
+    if (hash.empty())
+    {
+        hash = sha256_stream(*get_istream_for_file(path));
+    }
 
-    return picosha2::bytes_to_hex_string(hash.begin(), hash.end());
+    return hash;
 }
 
 // Get a loader given a path to a file or directory.
 // If this is a file, it is assumed to be a zipfile containing a neuropod
 std::unique_ptr<NeuropodLoader> get_loader(const std::string &neuropod_path)
 {
+    if (neuropod_path.compare(0, sizeof(MEMORY_PATH_PREFIX) - 1, MEMORY_PATH_PREFIX) == 0)
+    {
+        auto buffer = get_registered_buffer(neuropod_path);
+        if (!buffer)
+        {
+            NEUROPOD_ERROR("Error loading Neuropod. No neuropod in memory is registered as '{}'", neuropod_path);
+        }
+
+        return stdx::make_unique<ZipLoader>(ZipSource{neuropod_path, std::move(buffer)});
+    }
+
     if (!fs::exists(neuropod_path))
     {
         NEUROPOD_ERROR("Error loading Neuropod. No file or directory at '{}'", neuropod_path);
@@ -171,8 +1091,27 @@ std::unique_ptr<NeuropodLoader> get_loader(const std::string &neuropod_path)
     }
     else
     {
-        return stdx::make_unique<ZipLoader>(neuropod_path);
+        return stdx::make_unique<ZipLoader>(ZipSource{neuropod_path, nullptr});
     }
 }
 
+std::unique_ptr<NeuropodLoader> get_loader_from_buffer(std::shared_ptr<const std::string> data)
+{
+    return stdx::make_unique<ZipLoader>(ZipSource{MEMORY_PATH_PREFIX, std::move(data)});
+}
+
+std::string register_neuropod_buffer(std::shared_ptr<const std::string> data)
+{
+    std::lock_guard<std::mutex> lock(registry_mutex);
+    auto                        path = MEMORY_PATH_PREFIX + std::to_string(next_buffer_id++);
+    registered_buffers[path]         = std::move(data);
+    return path;
+}
+
+void unregister_neuropod_buffer(const std::string &path)
+{
+    std::lock_guard<std::mutex> lock(registry_mutex);
+    registered_buffers.erase(path);
+}
+
 } // namespace neuropod
@@ -15,9 +15,13 @@ limitations under the License.
 
 #pragma once
 
+#include "neuropod/internal/prefetch.hh"
+
 #include <iostream>
 #include <memory>
+#include <mutex>
 #include <string>
+#include <unordered_map>
 
 namespace neuropod
 {
@@ -30,22 +34,58 @@ public:
     // Get an istream given a relative path in the loaded neuropod
     virtual std::unique_ptr<std::istream> get_istream_for_file(const std::string &path) = 0;
 
+    // Get an istream that supports efficient seeking (e.g. for files that are read with random access)
+    // By default, this is the same as `get_istream_for_file`
+    virtual std::unique_ptr<std::istream> get_seekable_istream_for_file(const std::string &path);
+
     // Gets a path to a file within a neuropod
     // If this is a zipped neuropod, this will extract that file to a temp
     // dir and return the path. Otherwise it'll just return the full path to that
     // file
     virtual std::string get_file_path(const std::string &path) = 0;
 
+    // Whether or not a file exists given a relative path in the loaded neuropod
+    virtual bool has_file(const std::string &path) = 0;
+
     // Get the SHA256 of a file
+    // This uses the hash stored in the manifest of the neuropod (if any) instead of reading the file
     std::string get_hash_for_file(const std::string &path);
 
     // If this is a zipped neuropod, extract to a temp dir and return the extracted path
     // Otherwise, return the neuropod_path
     virtual std::string ensure_local() = 0;
+
+    // Get the regions of files on disk that contain the files matching `patterns` (relative paths that can
+    // contain wildcards). For zipped neuropods, these are the regions of the archive that contain the files
+    // (unless they were already extracted). See `prefetch.hh`
+    virtual std::vector<PrefetchRange> get_prefetch_ranges(const std::vector<std::string> &patterns);
+
+protected:
+    // Get the SHA256 of a file from the manifest of the neuropod or an empty string if it's not in the manifest.
+    // The manifest is loaded (using `get_istream_for_file`) the first time this is called
+    std::string get_manifest_hash(const std::string &path);
+
+private:
+    // The hashes from the manifest of the neuropod
+    std::once_flag                               manifest_loaded_;
+    std::unordered_map<std::string, std::string> manifest_hashes_;
 };
 
 // Get a loader given a path to a file or directory.
 // If this is a file, it is assumed to be a zipfile containing a neuropod
+// Paths returned by `register_neuropod_buffer` load the registered neuropod from memory
 std::unique_ptr<NeuropodLoader> get_loader(const std::string &neuropod_path);
 
+// Get a loader for a zipped neuropod in memory. Files are read directly from `data` and are only
+// extracted to a temp dir when a path to them is requested (e.g. custom ops)
+std::unique_ptr<NeuropodLoader> get_loader_from_buffer(std::shared_ptr<const std::string> data);
+
+// Register a zipped neuropod in memory and return a path that can be passed to `get_loader` (and
+// therefore to backends) in place of a path on disk. The path is only valid in the current process
+std::string register_neuropod_buffer(std::shared_ptr<const std::string> data);
+
+// Remove a neuropod registered with `register_neuropod_buffer`. Loaders that were already created
+// for it keep the buffer alive
+void unregister_neuropod_buffer(const std::string &path);
+
 } // namespace neuropod
@@ -0,0 +1,198 @@
+/* Copyright (c) 2020 UATC, LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+#include "neuropod/internal/prefetch.hh"
+
+#include "neuropod/internal/logging.hh"
+
+#include <algorithm>
+#include <cerrno>
+#include <chrono>
+#include <cstdlib>
+#include <cstring>
+#include <mutex>
+#include <thread>
+
+#include <fcntl.h>
+#include <unistd.h>
+
+namespace neuropod
+{
+
+namespace
+{
+
+// Files are split into chunks of this size that are read in parallel
+constexpr uint64_t PREFETCH_CHUNK_SIZE = 16 * 1024 * 1024;
+
+constexpr size_t READ_SIZE = 1024 * 1024;
+
+// Reads a region of a file (discarding the data). Returns the number of bytes read
+uint64_t read_range(const PrefetchRange &range, std::vector<char> &buffer)
+{
+    int fd = open(range.path.c_str(), O_RDONLY | O_CLOEXEC);
+    if (fd < 0)
+    {
+        // Prefetching is best effort
+        SPDLOG_WARN("Error prefetching '{}': {}", range.path, strerror(errno));
+        return 0;
+    }
+
+    // Start reading the whole region asynchronously
+    posix_fadvise(fd, static_cast<off_t>(range.offset), static_cast<off_t>(range.size), POSIX_FADV_WILLNEED);
+
+    uint64_t total = 0;
+    while (total < range.size)
+    {
+        const auto num_read = pread(fd,
+                                    buffer.data(),
+                                    std::min<uint64_t>(buffer.size(), range.size - total),
+                                    static_cast<off_t>(range.offset + total));
+        if (num_read <= 0)
+        {
+            break;
+        }
+
+        total += static_cast<uint64_t>(num_read);
+    }
+
+    close(fd);
+    return total;
+}
+
+} // namespace
+
+struct Prefetcher::State
+{
+    std::mutex mutex;
+
+    // The chunks to read and the index of the next one
+    std::vector<PrefetchRange> chunks;
+    size_t                     next_chunk = 0;
+
+    // The number of threads that are still reading
+    size_t num_running = 0;
+
+    uint64_t                              bytes_read  = 0;
+    uint64_t                              bytes_total = 0;
+    std::chrono::steady_clock::time_point start_time;
+};
+
+size_t get_prefetch_threads()
+{
+    const char *num_threads = std::getenv("NEUROPOD_PREFETCH_THREADS");
+    return num_threads == nullptr ? 0 : std::strtoull(num_threads, nullptr, 10);
+}
+
+const std::vector<std::string> &get_prefetch_patterns()
+{
+    static const std::vector<std::string> patterns = {
+        // TorchScript
+        "0/data/model.pt",
+        // TensorFlow and ONNX
+        "0/data/model.pb",
+        // Caffe2
+        "0/data/init_net.pb",
+        // Caffe
+        "0/data/model.caffemodel",
+        // MXNet
+        "0/data/*.params",
+    };
+
+    return patterns;
+}
+
+Prefetcher::Prefetcher(const std::vector<PrefetchRange> &ranges, size_t num_threads) : state_(std::make_shared<State>())
+{
+    for (const auto &range : ranges)
+    {
+        for (uint64_t offset = 0; offset < range.size; offset += PREFETCH_CHUNK_SIZE)
+        {
+            state_->chunks.push_back(
+                {range.path, range.offset + offset, std::min(PREFETCH_CHUNK_SIZE, range.size - offset)});
+        }
+
+        state_->bytes_total += range.size;
+    }
+
+    state_->start_time  = std::chrono::steady_clock::now();
+    state_->num_running = std::max<size_t>(1, std::min(num_threads, state_->chunks.size()));
+    for (size_t i = 0; i < state_->num_running; i++)
+    {
+        // The threads keep `state` alive
+        std::thread([state = state_]() {
+            std::vector<char> buffer(READ_SIZE);
+            while (true)
+            {
+                PrefetchRange chunk;
+                {
+                    std::lock_guard<std::mutex> lock(state->mutex);
+                    if (state->next_chunk >= state->chunks.size())
+                    {
+                        state->num_running--;
+                        return;
+                    }
+
+                    chunk = state->chunks[state->next_chunk++];
+                }
+
+                const auto num_read = read_range(chunk, buffer);
+
+                std::lock_guard<std::mutex> lock(state->mutex);
+                state->bytes_read += num_read;
+            }
+        }).detach();
+    }
+}
+
+Prefetcher::~Prefetcher()
+{
+    cancel();
+}
+
+uint64_t Prefetcher::get_bytes_read() const
+{
+    std::lock_guard<std::mutex> lock(state_->mutex);
+    return state_->bytes_read;
+}
+
+bool Prefetcher::is_done() const
+{
+    std::lock_guard<std::mutex> lock(state_->mutex);
+    return state_->num_running == 0;
+}
+
+void Prefetcher::cancel()
+{
+    std::lock_guard<std::mutex> lock(state_->mutex);
+    state_->next_chunk = state_->chunks.size();
+}
+
+uint64_t Prefetcher::finish()
+{
+    cancel();
+
+    const auto load_time = std::chrono::duration<double>(std::chrono::steady_clock::now() - state_->start_time).count();
+
+    std::lock_guard<std::mutex> lock(state_->mutex);
+    SPDLOG_INFO("Prefetched {} of {} bytes while loading the model ({:.3f}s)",
+                state_->bytes_read,
+                state_->bytes_total,
+                load_time);
+
+    return state_->bytes_read;
+}
+
+} // namespace neuropod
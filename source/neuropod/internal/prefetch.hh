@@ -0,0 +1,82 @@
+/* Copyright (c) 2020 UATC, LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <memory>
+#include <string>
+#include <vector>
+
+namespace neuropod
+{
+
+// Prefetching the files of a neuropod into the page cache while it loads.
+// This matches `neuropod/utils/prefetch_utils.py`:
+//
+// On a host where a neuropod isn't in the page cache yet, loading is dominated by page faults while the
+// framework deserializes the weights. The files that backends load (see `get_prefetch_patterns`) are read
+// sequentially in background threads while the backend initializes so they're (at least partly) in memory
+// by the time they're deserialized.
+//
+// Prefetching is enabled by setting the `NEUROPOD_PREFETCH_THREADS` environment variable to the number of
+// threads to read with.
+
+// Returns the number of threads to prefetch with (0 if prefetching is disabled)
+size_t get_prefetch_threads();
+
+// The files that backends load (relative to the root of a neuropod). These can contain wildcards
+const std::vector<std::string> &get_prefetch_patterns();
+
+// A region of a file on disk to prefetch
+struct PrefetchRange
+{
+    std::string path;
+    uint64_t    offset;
+    uint64_t    size;
+};
+
+// Reads regions of files in background threads. This never blocks: the threads are detached and
+// `finish` (or the destructor) stops them after the chunks they're already reading
+class Prefetcher
+{
+private:
+    struct State;
+    std::shared_ptr<State> state_;
+
+public:
+    Prefetcher(const std::vector<PrefetchRange> &ranges, size_t num_threads);
+    ~Prefetcher();
+
+    Prefetcher(const Prefetcher &) = delete;
+    Prefetcher &operator=(const Prefetcher &) = delete;
+
+    // The number of bytes read so far
+    uint64_t get_bytes_read() const;
+
+    // Whether or not all the regions have been read
+    bool is_done() const;
+
+    // Stops handing out chunks to the threads. Chunks that are already being read are finished
+    void cancel();
+
+    // Call once the model is loaded. Cancels the rest of the prefetch and returns the number of bytes that
+    // were read by the time loading finished. Reading these while deserializing would have been slower if
+    // they weren't in the page cache already
+    uint64_t finish();
+};
+
+} // namespace neuropod
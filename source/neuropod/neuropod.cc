@@ -19,12 +19,113 @@ limitations under the License.
 #include "neuropod/internal/backend_registration.hh"
 #include "neuropod/internal/config_utils.hh"
 #include "neuropod/internal/error_utils.hh"
+#include "neuropod/internal/logging.hh"
+#include "neuropod/internal/memory_utils.hh"
+#include "neuropod/internal/neuropod_loader.hh"
 #include "neuropod/internal/neuropod_tensor.hh"
 #include "neuropod/multiprocess/multiprocess.hh"
 
+#include <algorithm>
+#include <chrono>
+#include <mutex>
+#include <thread>
+
 namespace neuropod
 {
 
+namespace
+{
+
+// Shared by the threads started by `load_neuropods`
+struct ParallelLoadState
+{
+    std::mutex mutex;
+
+    std::vector<std::string>     neuropod_paths;
+    std::vector<BackendLoadSpec> default_backend_overrides;
+    RuntimeOptions               options;
+
+    // Whether to load the models once the backends are initialized
+    bool load_models;
+
+    // One for each neuropod and the index of the next one to load
+    std::vector<std::promise<std::unique_ptr<Neuropod>>> promises;
+    size_t                                               next = 0;
+
+    // The number of neuropods that haven't finished loading
+    size_t remaining;
+
+    // The time spent in each stage (summed across neuropods)
+    double create_seconds = 0;
+    double load_seconds   = 0;
+
+    std::chrono::steady_clock::time_point start_time;
+};
+
+void log_load_stages(const ParallelLoadState &state)
+{
+    const auto total_time = std::chrono::duration<double>(std::chrono::steady_clock::now() - state.start_time).count();
+    SPDLOG_INFO("Loaded {} neuropods in {:.3f}s. Time spent in each stage (summed across neuropods): "
+                "create {:.3f}s, load {:.3f}s. The {} stage dominated",
+                state.neuropod_paths.size(),
+                total_time,
+                state.create_seconds,
+                state.load_seconds,
+                state.create_seconds >= state.load_seconds ? "create" : "load");
+}
+
+// Loads neuropods until there are none left
+void parallel_load_worker(const std::shared_ptr<ParallelLoadState> &state)
+{
+    while (true)
+    {
+        size_t index;
+        {
+            std::lock_guard<std::mutex> lock(state->mutex);
+            if (state->next >= state->neuropod_paths.size())
+            {
+                return;
+            }
+
+            index = state->next++;
+        }
+
+        // Backends are created without loading the model so the two stages can be timed separately
+        double create_seconds = 0;
+        double load_seconds   = 0;
+        try
+        {
+            const auto start    = std::chrono::steady_clock::now();
+            auto       neuropod = stdx::make_unique<Neuropod>(
+                state->neuropod_paths[index], state->default_backend_overrides, state->options);
+            const auto created = std::chrono::steady_clock::now();
+            create_seconds     = std::chrono::duration<double>(created - start).count();
+
+            if (state->load_models)
+            {
+                neuropod->load_model();
+                load_seconds = std::chrono::duration<double>(std::chrono::steady_clock::now() - created).count();
+            }
+
+            state->promises[index].set_value(std::move(neuropod));
+        }
+        catch (...)
+        {
+            state->promises[index].set_exception(std::current_exception());
+        }
+
+        std::lock_guard<std::mutex> lock(state->mutex);
+        state->create_seconds += create_seconds;
+        state->load_seconds += load_seconds;
+        if (--state->remaining == 0)
+        {
+            log_load_stages(*state);
+        }
+    }
+}
+
+} // namespace
+
 Neuropod::Neuropod(const std::string &neuropod_path, const RuntimeOptions &options)
     : Neuropod(neuropod_path, {}, options)
 {
@@ -50,10 +151,37 @@ Neuropod::Neuropod(const std::string &                 neuropod_path,
     }
 }
 
+Neuropod::Neuropod(std::shared_ptr<const std::string> data, const RuntimeOptions &options)
+{
+    if (options.use_ope)
+    {
+        NEUROPOD_ERROR("Neuropods in memory can't be loaded with OPE. Write the neuropod to disk first");
+    }
+
+    buffer_path_ = register_neuropod_buffer(std::move(data));
+    try
+    {
+        const auto model_config = load_model_config(buffer_path_);
+        const auto factory = get_backend_for_type({}, model_config->platform, model_config->platform_version_semver);
+        backend_           = factory(buffer_path_, options);
+    }
+    catch (...)
+    {
+        unregister_neuropod_buffer(buffer_path_);
+        throw;
+    }
+}
+
 // Load the model config and use the backend that was provided by the user
 Neuropod::Neuropod(const std::string &neuropod_path, std::shared_ptr<NeuropodBackend> backend) : backend_(backend) {}
 
-Neuropod::~Neuropod() = default;
+Neuropod::~Neuropod()
+{
+    if (!buffer_path_.empty())
+    {
+        unregister_neuropod_buffer(buffer_path_);
+    }
+}
 
 void Neuropod::load_model()
 {
@@ -107,6 +235,51 @@ std::shared_ptr<TypedNeuropodTensor<T>> Neuropod::tensor_from_memory(const std::
     return get_tensor_allocator()->tensor_from_memory(input_dims, data, deleter);
 }
 
+std::vector<std::future<std::unique_ptr<Neuropod>>> load_neuropods(const std::vector<std::string> &neuropod_paths,
+                                                                   const RuntimeOptions &          options,
+                                                                   size_t                          max_concurrency)
+{
+    return load_neuropods(neuropod_paths, {}, options, max_concurrency);
+}
+
+std::vector<std::future<std::unique_ptr<Neuropod>>> load_neuropods(
+    const std::vector<std::string> &    neuropod_paths,
+    const std::vector<BackendLoadSpec> &default_backend_overrides,
+    const RuntimeOptions &              options,
+    size_t                              max_concurrency)
+{
+    auto state                                = std::make_shared<ParallelLoadState>();
+    state->neuropod_paths                     = neuropod_paths;
+    state->default_backend_overrides          = default_backend_overrides;
+    state->options                            = options;
+    state->load_models                        = options.load_model_at_construction;
+    state->options.load_model_at_construction = false;
+    state->promises.resize(neuropod_paths.size());
+    state->remaining  = neuropod_paths.size();
+    state->start_time = std::chrono::steady_clock::now();
+
+    std::vector<std::future<std::unique_ptr<Neuropod>>> futures;
+    futures.reserve(neuropod_paths.size());
+    for (auto &promise : state->promises)
+    {
+        futures.emplace_back(promise.get_future());
+    }
+
+    if (max_concurrency == 0)
+    {
+        max_concurrency = std::max<size_t>(1, std::thread::hardware_concurrency());
+    }
+
+    const auto num_threads = std::min(max_concurrency, neuropod_paths.size());
+    for (size_t i = 0; i < num_threads; i++)
+    {
+        // The threads keep `state` alive
+        std::thread(parallel_load_worker, state).detach();
+    }
+
+    return futures;
+}
+
 // Instantiate the templates
 #define INIT_TEMPLATES_FOR_TYPE(CPP_TYPE, NEUROPOD_TYPE)                                  \
     template std::shared_ptr<TypedNeuropodTensor<CPP_TYPE>> Neuropod::tensor_from_memory( \
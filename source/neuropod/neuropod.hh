@@ -20,6 +20,7 @@ limitations under the License.
 #include "neuropod/options.hh"
 #include "neuropod/version.hh"
 
+#include <future>
 #include <memory>
 #include <string>
 #include <unordered_map>
@@ -34,6 +35,9 @@ private:
     // The backend used to load and run the neuropod
     std::shared_ptr<NeuropodBackend> backend_;
 
+    // If this neuropod was loaded from memory, the path it was registered with (see `register_neuropod_buffer`)
+    std::string buffer_path_;
+
 public:
     // Load a neuropod.
     Neuropod(const std::string &neuropod_path, const RuntimeOptions &options = {});
@@ -48,6 +52,11 @@ public:
              const std::vector<BackendLoadSpec> &default_backend_overrides,
              const RuntimeOptions &              options = {});
 
+    // Load a zipped neuropod from memory.
+    // Files are read directly from `data` and are only extracted to disk when the backend needs a path
+    // to them (e.g. custom ops). This is not supported with OPE
+    Neuropod(std::shared_ptr<const std::string> data, const RuntimeOptions &options = {});
+
     // Allows an already-initialized backend to be passed in. This enables backends that need
     // non-standard arguments. For example, this can be used to build a proxy that runs a
     // Neuropod on a remote machine or in a different process.
@@ -108,4 +117,21 @@ public:
                                                                const Deleter &             deleter);
 };
 
+// Load several neuropods concurrently using up to `max_concurrency` threads (defaults to the number of CPUs).
+// Returns a future for each neuropod (in the same order as `neuropod_paths`).
+//
+// Extracting the packages, initializing backends (including starting OPE workers) and loading the models of
+// different neuropods overlap instead of running one after the other. Once all the neuropods are loaded, the
+// time spent initializing backends vs loading models is logged
+std::vector<std::future<std::unique_ptr<Neuropod>>> load_neuropods(const std::vector<std::string> &neuropod_paths,
+                                                                   const RuntimeOptions &          options         = {},
+                                                                   size_t                          max_concurrency = 0);
+
+// Load several neuropods concurrently with custom default backends (see the `Neuropod` constructor above)
+std::vector<std::future<std::unique_ptr<Neuropod>>> load_neuropods(
+    const std::vector<std::string> &    neuropod_paths,
+    const std::vector<BackendLoadSpec> &default_backend_overrides,
+    const RuntimeOptions &              options         = {},
+    size_t                              max_concurrency = 0);
+
 } // namespace neuropod
@@ -15,6 +15,7 @@ limitations under the License.
 
 #pragma once
 
+#include <cstdint>
 #include <string>
 
 namespace neuropod
@@ -75,6 +76,82 @@ struct RuntimeOptions
 
     // Whether or not to disable shape and type checking when running inference
     bool disable_shape_and_type_checking = false;
+
+    // These options are only used by the TensorFlow backend
+    struct TFOptions
+    {
+        // The number of threads used to parallelize the execution of a single op.
+        // If this is 0, TF will pick an appropriate number (usually the number of cores).
+        //
+        // Note: TF shares the intra-op thread pool across all sessions in a process so
+        // the value used by the first TF model loaded in a process takes effect
+        int32_t intra_op_parallelism_threads = 0;
+
+        // The number of threads used to run independent ops concurrently.
+        // If this is 0, TF will pick an appropriate number (usually the number of cores).
+        int32_t inter_op_parallelism_threads = 0;
+
+        // By default, each TF model creates its own inter-op thread pool. When running many
+        // models in a process, this can lead to heavy oversubscription.
+        // If this is set, all models in the process that also set it (and use the same
+        // `inter_op_parallelism_threads`) share a single inter-op thread pool.
+        bool use_shared_thread_pool = false;
+
+        // The level of graph optimizations to apply (see `OptimizerOptions::Level` in TF).
+        // `0` is the TF default (L1) and `-1` (L0) disables common subexpression elimination
+        // and constant folding.
+        int32_t graph_optimizer_level = 0;
+
+        // Whether or not to JIT compile clusters of ops with XLA (including on CPU)
+        bool enable_xla_jit = false;
+    } tf_options;
+
+    // These options are only used by the TorchScript backend
+    struct TorchScriptOptions
+    {
+        // The number of threads torch uses for intra-op parallelism.
+        // If this is 0, the current setting is left unchanged.
+        //
+        // Note: torch uses a process-wide thread pool so this affects all TorchScript models
+        // in the process. This is most useful with OPE where each worker can be sized to its
+        // share of the CPU
+        int32_t num_threads = 0;
+
+        // The number of threads torch uses for inter-op parallelism.
+        // If this is 0, the current setting is left unchanged.
+        //
+        // Note: torch only allows this to be set before any inter-op work has started in the
+        // process. If that's not the case, a warning is logged and this is ignored
+        int32_t num_interop_threads = 0;
+
+        // Whether or not the TorchScript graph executor should run its optimization passes
+        // (e.g. fusion) on the graph. Disabling this can reduce the latency of the first
+        // few inference runs at the cost of steady state performance.
+        bool graph_executor_optimize = true;
+
+        // Whether or not to run inference in inference mode (a faster version of no_grad that
+        // also skips version counter and view tracking). This is ignored with torch < 1.9
+        bool use_inference_mode = false;
+
+        // Whether or not to freeze the model (inline parameters and attributes as constants)
+        // at load time. This requires torch >= 1.5. With torch >= 1.11, the frozen model is also
+        // optimized for inference (see `torch::jit::optimize_for_inference`)
+        bool freeze = false;
+    } torchscript_options;
+
+    // These options are only used by the python backend
+    struct PythonOptions
+    {
+        // If this is greater than 0, the model is loaded once and then forked into this many
+        // replica processes that share the loaded model copy-on-write. Inference requests are
+        // dispatched to an idle replica (passing tensors through shared memory) so concurrent
+        // requests don't serialize on a single GIL.
+        //
+        // Note: this requires python 3.8+ and a platform that supports `fork`. Because `fork` only
+        // copies the calling thread, loading fails if the process has other threads (e.g. a JVM or
+        // concurrent loads with `load_neuropods`)
+        int32_t num_replicas = 0;
+    } python_options;
 };
 
 } // namespace neuropod
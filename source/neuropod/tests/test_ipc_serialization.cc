@@ -76,13 +76,22 @@ TEST(test_ipc_serialization, ope_load_config)
         {"torchscript", "1.12.0", "/some/path/to/neuropod_torchscrtipt_backend.so"},
     };
 
-    expected.opts.visible_device = neuropod::Device::GPU2;
+    expected.opts.visible_device                          = neuropod::Device::GPU2;
+    expected.opts.tf_options.inter_op_parallelism_threads = 4;
+    expected.opts.tf_options.use_shared_thread_pool       = true;
+    expected.opts.torchscript_options.num_threads         = 2;
+    expected.opts.torchscript_options.freeze              = true;
 
     const auto actual = serialize_deserialize(expected);
 
     EXPECT_EQ(expected.neuropod_path, actual.neuropod_path);
     EXPECT_EQ(expected.default_backend_overrides, actual.default_backend_overrides);
     EXPECT_EQ(expected.opts.visible_device, actual.opts.visible_device);
+    EXPECT_EQ(expected.opts.tf_options.inter_op_parallelism_threads,
+              actual.opts.tf_options.inter_op_parallelism_threads);
+    EXPECT_EQ(expected.opts.tf_options.use_shared_thread_pool, actual.opts.tf_options.use_shared_thread_pool);
+    EXPECT_EQ(expected.opts.torchscript_options.num_threads, actual.opts.torchscript_options.num_threads);
+    EXPECT_EQ(expected.opts.torchscript_options.freeze, actual.opts.torchscript_options.freeze);
 }
 
 TEST(test_ipc_serialization, neuropod_value_map)
@@ -14,7 +14,64 @@ limitations under the License.
 */
 
 #include "gtest/gtest.h"
+#include "neuropod/internal/content_store.hh"
+#include "neuropod/internal/extraction_cache.hh"
+#include "neuropod/internal/hash_utils.hh"
 #include "neuropod/internal/neuropod_loader.hh"
+#include "neuropod/internal/prefetch.hh"
+
+#include <ghc/filesystem.hpp>
+#include <sys/stat.h>
+
+#include <chrono>
+#include <cstdio>
+#include <fstream>
+#include <iterator>
+#include <thread>
+#include <utility>
+#include <vector>
+
+#include <zip.h>
+
+namespace
+{
+
+namespace fs = ghc::filesystem;
+
+// Writes a zipfile containing `files` (pairs of names and contents). Entries are stored uncompressed
+// if `method` is 0
+void write_zip(const std::string &                                     archive,
+               const std::vector<std::pair<std::string, std::string>> &files,
+               int                                                     method = Z_DEFLATED)
+{
+    zipFile zf = zipOpen64(archive.c_str(), 0);
+    ASSERT_NE(zf, nullptr);
+    for (const auto &file : files)
+    {
+        ASSERT_EQ(zipOpenNewFileInZip(zf,
+                                      file.first.c_str(),
+                                      nullptr,
+                                      nullptr,
+                                      0,
+                                      nullptr,
+                                      0,
+                                      nullptr,
+                                      method,
+                                      method == 0 ? 0 : Z_DEFAULT_COMPRESSION),
+                  ZIP_OK);
+        ASSERT_EQ(zipWriteInFileInZip(zf, file.second.data(), static_cast<unsigned>(file.second.size())), ZIP_OK);
+        ASSERT_EQ(zipCloseFileInZip(zf), ZIP_OK);
+    }
+
+    ASSERT_EQ(zipClose(zf, nullptr), ZIP_OK);
+}
+
+std::string read_stream(std::istream &stream)
+{
+    return std::string(std::istreambuf_iterator<char>(stream), std::istreambuf_iterator<char>());
+}
+
+} // namespace
 
 TEST(test_loader, test_sha)
 {
@@ -22,3 +79,309 @@ TEST(test_loader, test_sha)
     EXPECT_EQ(loader->get_hash_for_file("0/data/random_content"),
               "9ac0d09c343ccce2f317fc395d6253f6e3531cc863acbda09e90c7ecdafa5b10");
 }
+
+TEST(test_loader, test_manifest_hash)
+{
+    char neuropod_dir[] = "/tmp/neuropod_test_manifest_XXXXXX";
+    ASSERT_NE(mkdtemp(neuropod_dir), nullptr);
+
+    const std::string dir = neuropod_dir;
+    std::ofstream(dir + "/file") << "contents";
+    std::ofstream(dir + "/manifest.json") << R"({"files": {"file": {"sha256": "hash_from_manifest", "size": 8}}})";
+
+    // The hash in the manifest is used instead of hashing the file
+    auto loader = neuropod::get_loader(dir);
+    EXPECT_EQ(loader->get_hash_for_file("file"), "hash_from_manifest");
+}
+
+TEST(test_loader, test_extraction_cache)
+{
+    char cache_dir[] = "/tmp/neuropod_test_cache_XXXXXX";
+    ASSERT_NE(mkdtemp(cache_dir), nullptr);
+
+    const std::string archive     = "neuropod/tests/test_data/pytorch_addition_model/0/data/random_content";
+    int               num_extract = 0;
+    const auto        extract     = [&num_extract](const std::string &dir) {
+        num_extract++;
+        std::ofstream(dir + "/file") << "contents";
+    };
+
+    std::string path;
+    {
+        neuropod::ExtractionCacheEntry first(cache_dir, archive, extract);
+        neuropod::ExtractionCacheEntry second(cache_dir, archive, extract);
+        path = first.get_path();
+
+        // The archive is only extracted once
+        EXPECT_EQ(num_extract, 1);
+        EXPECT_EQ(path, second.get_path());
+        EXPECT_TRUE(std::ifstream(path + "/file").good());
+
+        // Entries that are in use are never evicted
+        neuropod::evict_extraction_cache(cache_dir, 0);
+        EXPECT_TRUE(std::ifstream(path + "/file").good());
+    }
+
+    neuropod::evict_extraction_cache(cache_dir, 0);
+    EXPECT_FALSE(std::ifstream(path + "/file").good());
+}
+
+TEST(test_loader, test_content_store)
+{
+    char dir[] = "/tmp/neuropod_test_store_XXXXXX";
+    ASSERT_NE(mkdtemp(dir), nullptr);
+
+    const std::string store_dir = std::string(dir) + "/store";
+    const std::string first     = std::string(dir) + "/first";
+    const std::string second    = std::string(dir) + "/second";
+    std::ofstream(first) << "contents";
+
+    // Nothing was added to the store yet
+    EXPECT_EQ(neuropod::gc_content_store(store_dir), 0);
+
+    const auto hash = neuropod::sha256_file(first);
+    EXPECT_FALSE(neuropod::link_from_content_store(store_dir, hash, second));
+    EXPECT_FALSE(neuropod::add_to_content_store(store_dir, first, "not_the_hash"));
+    EXPECT_TRUE(neuropod::add_to_content_store(store_dir, first, hash));
+
+    // Identical files are stored once
+    EXPECT_TRUE(neuropod::link_from_content_store(store_dir, hash, second));
+    struct stat st;
+    ASSERT_EQ(stat(second.c_str(), &st), 0);
+    EXPECT_EQ(st.st_nlink, 3);
+
+    // Files are removed once nothing uses them
+    EXPECT_EQ(neuropod::gc_content_store(store_dir), 0);
+    unlink(first.c_str());
+    unlink(second.c_str());
+    EXPECT_EQ(neuropod::gc_content_store(store_dir), 8);
+}
+
+TEST(test_loader, test_load_from_buffer)
+{
+    char dir[] = "/tmp/neuropod_test_buffer_XXXXXX";
+    ASSERT_NE(mkdtemp(dir), nullptr);
+
+    // Create a zipped neuropod with a single file
+    const std::string archive = std::string(dir) + "/neuropod.zip";
+    zipFile           zf      = zipOpen64(archive.c_str(), 0);
+    ASSERT_NE(zf, nullptr);
+    ASSERT_EQ(
+        zipOpenNewFileInZip(zf, "file", nullptr, nullptr, 0, nullptr, 0, nullptr, Z_DEFLATED, Z_DEFAULT_COMPRESSION),
+        ZIP_OK);
+    ASSERT_EQ(zipWriteInFileInZip(zf, "contents", 8), ZIP_OK);
+    ASSERT_EQ(zipCloseFileInZip(zf), ZIP_OK);
+    ASSERT_EQ(zipClose(zf, nullptr), ZIP_OK);
+
+    std::ifstream in(archive, std::ios::binary);
+    const auto    data =
+        std::make_shared<std::string>(std::istreambuf_iterator<char>(in), std::istreambuf_iterator<char>());
+    std::remove(archive.c_str());
+
+    // Files are read directly from memory
+    auto loader = neuropod::get_loader_from_buffer(data);
+    EXPECT_TRUE(loader->has_file("file"));
+    std::string contents;
+    *loader->get_istream_for_file("file") >> contents;
+    EXPECT_EQ(contents, "contents");
+
+    // And only written to disk when a path to them is requested
+    EXPECT_TRUE(std::ifstream(loader->get_file_path("file")).good());
+
+    // Registered buffers can be loaded by path
+    const auto path = neuropod::register_neuropod_buffer(data);
+    EXPECT_TRUE(neuropod::get_loader(path)->has_file("file"));
+    neuropod::unregister_neuropod_buffer(path);
+    EXPECT_ANY_THROW(neuropod::get_loader(path));
+}
+
+TEST(test_loader, test_lazy_extraction)
+{
+    char dir[] = "/tmp/neuropod_test_lazy_XXXXXX";
+    ASSERT_NE(mkdtemp(dir), nullptr);
+
+    const std::string archive = std::string(dir) + "/neuropod.zip";
+    write_zip(archive, {{"0/data/first", "first"}, {"0/data/second", "second"}});
+
+    // Only the requested entry is extracted
+    auto          loader = neuropod::get_loader(archive);
+    const auto    first  = loader->get_file_path("0/data/first");
+    std::ifstream first_stream(first);
+    EXPECT_EQ(read_stream(first_stream), "first");
+
+    const auto second = fs::path(first).parent_path() / "second";
+    EXPECT_FALSE(fs::exists(second));
+
+    // Until everything is extracted
+    EXPECT_EQ(fs::path(loader->ensure_local()) / "0/data/second", second);
+    std::ifstream second_stream(second.string());
+    EXPECT_EQ(read_stream(second_stream), "second");
+}
+
+TEST(test_loader, test_zip_entry_seek)
+{
+    char dir[] = "/tmp/neuropod_test_seek_XXXXXX";
+    ASSERT_NE(mkdtemp(dir), nullptr);
+
+    // This spans several inflate buffers
+    std::string contents(3 * 1024 * 1024 + 17, '\0');
+    for (size_t i = 0; i < contents.size(); i++)
+    {
+        contents[i] = static_cast<char>(i % 251);
+    }
+
+    const std::string archive = std::string(dir) + "/neuropod.zip";
+    write_zip(archive, {{"file", contents}});
+
+    auto       loader      = neuropod::get_loader(archive);
+    auto       stream      = loader->get_istream_for_file("file");
+    const auto expect_read = [&](size_t pos) {
+        char buffer[10];
+        stream->read(buffer, sizeof(buffer));
+        EXPECT_EQ(std::string(buffer, sizeof(buffer)), contents.substr(pos, sizeof(buffer)));
+        EXPECT_EQ(stream->tellg(), pos + sizeof(buffer));
+    };
+
+    // Get the size
+    stream->seekg(0, std::ios::end);
+    EXPECT_EQ(stream->tellg(), contents.size());
+
+    // Forwards across buffers
+    stream->seekg(2 * 1024 * 1024 + 5);
+    expect_read(2 * 1024 * 1024 + 5);
+
+    // Backwards within the current buffer
+    stream->seekg(-5, std::ios::cur);
+    expect_read(2 * 1024 * 1024 + 10);
+
+    // Backwards to an earlier buffer
+    stream->seekg(100);
+    expect_read(100);
+
+    // Past the end
+    stream->seekg(contents.size() + 1);
+    EXPECT_TRUE(stream->fail());
+}
+
+TEST(test_loader, test_unsafe_paths)
+{
+    char dir[] = "/tmp/neuropod_test_unsafe_XXXXXX";
+    ASSERT_NE(mkdtemp(dir), nullptr);
+
+    // Entries can't be extracted outside of the neuropod
+    for (const std::string name : {"../escaped", "0/../../escaped", "/tmp/escaped"})
+    {
+        const std::string archive = std::string(dir) + "/neuropod.zip";
+        write_zip(archive, {{name, "contents"}});
+
+        auto loader = neuropod::get_loader(archive);
+        EXPECT_ANY_THROW(loader->get_file_path(name));
+        EXPECT_ANY_THROW(loader->ensure_local());
+    }
+}
+
+TEST(test_loader, test_mapped_data)
+{
+    char dir[] = "/tmp/neuropod_test_mapped_XXXXXX";
+    ASSERT_NE(mkdtemp(dir), nullptr);
+
+    // Create a neuropod like one packaged with `mmap_data=True`: the data file is stored uncompressed and
+    // `data_index.json` has its offset in the archive. It's the first entry so its data starts right after
+    // the local file header
+    const std::string name       = "0/data/weights";
+    const std::string contents   = "0123456789";
+    const auto        offset     = 30 + name.size();
+    const auto        make_index = [&](size_t index_offset) {
+        return "{\"files\": {\"" + name + "\": {\"offset\": " + std::to_string(index_offset) +
+               ", \"size\": " + std::to_string(contents.size()) + "}}}";
+    };
+
+    const std::string archive = std::string(dir) + "/neuropod.zip";
+    write_zip(archive, {{name, contents}, {"data_index.json", make_index(offset)}}, 0);
+
+    std::ifstream in(archive, std::ios::binary);
+    const auto    data = std::make_shared<std::string>(read_stream(in));
+
+    std::vector<std::unique_ptr<neuropod::NeuropodLoader>> loaders;
+    loaders.emplace_back(neuropod::get_loader(archive));
+    loaders.emplace_back(neuropod::get_loader_from_buffer(data));
+    for (const auto &loader : loaders)
+    {
+        EXPECT_EQ(read_stream(*loader->get_istream_for_file(name)), contents);
+
+        // Mapped files are read directly from the archive instead of from an extracted copy
+        auto stream = loader->get_seekable_istream_for_file(name);
+        EXPECT_EQ(dynamic_cast<std::ifstream *>(stream.get()), nullptr);
+
+        char buffer[3];
+        stream->seekg(5);
+        stream->read(buffer, sizeof(buffer));
+        EXPECT_EQ(std::string(buffer, sizeof(buffer)), "567");
+        EXPECT_EQ(stream->tellg(), 8);
+
+        stream->seekg(-2, std::ios::end);
+        EXPECT_EQ(read_stream(*stream), "89");
+
+        stream->clear();
+        stream->seekg(-4, std::ios::cur);
+        EXPECT_EQ(read_stream(*stream), "6789");
+    }
+
+    // Indexes that don't match the archive are rejected
+    const std::string bad_offset = std::string(dir) + "/bad_offset.zip";
+    write_zip(bad_offset, {{name, contents}, {"data_index.json", make_index(offset + 1)}}, 0);
+    EXPECT_ANY_THROW(neuropod::get_loader(bad_offset));
+
+    const std::string compressed = std::string(dir) + "/compressed.zip";
+    write_zip(compressed, {{name, contents}, {"data_index.json", make_index(offset)}});
+    EXPECT_ANY_THROW(neuropod::get_loader(compressed));
+}
+
+TEST(test_loader, test_prefetch)
+{
+    char neuropod_dir[] = "/tmp/neuropod_test_prefetch_XXXXXX";
+    ASSERT_NE(mkdtemp(neuropod_dir), nullptr);
+
+    const std::string dir = neuropod_dir;
+    ASSERT_EQ(mkdir((dir + "/0").c_str(), 0755), 0);
+    ASSERT_EQ(mkdir((dir + "/0/data").c_str(), 0755), 0);
+    std::ofstream(dir + "/0/data/model.pt") << std::string(20 * 1024 * 1024, 'a');
+    std::ofstream(dir + "/0/data/model-0000.params") << "params";
+    std::ofstream(dir + "/0/data/other") << "not prefetched";
+
+    // Only the files that backends load are prefetched
+    auto       loader = neuropod::get_loader(dir);
+    const auto ranges = loader->get_prefetch_ranges(neuropod::get_prefetch_patterns());
+    EXPECT_EQ(ranges.size(), 2);
+
+    neuropod::Prefetcher prefetcher(ranges, 4);
+    while (!prefetcher.is_done())
+    {
+        std::this_thread::sleep_for(std::chrono::milliseconds(1));
+    }
+
+    EXPECT_EQ(prefetcher.get_bytes_read(), 20 * 1024 * 1024 + 6);
+    EXPECT_EQ(prefetcher.finish(), 20 * 1024 * 1024 + 6);
+}
+
+TEST(test_loader, test_prefetch_cancel)
+{
+    char neuropod_dir[] = "/tmp/neuropod_test_prefetch_cancel_XXXXXX";
+    ASSERT_NE(mkdtemp(neuropod_dir), nullptr);
+
+    // This is split into several chunks that are read by one thread
+    const std::string path = std::string(neuropod_dir) + "/model.pt";
+    const uint64_t    size = 128 * 1024 * 1024;
+    std::ofstream(path) << std::string(size, 'a');
+
+    neuropod::Prefetcher prefetcher({{path, 0, size}}, 1);
+    prefetcher.finish();
+
+    // The thread should stop without reading the rest of the file
+    while (!prefetcher.is_done())
+    {
+        std::this_thread::sleep_for(std::chrono::milliseconds(1));
+    }
+
+    EXPECT_LT(prefetcher.get_bytes_read(), size);
+}
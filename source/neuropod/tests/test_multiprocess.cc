@@ -50,3 +50,27 @@ TEST(test_multiprocess_backend, test_tensorflow_strings_model)
     // Test the TensorFlow strings model in another process
     test_strings_model_ope("neuropod/tests/test_data/tf_strings_model/");
 }
+
+TEST(test_multiprocess_backend, test_load_neuropods)
+{
+    // Load several models concurrently in other processes
+    neuropod::RuntimeOptions opts;
+    opts.use_ope = true;
+    auto futures = neuropod::load_neuropods({"neuropod/tests/test_data/torchscript_addition_model/",
+                                             "neuropod/tests/test_data/tf_addition_model/",
+                                             "neuropod/tests/test_data/pytorch_addition_model/",
+                                             "neuropod/tests/test_data/does_not_exist/"},
+                                            detail::ope_backend_location_overrides,
+                                            opts,
+                                            2);
+    ASSERT_EQ(futures.size(), 4);
+
+    for (size_t i = 0; i < 3; i++)
+    {
+        auto neuropod = futures[i].get();
+        test_addition_model(*neuropod);
+    }
+
+    // Failures are reported through the future of that neuropod
+    EXPECT_ANY_THROW(futures[3].get());
+}
@@ -0,0 +1,33 @@
+/* Copyright (c) 2020 UATC, LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+*/
+
+// Forked replicas can only be started while the process has a single thread so this
+// test runs in its own binary instead of alongside other tests that may start threads
+
+#include "test_utils.hh"
+
+#include <Python.h>
+
+#if PY_VERSION_HEX >= 0x03080000
+TEST(test_models, test_pytorch_addition_model_replicas)
+{
+    // Test the PyTorch addition model using forked replicas of the model
+    neuropod::RuntimeOptions opts;
+    opts.python_options.num_replicas = 2;
+
+    neuropod::Neuropod model("neuropod/tests/test_data/pytorch_addition_model/", opts);
+    test_addition_model(model);
+}
+#endif
@@ -26,3 +26,18 @@ TEST(test_models, test_tensorflow_strings_model)
     // Test the TensorFlow strings model using the native TensorFlow backend
     test_strings_model("neuropod/tests/test_data/tf_strings_model/");
 }
+
+TEST(test_models, test_tensorflow_addition_model_session_options)
+{
+    // Load two models that share an inter-op thread pool and run them
+    neuropod::RuntimeOptions opts;
+    opts.tf_options.intra_op_parallelism_threads = 1;
+    opts.tf_options.inter_op_parallelism_threads = 2;
+    opts.tf_options.use_shared_thread_pool       = true;
+    opts.tf_options.graph_optimizer_level        = -1;
+
+    neuropod::Neuropod first("neuropod/tests/test_data/tf_addition_model/", opts);
+    neuropod::Neuropod second("neuropod/tests/test_data/tf_addition_model/", opts);
+    test_addition_model(first);
+    test_addition_model(second);
+}
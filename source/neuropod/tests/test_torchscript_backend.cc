@@ -27,6 +27,18 @@ TEST(test_torchscript_backend, test_torchscript_addition_tensor_output_model)
     test_addition_model("neuropod/tests/test_data/torchscript_addition_model_single_output/");
 }
 
+TEST(test_torchscript_backend, test_torchscript_addition_model_runtime_options)
+{
+    // Load the model with explicit thread counts and without graph executor optimizations
+    neuropod::RuntimeOptions opts;
+    opts.torchscript_options.num_threads             = 1;
+    opts.torchscript_options.num_interop_threads     = 1;
+    opts.torchscript_options.graph_executor_optimize = false;
+
+    neuropod::Neuropod model("neuropod/tests/test_data/torchscript_addition_model/", opts);
+    test_addition_model(model);
+}
+
 TEST(test_torchscript_backend, test_torchscript_strings_model)
 {
     // Test the TorchScript strings model using the native torchscript backend
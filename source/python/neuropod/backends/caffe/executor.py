@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import json
 import numpy as np
 import os
@@ -26,13 +27,29 @@ class CaffeNeuropodExecutor(NeuropodExecutor):
     """
     Executes a Caffe neuropod
     """
-    def __init__(self, neuropod_path):
+    def __init__(self, neuropod_path, copy_outputs=True, max_cached_shapes=4):
         """
         Load a Caffe neuropod
 
         :param  neuropod_path:      The path to a Caffe neuropod package
 
+        :param  copy_outputs:       Whether or not to copy the outputs of the net. If this is
+                                    False, the returned arrays are views of the output blobs
+                                    and are overwritten by the next call to `infer`. Only
+                                    disable this if each output is consumed before the next
+                                    call
+
+        :param  max_cached_shapes:  The number of input shapes to keep a reshaped copy of the
+                                    net for. The copies share weights, but each one holds its
+                                    own intermediate blobs. Requests that alternate between
+                                    a few shapes don't have to reshape the net on every call
+
         """
+        if max_cached_shapes < 1:
+            raise ValueError(
+                "max_cached_shapes must be at least 1. Got {}".format(
+                    max_cached_shapes))
+
         super(CaffeNeuropodExecutor, self).__init__(neuropod_path)
         # Create a folder to store the model
         neuropod_data_path = os.path.join(neuropod_path, "0", "data")
@@ -52,6 +69,8 @@ class CaffeNeuropodExecutor(NeuropodExecutor):
         else:
             self.model = caffe.Net(prototxt_path, caffe.TEST)
 
+        self.prototxt_path = prototxt_path
+
         with open(os.path.join(neuropod_path, "0", "config.json"),
                   "r") as config_file:
             model_config = json.load(config_file)
@@ -59,6 +78,49 @@ class CaffeNeuropodExecutor(NeuropodExecutor):
             # Get the node name mapping and store it
             self.node_name_mapping = model_config["node_name_mapping"]
 
+        self.copy_outputs = copy_outputs
+
+        # Compute the blob names once instead of on every call to forward
+        self.input_blobs = [(node["name"],
+                             self.node_name_mapping[node["name"]])
+                            for node in self.neuropod_config["input_spec"]]
+        self.output_blobs = [(node["name"],
+                              self.node_name_mapping[node["name"]])
+                             for node in self.neuropod_config["output_spec"]]
+
+        # Nets reshaped for the most recently used input shapes (least recently used
+        # first). These all share the weights of `self.model`
+        self.max_cached_shapes = max_cached_shapes
+        self.nets = collections.OrderedDict()
+
+    def _get_net(self, feed):
+        """
+        Get a net whose input blobs (and the rest of the net) match the shapes of `feed`
+
+        :param  feed:   A list of (caffe blob name, numpy array) tuples
+        """
+        shapes = tuple((name, value.shape) for name, value in feed)
+        net = self.nets.pop(shapes, None)
+        if net is None:
+            if len(self.nets) >= self.max_cached_shapes:
+                # Reshape the least recently used net
+                _, net = self.nets.popitem(last=False)
+            elif self.nets:
+                net = caffe.Net(self.prototxt_path, caffe.TEST)
+                net.share_with(self.model)
+            else:
+                net = self.model
+
+            for name, shape in shapes:
+                net.blobs[name].reshape(*shape)
+
+            # Propagate the new input shapes through the net. Caffe only reallocates
+            # memory for blobs that grow beyond their current capacity
+            net.reshape()
+
+        self.nets[shapes] = net
+        return net
+
     def forward(self, inputs):
         """
         Run inference using the specifed inputs.
@@ -72,33 +134,24 @@ class CaffeNeuropodExecutor(NeuropodExecutor):
         :returns:   A dict mapping output names to values. All the keys
                     in this dict are strings and all the values are numpy arrays.
         """
+        feed = [(caffe_name, inputs[neuropod_name])
+                for neuropod_name, caffe_name in self.input_blobs
+                if neuropod_name in inputs]
 
-        # Convert the inputs to torch tensors and move to the appropriate device
-        output_dict = {}
-        feed_dict = {}
-
-        for node in self.neuropod_config["output_spec"]:
-            neuropod_name = node["name"]
-            caffe_name = self.node_name_mapping[neuropod_name]
-            output_dict[neuropod_name] = caffe_name
-
-        # Get the input nodes
-        for node in self.neuropod_config["input_spec"]:
-            neuropod_name = node["name"]
+        # Run the whole request as a single batch instead of chunking it by the
+        # batch size in the prototxt
+        net = self._get_net(feed)
+        for caffe_name, value in feed:
+            net.blobs[caffe_name].data[...] = value
 
-            if neuropod_name not in inputs:
-                continue
-
-            # Get the graph node
-            caffe_name = self.node_name_mapping[neuropod_name]
-
-            # Add it to the feed_dict
-            feed_dict[caffe_name] = inputs[neuropod_name]
-
-        out = self.model.forward_all(**feed_dict)
+        net.forward()
 
         neuropod_out = {}
-        for k, v in output_dict.items():
-            neuropod_out[k] = out[v]
+        for neuropod_name, caffe_name in self.output_blobs:
+            out = net.blobs[caffe_name].data
+            if self.copy_outputs:
+                out = out.copy()
+
+            neuropod_out[neuropod_name] = out
 
         return neuropod_out
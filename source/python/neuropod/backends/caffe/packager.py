@@ -14,10 +14,9 @@
 
 import os
 import json
-import shutil
 import caffe
 
-from neuropod.utils.packaging_utils import packager
+from neuropod.utils.packaging_utils import copy_file, copy_tree, packager
 
 
 @packager(platform="caffe")
@@ -28,6 +27,7 @@ def create_caffe_neuropod(neuropod_path,
                           prototxt,
                           caffemodel=None,
                           code_path_spec=None,
+                          copy_mode="copy",
                           **kwargs):
     """
     Packages a caffe model as a neuropod package.
@@ -77,18 +77,19 @@ def create_caffe_neuropod(neuropod_path,
 
             for dir_to_package in copy_spec["dirs_to_package"]:
                 if len(dir_to_package) == 0: continue
-                shutil.copytree(
+                copy_tree(
                     os.path.join(python_root, dir_to_package),
                     os.path.join(neuropod_code_path, dir_to_package),
+                    copy_mode=copy_mode,
                 )
 
     # Add the model to the neuropod
     prototxt_path = os.path.join(neuropod_data_path, "model.prototxt")
     caffemodel_path = os.path.join(neuropod_data_path, "model.caffemodel")
 
-    shutil.copyfile(prototxt, prototxt_path)
+    copy_file(prototxt, prototxt_path, copy_mode=copy_mode)
     if caffemodel is not None:
-        shutil.copyfile(caffemodel, caffemodel_path)
+        copy_file(caffemodel, caffemodel_path, copy_mode=copy_mode)
 
     # Make sure we have mappings for everything in the spec
     expected_keys = set()
@@ -12,11 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import numpy as np
 import os
 import json
-from six import string_types
-import caffe2
+import threading
+from caffe2.proto import caffe2_pb2
 from caffe2.python import workspace
 
 from neuropod.backends.neuropod_executor import NeuropodExecutor
@@ -40,15 +39,14 @@ class Caffe2NeuropodExecutor(NeuropodExecutor):
         init_path = os.path.join(neuropod_data_path, "init_net.pb")
         predict_path = os.path.join(neuropod_data_path, "predict_net.pb")
 
-        workspace.ResetWorkspace()
+        init_net = caffe2_pb2.NetDef()
         with open(init_path, "rb") as f:
-            init_net = f.read()
+            init_net.ParseFromString(f.read())
+
+        predict_net = caffe2_pb2.NetDef()
         with open(predict_path, "rb") as f:
-            predict_net = f.read()
-        workspace.RunNetOnce(init_net)
-        workspace.CreateNet(predict_net)
+            predict_net.ParseFromString(f.read())
 
-        self.model = workspace.Predictor(init_net, predict_net)
         with open(os.path.join(neuropod_path, "0", "config.json"),
                   "r") as config_file:
             model_config = json.load(config_file)
@@ -56,6 +54,36 @@ class Caffe2NeuropodExecutor(NeuropodExecutor):
             # Get the node name mapping and store it
             self.node_name_mapping = model_config["node_name_mapping"]
 
+        # Compute the blob names once instead of on every call to forward
+        self.input_blobs = [(node["name"],
+                             self.node_name_mapping[node["name"]])
+                            for node in self.neuropod_config["input_spec"]]
+        self.output_blobs = [(node["name"],
+                              self.node_name_mapping[node["name"]])
+                             for node in self.neuropod_config["output_spec"]]
+
+        # Each executor gets its own workspace so loading several Caffe2 models in
+        # one process doesn't clobber the blobs of previously loaded ones. The
+        # workspace (and everything in it) is freed along with the executor
+        self.workspace = workspace.C.Workspace()
+
+        # Runs share the input and output blobs so they must be serialized
+        self.lock = threading.RLock()
+
+        if not predict_net.name:
+            predict_net.name = "predict_net"
+
+        self.net_name = predict_net.name
+
+        # Initialize the weights (only once) and create the net
+        self.workspace.run(init_net)
+        input_blobs = set(predict_net.external_input)
+        input_blobs.update(name for _, name in self.input_blobs)
+        for name in sorted(input_blobs):
+            self.workspace.create_blob(name)
+
+        self.workspace.create_net(predict_net, True)
+
     def forward(self, inputs):
         """
         Run inference using the specifed inputs.
@@ -69,39 +97,20 @@ class Caffe2NeuropodExecutor(NeuropodExecutor):
         :returns:   A dict mapping output names to values. All the keys
                     in this dict are strings and all the values are numpy arrays.
         """
+        neuropod_out = {}
+        with self.lock:
+            # Feed the inputs
+            for neuropod_name, caffe2_name in self.input_blobs:
+                if neuropod_name in inputs:
+                    self.workspace.feed_blob(caffe2_name, inputs[neuropod_name])
 
-        # Convert the inputs to torch tensors and move to the appropriate device
-
-        output_dict = {}
-        feed_dict = {}
-
-        # Get the output nodes
-        for node in self.neuropod_config["output_spec"]:
-            neuropod_name = node["name"]
-
-            # Get the graph node
-            caffe2_name = self.node_name_mapping[neuropod_name]
-
-            # Add it to the output name
-            output_dict[neuropod_name] = caffe2_name
-
-        # Get the input nodes
-        for node in self.neuropod_config["input_spec"]:
-            neuropod_name = node["name"]
-
-            if neuropod_name not in inputs:
-                continue
-
-            # Get the graph node
-            caffe2_name = self.node_name_mapping[neuropod_name]
-
-            # Add it to the feed_dict
-            feed_dict[caffe2_name] = inputs[neuropod_name]
+            # Run the net that was created at load time
+            self.workspace.nets[self.net_name].run()
 
-        # forward to feed blobs
-        self.model.run(feed_dict)
+            # Fetch each output once. This copies the data out of the workspace,
+            # which is required because the blobs are reused on the next run
+            for neuropod_name, caffe2_name in self.output_blobs:
+                neuropod_out[neuropod_name] = self.workspace.blobs[
+                    caffe2_name].fetch()
 
-        neuropod_out = {}
-        for k, v in output_dict.items():
-            neuropod_out[k] = workspace.FetchBlob(v)
         return neuropod_out
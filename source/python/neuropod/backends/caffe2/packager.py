@@ -14,14 +14,14 @@
 
 import os
 import json
-import shutil
 
-from neuropod.utils.packaging_utils import packager
+from neuropod.utils.packaging_utils import copy_file, packager
 
 
 @packager(platform="caffe2")
 def create_caffe2_neuropod(neuropod_path, input_spec, output_spec,
-                           node_name_mapping, predict_net, init_net, **kwargs):
+                           node_name_mapping, predict_net, init_net,
+                           copy_mode="copy", **kwargs):
     """
     Packages a TorchScript model as a neuropod package.
 
@@ -53,8 +53,8 @@ def create_caffe2_neuropod(neuropod_path, input_spec, output_spec,
     init_path = os.path.join(neuropod_data_path, "init_net.pb")
     predict_path = os.path.join(neuropod_data_path, "predict_net.pb")
 
-    shutil.copyfile(init_net, init_path)
-    shutil.copyfile(predict_net, predict_path)
+    copy_file(init_net, init_path, copy_mode=copy_mode)
+    copy_file(predict_net, predict_path, copy_mode=copy_mode)
 
     # Make sure we have mappings for everything in the spec
     expected_keys = set()
@@ -21,16 +21,49 @@ from mxnet.gluon import nn
 from neuropod.backends.neuropod_executor import NeuropodExecutor
 
 
+def to_ndarray(value):
+    """
+    Converts a numpy array to an MXNet NDArray without copying if possible
+
+    :param  value:  A numpy array
+    """
+    if (hasattr(mx.nd, "from_numpy") and value.flags["C_CONTIGUOUS"]
+            and value.dtype != np.bool_):
+        # `from_numpy` marks the array it wraps as read-only so we pass in a view
+        # in order to not modify the flags of the user's array
+        return mx.nd.from_numpy(value.view(), zero_copy=True)
+
+    return mx.nd.array(value, dtype=value.dtype)
+
+
 class MxnetNeuropodExecutor(NeuropodExecutor):
     """
     Executes a MXNet neuropod
     """
-    def __init__(self, neuropod_path):
+    def __init__(self,
+                 neuropod_path,
+                 hybridize=True,
+                 static_alloc=True,
+                 static_shape=True,
+                 max_cached_shapes=16):
         """
         Load a MXNet neuropod
 
         :param  neuropod_path:      The path to a MXNet neuropod package
 
+        :param  hybridize:          Whether or not to hybridize the loaded model
+
+        :param  static_alloc:       Whether or not to statically allocate memory for the
+                                    hybridized model (instead of planning it on every call)
+
+        :param  static_shape:       Whether or not to optimize the hybridized model for static
+                                    input shapes. A separate copy of the model (sharing parameters)
+                                    is kept for every set of input shapes
+
+        :param  max_cached_shapes:  The maximum number of input shapes to keep optimized copies of
+                                    when `static_shape` is set. Other shapes are run without
+                                    static shape optimizations
+
         """
         super(MxnetNeuropodExecutor, self).__init__(neuropod_path)
 
@@ -47,6 +80,50 @@ class MxnetNeuropodExecutor(NeuropodExecutor):
                                             input_names=config['inputs'],
                                             param_file=param_path)
 
+        self.symbol_path = symbol_path
+        self.model_input_names = config['inputs']
+        self.hybridize = hybridize
+        self.static_alloc = static_alloc
+        self.static_shape = hybridize and static_shape
+        self.max_cached_shapes = max_cached_shapes
+
+        if hybridize:
+            # The default model is used for shapes that aren't cached below
+            self.model.hybridize(static_alloc=static_alloc)
+
+        # A map from a tuple of input shapes to a model optimized for those shapes
+        self.shape_cache = {}
+
+        # Compute these once instead of on every call to forward
+        self.input_names = [
+            item["name"] for item in self.neuropod_config["input_spec"]
+        ]
+        self.output_specs = [(item["name"], np.dtype(item["dtype"]))
+                             for item in self.neuropod_config["output_spec"]]
+
+    def _get_model(self, converted_inputs):
+        """
+        Get a model to run the specified inputs with
+        """
+        if not self.static_shape:
+            return self.model
+
+        shapes = tuple(item.shape for item in converted_inputs)
+        model = self.shape_cache.get(shapes)
+        if model is None:
+            if len(self.shape_cache) >= self.max_cached_shapes:
+                return self.model
+
+            # Create a block that shares parameters with the loaded model
+            model = nn.SymbolBlock(
+                outputs=mx.sym.load(self.symbol_path),
+                inputs=[mx.sym.var(name) for name in self.model_input_names],
+                params=self.model.collect_params())
+            model.hybridize(static_alloc=self.static_alloc, static_shape=True)
+            self.shape_cache[shapes] = model
+
+        return model
+
     def forward(self, inputs):
         """
         Run inference using the specifed inputs.
@@ -61,23 +138,20 @@ class MxnetNeuropodExecutor(NeuropodExecutor):
                     in this dict are strings and all the values are numpy arrays.
         """
 
-        # Convert the inputs to torch tensors and move to the appropriate device
-        converted_inputs = []
-        for item in self.neuropod_config["input_spec"]:
-            v = inputs[item["name"]]
-            converted_inputs.append(mx.ndarray.array(v, dtype=v.dtype))
+        # Convert the inputs to NDArrays (without copying if possible)
+        converted_inputs = [to_ndarray(inputs[name]) for name in self.input_names]
 
-        out = self.model.forward(*converted_inputs)
+        out = self._get_model(converted_inputs).forward(*converted_inputs)
 
         if isinstance(out, mx.nd.NDArray):
             out = [
                 out,
             ]
 
-        output_spec = self.neuropod_config["output_spec"]
+        # `asnumpy` already copies so we only convert if the dtype doesn't match
         neuropod_out = {
-            k["name"]: v.asnumpy().astype(k["dtype"])
-            for k, v in zip(output_spec, out)
+            name: v.asnumpy().astype(dtype, copy=False)
+            for (name, dtype), v in zip(self.output_specs, out)
         }
 
         return neuropod_out
@@ -14,10 +14,9 @@
 
 import os
 import json
-import shutil
 import mxnet
 
-from neuropod.utils.packaging_utils import packager
+from neuropod.utils.packaging_utils import copy_file, packager
 
 
 @packager(platform="mxnet")
@@ -26,6 +25,7 @@ def create_mxnet_neuropod(neuropod_path,
                           module=None,
                           symbol_file=None,
                           param_file=None,
+                          copy_mode="copy",
                           **kwargs):
     """
     Packages a MXNet model as a neuropod package.
@@ -64,9 +64,9 @@ def create_mxnet_neuropod(neuropod_path,
 
     if symbol_file is not None:
         # Copy in the module
-        shutil.copyfile(symbol_file, symbol_path)
+        copy_file(symbol_file, symbol_path, copy_mode=copy_mode)
         if param_file is not None:
-            shutil.copyfile(param_file, param_path)
+            copy_file(param_file, param_path, copy_mode=copy_mode)
     else:
         # Save the model
         module.export(os.path.join(neuropod_data_path, 'model'))
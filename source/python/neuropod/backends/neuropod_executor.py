@@ -18,6 +18,7 @@ import six
 import numpy as np
 
 from neuropod.backends import config_utils
+from neuropod.utils.manifest_utils import Manifest
 from neuropod.utils.dtype_utils import get_dtype
 
 
@@ -118,6 +119,9 @@ class NeuropodExecutor(object):
         # Read the neuropod config
         self.neuropod_config = config_utils.read_neuropod_config(neuropod_path)
 
+        # The hashes of the files in the package (used to avoid rehashing files at load time)
+        self.manifest = Manifest(neuropod_path)
+
         # Generate the tensor to device mapping
         self.input_device_mapping = {
             tensor["name"]: self.neuropod_config["input_tensor_device"][tensor["name"]]
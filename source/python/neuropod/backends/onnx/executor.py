@@ -12,10 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import errno
 import json
 import numpy as np
 import os
 import six
+import tempfile
 import onnxruntime as onnxr
 
 from neuropod.backends.neuropod_executor import NeuropodExecutor
@@ -25,16 +27,91 @@ from neuropod.utils.hash_utils import sha256sum
 # Avoid loading the same custom op twice
 loaded_op_hashes = set()
 
+EXECUTION_MODES = {
+    "sequential": onnxr.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxr.ExecutionMode.ORT_PARALLEL,
+}
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable_all": onnxr.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxr.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxr.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxr.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def get_session_options(intra_op_parallelism_threads,
+                        inter_op_parallelism_threads, execution_mode,
+                        graph_optimization_level):
+    """
+    Get ONNX Runtime `SessionOptions` given the load time options passed to the executor
+    """
+    if execution_mode not in EXECUTION_MODES:
+        raise ValueError(
+            "Invalid execution_mode '{}'. Expected one of {}".format(
+                execution_mode, sorted(EXECUTION_MODES.keys())))
+
+    if graph_optimization_level not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(
+            "Invalid graph_optimization_level '{}'. Expected one of {}".format(
+                graph_optimization_level,
+                sorted(GRAPH_OPTIMIZATION_LEVELS.keys())))
+
+    opts = onnxr.SessionOptions()
+    opts.intra_op_num_threads = intra_op_parallelism_threads
+    opts.inter_op_num_threads = inter_op_parallelism_threads
+    opts.execution_mode = EXECUTION_MODES[execution_mode]
+    opts.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[
+        graph_optimization_level]
+    return opts
+
+
+def get_static_shape(spec):
+    """
+    Returns the shape in `spec` as a tuple if all the dims are known ahead of time.
+    Otherwise returns None
+    """
+    shape = spec["shape"]
+    if all(isinstance(dim, six.integer_types) for dim in shape):
+        return tuple(shape)
+
+    return None
+
 
 class OnnxNeuropodExecutor(NeuropodExecutor):
     """
     Executes a ONNX neuropod
     """
-    def __init__(self, neuropod_path, load_custom_ops=True):
+    def __init__(self,
+                 neuropod_path,
+                 load_custom_ops=True,
+                 intra_op_parallelism_threads=0,
+                 inter_op_parallelism_threads=0,
+                 execution_mode="sequential",
+                 graph_optimization_level="all",
+                 optimized_model_cache_dir=None,
+                 use_io_binding=True):
         """
         Load a ONNX neuropod
 
-        :param  neuropod_path:  The path to a python neuropod package
+        :param  neuropod_path:                 The path to a python neuropod package
+        :param  load_custom_ops:               Whether or not to load custom ops included in the model.
+        :param  intra_op_parallelism_threads:  The number of threads used to parallelize a single op.
+                                               `0` lets ONNX Runtime pick a value.
+        :param  inter_op_parallelism_threads:  The number of threads used to run independent ops in parallel
+                                               when `execution_mode` is `parallel`. `0` lets ONNX Runtime pick a value.
+        :param  execution_mode:                Either `sequential` or `parallel`.
+        :param  graph_optimization_level:      One of `disable_all`, `basic`, `extended` or `all`.
+        :param  optimized_model_cache_dir:     A directory to cache optimized models in so later loads of the same
+                                               model can skip graph optimization. Disabled by default. Cached models
+                                               are keyed by the hash of the model, the ONNX Runtime version and the
+                                               optimization level.
+                                               Note: with the `all` level, the optimized model may contain hardware
+                                               specific optimizations so the cache should not be shared across
+                                               different types of machines.
+        :param  use_io_binding:                Whether or not to bind inputs and outputs directly to numpy
+                                               buffers instead of copying them in `run`. This is ignored for models
+                                               with string inputs or outputs.
         """
         super(OnnxNeuropodExecutor, self).__init__(neuropod_path)
 
@@ -44,8 +121,18 @@ class OnnxNeuropodExecutor(NeuropodExecutor):
             pass
 
         # Create a session
-        self.sess = onnxr.InferenceSession(
-            os.path.join(neuropod_path, "0", "data", "model.pb"))
+        sess_options = get_session_options(intra_op_parallelism_threads,
+                                           inter_op_parallelism_threads,
+                                           execution_mode,
+                                           graph_optimization_level)
+        model_path = os.path.join(neuropod_path, "0", "data", "model.pb")
+        if (optimized_model_cache_dir is not None
+                and graph_optimization_level != "disable_all"):
+            self.sess = self._create_session_with_cache(
+                model_path, sess_options, graph_optimization_level,
+                optimized_model_cache_dir)
+        else:
+            self.sess = onnxr.InferenceSession(model_path, sess_options)
 
         # Load the ONNX specific config
         with open(os.path.join(neuropod_path, "0", "config.json"),
@@ -55,6 +142,64 @@ class OnnxNeuropodExecutor(NeuropodExecutor):
             # Get the node name mapping and store it
             self.node_name_mapping = model_config["node_name_mapping"]
 
+        # Map every output in the spec to a graph node once instead of on every call
+        # List of (neuropod_name, onnx_name, dtype, static shape or None)
+        self.output_nodes = [(node["name"],
+                              self.node_name_mapping[node["name"]],
+                              get_dtype(node["dtype"]), get_static_shape(node))
+                             for node in self.neuropod_config["output_spec"]]
+
+        self.input_nodes = {
+            node["name"]: self.node_name_mapping[node["name"]]
+            for node in self.neuropod_config["input_spec"]
+        }
+
+        # IOBinding doesn't support string tensors
+        self.use_io_binding = use_io_binding and not any(
+            get_dtype(node["dtype"]).type == np.str_
+            for node in self.neuropod_config["input_spec"] +
+            self.neuropod_config["output_spec"])
+
+    def _create_session_with_cache(self, model_path, sess_options,
+                                   graph_optimization_level, cache_dir):
+        """
+        Creates a session from a cached optimized model if one exists. Otherwise, creates a
+        session from `model_path` and writes the model it optimized to the cache
+        """
+        # The optimized model depends on the model, the runtime version and the optimization level
+        optimized_path = os.path.join(
+            cache_dir, "{}.ort-{}.{}.onnx".format(sha256sum(model_path),
+                                                  onnxr.__version__,
+                                                  graph_optimization_level))
+
+        if os.path.exists(optimized_path):
+            # The graph has already been optimized
+            sess_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[
+                "disable_all"]
+            return onnxr.InferenceSession(optimized_path, sess_options)
+
+        # Write to a temp file and atomically rename it into place so concurrent loads
+        # never see a partially written model
+        try:
+            os.makedirs(cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            # The session writes the optimized model while it's created
+            sess_options.optimized_model_filepath = tmp_path
+            sess = onnxr.InferenceSession(model_path, sess_options)
+            os.rename(tmp_path, optimized_path)
+        finally:
+            sess_options.optimized_model_filepath = ""
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+        return sess
+
     def forward(self, inputs):
         """
         Run inference using the specifed inputs.
@@ -68,38 +213,55 @@ class OnnxNeuropodExecutor(NeuropodExecutor):
         :returns:   A dict mapping output names to values. All the keys
                     in this dict are strings and all the values are numpy arrays.
         """
+        if self.use_io_binding:
+            return self._forward_with_io_binding(inputs)
 
-        # get the input and output nodes
-        output_dict = {}
-        feed_dict = {}
-
-        # Get the output nodes
-        for node in self.neuropod_config["output_spec"]:
-            neuropod_name = node["name"]
+        # TODO(yevgeni): treat all input fields as optional at the neuropod level. If a model
+        # requires a missing field it will fail therein.
+        feed_dict = {
+            self.input_nodes[name]: value
+            for name, value in inputs.items()
+        }
 
-            # Get the graph node
-            onnx_name = self.node_name_mapping[neuropod_name]
-            # Add it to the output nodes
-            output_dict[neuropod_name] = onnx_name
+        # Run inference
+        outputs = self.sess.run([item[1] for item in self.output_nodes],
+                                input_feed=feed_dict)
+        outputs = dict(zip([item[0] for item in self.output_nodes], outputs))
 
-        # Get the input nodes
-        for node in self.neuropod_config["input_spec"]:
-            neuropod_name = node["name"]
+        return outputs
 
-            # TODO(yevgeni): treat all input fields as optional at the neuropod level. If a model
-            # requires a missing field it will fail therein.
-            if neuropod_name not in inputs:
-                continue
+    def _forward_with_io_binding(self, inputs):
+        """
+        Run inference by binding the numpy inputs and outputs directly to the session
+        """
+        binding = self.sess.io_binding()
 
-            # Get the graph node
-            onnx_name = self.node_name_mapping[neuropod_name]
+        # Bind the inputs without copying them (unless they aren't contiguous)
+        for name, value in inputs.items():
+            binding.bind_cpu_input(self.input_nodes[name],
+                                   np.ascontiguousarray(value))
 
-            # Add it to the feed_dict
-            feed_dict[onnx_name] = inputs[neuropod_name]
+        # Outputs with shapes that are known ahead of time are written directly into
+        # freshly allocated numpy arrays. Everything else is allocated by the runtime
+        preallocated = {}
+        for neuropod_name, onnx_name, dtype, shape in self.output_nodes:
+            if shape is None:
+                binding.bind_output(onnx_name, "cpu")
+            else:
+                out = np.empty(shape, dtype=dtype)
+                binding.bind_output(onnx_name, "cpu", 0, dtype.type, shape,
+                                    out.ctypes.data)
+                preallocated[neuropod_name] = out
 
         # Run inference
-        outputs = self.sess.run(list(output_dict.values()),
-                                input_feed=feed_dict)
-        outputs = dict(zip(output_dict.keys(), outputs))
+        self.sess.run_with_iobinding(binding)
 
-        return outputs
+        neuropod_out = {}
+        for (neuropod_name, _, _, _), value in zip(self.output_nodes,
+                                                   binding.get_outputs()):
+            if neuropod_name in preallocated:
+                neuropod_out[neuropod_name] = preallocated[neuropod_name]
+            else:
+                neuropod_out[neuropod_name] = value.numpy()
+
+        return neuropod_out
@@ -1,9 +1,8 @@
 import os
 import json
-import shutil
 import onnx
 
-from neuropod.utils.packaging_utils import packager
+from neuropod.utils.packaging_utils import copy_file, packager
 
 
 @packager(platform="onnx")
@@ -13,6 +12,7 @@ def create_onnx_neuropod(neuropod_path,
                          node_name_mapping,
                          onnx_model=None,
                          model_path=None,
+                         copy_mode="copy",
                          **kwargs):
     """
     Packages a ONNX model as a neuropod package.
@@ -54,7 +54,7 @@ def create_onnx_neuropod(neuropod_path,
     target_model_path = os.path.join(neuropod_data_path, "model.pb")
     if model_path is not None:
         # Copy in the module
-        shutil.copyfile(model_path, target_model_path)
+        copy_file(model_path, target_model_path, copy_mode=copy_mode)
     else:
         # Save the model
         onnx.save(onnx_model, target_model_path)
@@ -13,18 +13,24 @@
 # limitations under the License.
 
 import atexit
+import errno
+import functools
 import os
 import six
 import sys
 import tempfile
-import uuid
 import importlib
 import json
+import types
+import uuid
+import zipfile
 
 import numpy as np
 
 from neuropod.backends.neuropod_executor import NeuropodExecutor
-from neuropod.utils.hash_utils import sha256sum
+from neuropod.utils.hash_utils import sha256sum_dir, sha256sum_zip_dir
+from neuropod.utils.worker_pool import WorkerPool
+from neuropod.utils.zip_loader import PYTHON_CODE_PREFIX
 
 # Workaround for https://bugs.python.org/issue32573
 if not hasattr(sys, "argv"):
@@ -59,11 +65,27 @@ class PythonNeuropodExecutor(NeuropodExecutor):
     Executes a python neuropod
     """
 
-    def __init__(self, neuropod_path, load_custom_ops=True):
+    def __init__(
+        self, neuropod_path, load_custom_ops=True, num_replicas=0, code_zip_path=None
+    ):
         """
         Load a python neuropod
 
         :param  neuropod_path:  The path to a python neuropod package
+
+        :param  num_replicas:   If this is greater than 0, the model is loaded once in this process and
+                                then forked into `num_replicas` worker processes that share the loaded
+                                model copy-on-write. Calls to `infer` are dispatched to an idle replica
+                                (passing tensors through shared memory) so concurrent callers aren't
+                                limited by a single GIL. Requires python 3.8+ and a platform that
+                                supports `fork`. Because `fork` only copies the calling thread, this
+                                raises an error if the process has other threads (e.g. when loading
+                                from a multithreaded C++ or JVM host). Use `num_workers` there.
+                                Replicas that exit are replaced by spawned processes that load the
+                                model again.
+
+        :param  code_zip_path:  If set, the code of the neuropod is imported directly from `0/code` in
+                                this zipfile (using zipimport) instead of from `neuropod_path`
         """
         super(PythonNeuropodExecutor, self).__init__(neuropod_path)
         self.neuropod_path = neuropod_path
@@ -90,8 +112,7 @@ class PythonNeuropodExecutor(NeuropodExecutor):
             if os.path.isdir(custom_op_path):
                 # Try to avoid silently using the incorrect op
                 for item in os.listdir(custom_op_path):
-                    lib_path = os.path.join(custom_op_path, item)
-                    lib_hash = sha256sum(lib_path)
+                    lib_hash = self.manifest.get_hash("0/ops/" + item)
                     if lib_hash in loaded_op_hashes:
                         # We already loaded this op so it's fine if this is added to the path again
                         # because the op is identical
@@ -118,11 +139,45 @@ class PythonNeuropodExecutor(NeuropodExecutor):
                 # Add the ops directory to the path
                 sys.path.insert(0, custom_op_path)
 
-        # Create a symlink to our code directory
-        neuropod_code_path = os.path.abspath(os.path.join(neuropod_path, "0", "code"))
-        rand_id = str(uuid.uuid4()).replace("-", "_")
-        self.symlink_path = os.path.join(SYMLINKS_DIR, rand_id)
-        os.symlink(neuropod_code_path, self.symlink_path)
+        # The name of the package we import the code as is based on the contents of the code
+        # so instances of neuropods with identical code share the imported modules (but still
+        # get separate models from the entrypoint)
+        code_hash = self.manifest.get_dir_hash(PYTHON_CODE_PREFIX)
+        if code_zip_path is not None:
+            if code_hash is None:
+                with zipfile.ZipFile(code_zip_path) as zf:
+                    code_hash = sha256sum_zip_dir(zf, PYTHON_CODE_PREFIX)
+
+            code_id = "code_" + code_hash
+
+            if code_id not in sys.modules:
+                # Create a package that zipimport can load the code from
+                package = types.ModuleType(code_id)
+                package.__path__ = [os.path.join(code_zip_path, "0", "code")]
+                sys.modules[code_id] = package
+        else:
+            # Create a symlink to our code directory
+            neuropod_code_path = os.path.abspath(
+                os.path.join(neuropod_path, "0", "code")
+            )
+            if code_hash is None:
+                code_hash = sha256sum_dir(neuropod_code_path)
+
+            code_id = "code_" + code_hash
+            symlink_path = os.path.join(SYMLINKS_DIR, code_id)
+            try:
+                os.symlink(neuropod_code_path, symlink_path)
+            except OSError as e:
+                # Another instance already created the symlink
+                if e.errno != errno.EEXIST:
+                    raise
+
+                if not os.path.exists(symlink_path):
+                    # The code it points to was deleted (e.g. the other neuropod was extracted
+                    # to a temp dir that was cleaned up). Atomically point it at our code instead
+                    tmp_path = "{}.{}".format(symlink_path, uuid.uuid4().hex)
+                    os.symlink(neuropod_code_path, tmp_path)
+                    os.rename(tmp_path, symlink_path)
 
         # Import the entrypoint package
         if six.PY3:
@@ -131,12 +186,24 @@ class PythonNeuropodExecutor(NeuropodExecutor):
             importlib.invalidate_caches()
 
         entrypoint_package = importlib.import_module(
-            "{}.{}".format(rand_id, entrypoint_package_path)
+            "{}.{}".format(code_id, entrypoint_package_path)
         )
 
         # Get the entrypoint function and run it with the data path
         self.model = entrypoint_package.__dict__[entrypoint_fn_name](data_path)
 
+        # Fork replicas of the loaded model if requested
+        self.pool = None
+        if num_replicas > 0:
+            self.pool = WorkerPool(
+                num_replicas,
+                lambda: self._run_model,
+                start_method="fork",
+                respawn_make_forward=functools.partial(
+                    _load_replica, neuropod_path, load_custom_ops, code_zip_path
+                ),
+            )
+
     def forward(self, inputs):
         """
         Run inference using the specifed inputs.
@@ -150,6 +217,15 @@ class PythonNeuropodExecutor(NeuropodExecutor):
         :returns:   A dict mapping output names to values. All the keys
                     in this dict are strings and all the values are numpy arrays.
         """
+        if self.pool is not None:
+            return self.pool.run(inputs)
+
+        return self._run_model(inputs)
+
+    def _run_model(self, inputs):
+        """
+        Run the model in the current process
+        """
         out = self.model(**inputs)
 
         # Make sure everything is a numpy array
@@ -162,3 +238,31 @@ class PythonNeuropodExecutor(NeuropodExecutor):
                 )
 
         return out
+
+    def close(self):
+        """
+        Stop any replica processes
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def __exit__(self, *args):
+        self.close()
+        super(PythonNeuropodExecutor, self).__exit__(*args)
+
+    def __del__(self):
+        # `pool` may not exist if loading the model failed
+        if getattr(self, "pool", None) is not None:
+            self.close()
+
+
+def _load_replica(neuropod_path, load_custom_ops, code_zip_path):
+    """
+    Loads the model in a spawned replica (used to replace forked replicas that exited) and
+    returns the function to run inference with
+    """
+    executor = PythonNeuropodExecutor(
+        neuropod_path, load_custom_ops=load_custom_ops, code_zip_path=code_zip_path
+    )
+    return executor._run_model
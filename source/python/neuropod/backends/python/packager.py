@@ -15,13 +15,22 @@
 import os
 import json
 import shutil
+import subprocess
+import sys
 
-from neuropod.utils.packaging_utils import packager
+from neuropod.utils.packaging_utils import copy_file, copy_tree, packager
 
 
 @packager(platform="python")
 def create_python_neuropod(
-    neuropod_path, data_paths, code_path_spec, entrypoint_package, entrypoint, **kwargs
+    neuropod_path,
+    data_paths,
+    code_path_spec,
+    entrypoint_package,
+    entrypoint,
+    compile_bytecode=False,
+    copy_mode="copy",
+    **kwargs
 ):
     """
     Packages arbitrary python code as a neuropod package.
@@ -78,6 +87,14 @@ def create_python_neuropod(
                                     `entrypoint_package='my.awesome.addition_model'` and
                                     `entrypoint='neuropod_init'`
 
+    :param  compile_bytecode:   Whether or not to include compiled bytecode for the packaged code. This can
+                                be `True` to compile with the current interpreter or the path to the python
+                                binary the neuropod will be run with (python 3.7+). The source is also kept
+                                so the neuropod still runs on other versions of python.
+                                This is most useful along with `package_as_zip` and loading the neuropod
+                                with `use_zipimport=True` as the code is then imported directly from the
+                                zipfile without compiling it.
+
     {common_doc_post}
     """
     neuropod_data_path = os.path.join(neuropod_path, "0", "data")
@@ -88,9 +105,10 @@ def create_python_neuropod(
 
     # Copy the data to be packaged
     for data_path_spec in data_paths:
-        shutil.copyfile(
+        copy_file(
             data_path_spec["path"],
             os.path.join(neuropod_data_path, data_path_spec["packaged_name"]),
+            copy_mode=copy_mode,
         )
 
     # Copy the specified source code while preserving package paths
@@ -105,9 +123,10 @@ def create_python_neuropod(
             )
 
         for dir_to_package in copy_spec["dirs_to_package"]:
-            shutil.copytree(
+            copy_tree(
                 os.path.join(python_root, dir_to_package),
                 os.path.join(neuropod_code_path, dir_to_package),
+                copy_mode=copy_mode,
                 ignore=shutil.ignore_patterns("*.pyc"),
             )
 
@@ -118,6 +137,25 @@ def create_python_neuropod(
                 # We just need to create the file
                 pass
 
+    if compile_bytecode:
+        python_bin = sys.executable if compile_bytecode is True else compile_bytecode
+
+        # Write `.pyc` files next to the sources (where zipimport looks for them). These
+        # are not invalidated based on timestamps because packaging sets a constant
+        # modification time on every file and the code in a neuropod doesn't change.
+        subprocess.check_call(
+            [
+                python_bin,
+                "-m",
+                "compileall",
+                "-q",
+                "-b",
+                "--invalidation-mode",
+                "unchecked-hash",
+                neuropod_code_path,
+            ]
+        )
+
     # We also need to save the entrypoint package name so we know what to load at runtime
     # This is python specific config so it's not saved in the overall neuropod config
     with open(os.path.join(neuropod_path, "0", "config.json"), "w") as config_file:
@@ -20,22 +20,87 @@ import tensorflow as tf
 
 from neuropod.backends.neuropod_executor import NeuropodExecutor
 from neuropod.utils.dtype_utils import get_dtype
-from neuropod.utils.hash_utils import sha256sum
 
 # Avoid loading the same custom op twice
 loaded_op_hashes = set()
 
 
+def get_session_config(
+    intra_op_parallelism_threads,
+    inter_op_parallelism_threads,
+    use_shared_thread_pool,
+    graph_optimizer_level,
+    enable_xla_jit,
+):
+    """
+    Get a TF `ConfigProto` given the load time options passed to the executor
+    """
+    config_proto = (
+        tf.ConfigProto if hasattr(tf, "ConfigProto") else tf.compat.v1.ConfigProto
+    )
+    config = config_proto(
+        intra_op_parallelism_threads=intra_op_parallelism_threads,
+        inter_op_parallelism_threads=inter_op_parallelism_threads,
+    )
+
+    if use_shared_thread_pool:
+        # Sessions with the same `global_name` share a thread pool. This matches the
+        # naming used by the native TF backend
+        pool = config.session_inter_op_thread_pool.add()
+        pool.num_threads = inter_op_parallelism_threads
+        pool.global_name = "neuropod_shared_inter_op_pool_{}".format(
+            inter_op_parallelism_threads
+        )
+
+    optimizer_options = config.graph_options.optimizer_options
+    if graph_optimizer_level is not None:
+        optimizer_options.opt_level = graph_optimizer_level
+
+    if enable_xla_jit:
+        optimizer_options.global_jit_level = optimizer_options.ON_1
+
+        # By default, TF only autoclusters for XLA on GPU. This flag is read when the
+        # graph is first optimized so it must be set before the session runs anything
+        xla_flags = os.environ.get("TF_XLA_FLAGS", "")
+        if "--tf_xla_cpu_global_jit" not in xla_flags:
+            os.environ["TF_XLA_FLAGS"] = (
+                xla_flags + " --tf_xla_cpu_global_jit"
+            ).strip()
+
+    return config
+
+
 class TensorflowNeuropodExecutor(NeuropodExecutor):
     """
     Executes a Tensorflow neuropod
     """
 
-    def __init__(self, neuropod_path, load_custom_ops=True):
+    def __init__(
+        self,
+        neuropod_path,
+        load_custom_ops=True,
+        intra_op_parallelism_threads=0,
+        inter_op_parallelism_threads=0,
+        use_shared_thread_pool=False,
+        graph_optimizer_level=None,
+        enable_xla_jit=False,
+    ):
         """
         Load a Tensorflow neuropod
 
-        :param  neuropod_path:  The path to a python neuropod package
+        :param  neuropod_path:                  The path to a python neuropod package
+        :param  load_custom_ops:                Whether or not to load custom ops included in the model.
+        :param  intra_op_parallelism_threads:   The number of threads used to parallelize a single op.
+                                                `0` lets TensorFlow pick a value (usually the number of cores).
+        :param  inter_op_parallelism_threads:   The number of threads used to run independent ops in parallel.
+                                                `0` lets TensorFlow pick a value (usually the number of cores).
+        :param  use_shared_thread_pool:         Whether to share one inter-op thread pool with every other TF
+                                                neuropod in the process that sets this option (and uses the same
+                                                number of inter-op threads).
+        :param  graph_optimizer_level:          An optional `OptimizerOptions.Level` for the graph optimizer
+                                                (e.g. `0` for L1, the TF default, or `-1` for L0 to disable
+                                                common subexpression elimination and constant folding).
+        :param  enable_xla_jit:                 Whether or not to JIT compile the graph with XLA (including on CPU).
         """
         super(TensorflowNeuropodExecutor, self).__init__(neuropod_path)
 
@@ -43,7 +108,7 @@ class TensorflowNeuropodExecutor(NeuropodExecutor):
         if load_custom_ops and "custom_ops" in self.neuropod_config:
             for op in self.neuropod_config["custom_ops"]:
                 lib_path = os.path.join(neuropod_path, "0", "ops", op)
-                lib_hash = sha256sum(lib_path)
+                lib_hash = self.manifest.get_hash("0/ops/" + op)
                 if lib_hash not in loaded_op_hashes:
                     tf.load_op_library(str(lib_path))
                     loaded_op_hashes.add(lib_hash)
@@ -80,11 +145,55 @@ class TensorflowNeuropodExecutor(NeuropodExecutor):
                 self.graph.get_operation_by_name(op_name) for op_name in init_op_names
             ]
 
+        # Resolve the graph nodes for every tensor in the spec once instead of on every call
+        self.output_tensors = {
+            node["name"]: self.graph.get_tensor_by_name(
+                self.node_name_mapping[node["name"]]
+            )
+            for node in self.neuropod_config["output_spec"]
+        }
+
+        self.input_tensors = {
+            node["name"]: self.graph.get_tensor_by_name(
+                self.node_name_mapping[node["name"]]
+            )
+            for node in self.neuropod_config["input_spec"]
+        }
+
+        # Cached callables keyed by the (sorted) set of input names that are fed
+        # This is similar to `callable_handle_cache_` in the native TF backend
+        self.callable_cache = {}
+
         # Create a session
         session = tf.Session if hasattr(tf, "Session") else tf.compat.v1.Session
-        self.sess = session(graph=self.graph)
+        self.sess = session(
+            graph=self.graph,
+            config=get_session_config(
+                intra_op_parallelism_threads,
+                inter_op_parallelism_threads,
+                use_shared_thread_pool,
+                graph_optimizer_level,
+                enable_xla_jit,
+            ),
+        )
         self.sess.run(init_ops)
 
+    def _get_callable(self, input_names):
+        """
+        Get a callable that feeds `input_names` and fetches all the outputs.
+        This will try to use a cached one if possible
+        """
+        cached = self.callable_cache.get(input_names)
+        if cached is None:
+            # Cache miss...
+            cached = self.sess.make_callable(
+                self.output_tensors,
+                feed_list=[self.input_tensors[name] for name in input_names],
+            )
+            self.callable_cache[input_names] = cached
+
+        return cached
+
     def forward(self, inputs):
         """
         Run inference using the specifed inputs.
@@ -99,39 +208,16 @@ class TensorflowNeuropodExecutor(NeuropodExecutor):
                     in this dict are strings and all the values are numpy arrays.
         """
 
-        # get the input and output nodes
-        output_dict = {}
-        feed_dict = {}
-
-        # Get the output nodes
-        for node in self.neuropod_config["output_spec"]:
-            neuropod_name = node["name"]
-
-            # Get the graph node
-            tf_name = self.node_name_mapping[neuropod_name]
-            tf_node = self.graph.get_tensor_by_name(tf_name)
-
-            # Add it to the output nodes
-            output_dict[neuropod_name] = tf_node
-
-        # Get the input nodes
-        for node in self.neuropod_config["input_spec"]:
-            neuropod_name = node["name"]
-
-            # TODO(yevgeni): treat all input fields as optional at the neuropod level. If a model
-            # requires a missing field it will fail therein.
-            if neuropod_name not in inputs:
-                continue
-
-            # Get the graph node
-            tf_name = self.node_name_mapping[neuropod_name]
-            tf_node = self.graph.get_tensor_by_name(tf_name)
-
-            # Add it to the feed_dict
-            feed_dict[tf_node] = inputs[neuropod_name]
+        # TODO(yevgeni): treat all input fields as optional at the neuropod level. If a model
+        # requires a missing field it will fail therein.
+        input_names = tuple(
+            sorted(name for name in self.input_tensors.keys() if name in inputs)
+        )
 
         # Run inference
-        outputs = self.sess.run(output_dict, feed_dict=feed_dict)
+        outputs = self._get_callable(input_names)(
+            *[inputs[name] for name in input_names]
+        )
 
         # TensorFlow returns string tensors with type object
         for spec in self.neuropod_config["output_spec"]:
@@ -14,10 +14,9 @@
 
 import json
 import os
-import shutil
 import tensorflow as tf
 
-from neuropod.utils.packaging_utils import packager
+from neuropod.utils.packaging_utils import copy_file, packager
 
 
 @packager(platform="tensorflow")
@@ -29,6 +28,7 @@ def create_tensorflow_neuropod(
     frozen_graph_path=None,
     graph_def=None,
     init_op_names=[],
+    copy_mode="copy",
     **kwargs
 ):
     """
@@ -75,7 +75,11 @@ def create_tensorflow_neuropod(
 
     if frozen_graph_path is not None:
         # Copy in the frozen graph
-        shutil.copyfile(frozen_graph_path, os.path.join(neuropod_data_path, "model.pb"))
+        copy_file(
+            frozen_graph_path,
+            os.path.join(neuropod_data_path, "model.pb"),
+            copy_mode=copy_mode,
+        )
     elif graph_def is not None:
         # Write out the frozen graph. tf.io.write_graph is an alias to tf.train.write_graph but is safer
         # as it is also present in tensorflow 2.
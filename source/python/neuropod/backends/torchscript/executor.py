@@ -12,13 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
 import numpy as np
 import os
 from six import string_types
 import torch
 
 from neuropod.backends.neuropod_executor import NeuropodExecutor
-from neuropod.utils.hash_utils import sha256sum
 
 SINGLE_OUTPUT_ERROR_MSG = (
     "Please either return a dictionary from your model or provide an `output_spec` "
@@ -29,6 +29,32 @@ SINGLE_OUTPUT_ERROR_MSG = (
 # Avoid loading the same custom op twice
 loaded_op_hashes = set()
 
+logger = logging.getLogger(__name__)
+
+
+def set_torch_threads(num_threads, num_interop_threads):
+    """
+    Set the number of intra-op and inter-op threads torch uses.
+
+    Note: these are process wide settings
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    if (
+        num_interop_threads is not None
+        and torch.get_num_interop_threads() != num_interop_threads
+    ):
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            # This can only be set once and before any inter-op parallel work has started
+            logger.warning(
+                "Could not set the number of interop threads to {}: {}".format(
+                    num_interop_threads, e
+                )
+            )
+
 
 def isnamedtuple(x):
     """
@@ -57,24 +83,59 @@ class TorchScriptNeuropodExecutor(NeuropodExecutor):
     Executes a TorchScript neuropod
     """
 
-    def __init__(self, neuropod_path, visible_gpu=0, load_custom_ops=True):
+    def __init__(
+        self,
+        neuropod_path,
+        visible_gpu=0,
+        load_custom_ops=True,
+        num_threads=None,
+        num_interop_threads=None,
+        graph_executor_optimize=True,
+        use_inference_mode=False,
+        freeze=False,
+        warmup_inputs=None,
+        warmup_iterations=2,
+    ):
         """
         Load a TorchScript neuropod
 
-        :param  neuropod_path:      The path to a TorchScript neuropod package
-        :param  visible_gpu:        The index of the GPU that this Neuropod should run on (if any).
-                                    This is either `None` or a nonnegative integer. Setting this
-                                    to `None` will attempt to run this model on CPU.
-        :param  load_custom_ops:    Whether or not to load custom ops included in the model.
+        :param  neuropod_path:            The path to a TorchScript neuropod package
+        :param  visible_gpu:              The index of the GPU that this Neuropod should run on (if any).
+                                          This is either `None` or a nonnegative integer. Setting this
+                                          to `None` will attempt to run this model on CPU.
+        :param  load_custom_ops:          Whether or not to load custom ops included in the model.
+        :param  num_threads:              The number of threads torch uses for intra-op parallelism.
+                                          `None` keeps the current value. Note: this is a process wide setting.
+        :param  num_interop_threads:      The number of threads torch uses for inter-op parallelism.
+                                          `None` keeps the current value. Note: this is a process wide setting
+                                          and can only be changed before any inter-op parallel work has started.
+        :param  graph_executor_optimize:  Whether the TorchScript graph executor should run its optimization
+                                          passes (e.g. fusion) on the graph. Disabling this can reduce the latency
+                                          of the first few inference runs at the cost of steady state performance.
+        :param  use_inference_mode:       Whether to run inference under `torch.inference_mode` (if available)
+                                          instead of `torch.no_grad`.
+        :param  freeze:                   Whether to freeze the model with `torch.jit.freeze` and run
+                                          `torch.jit.optimize_for_inference` (if available) at load time.
+        :param  warmup_inputs:            An optional list of input dicts with representative shapes. If set,
+                                          inference is run on each of these `warmup_iterations` times at load
+                                          time so the profiling executor has optimized the graph before the
+                                          first real request.
+        :param  warmup_iterations:        The number of times to run each item in `warmup_inputs`.
         """
         super(TorchScriptNeuropodExecutor, self).__init__(neuropod_path)
         self.visible_gpu = visible_gpu
+        self.graph_executor_optimize = graph_executor_optimize
+        self.use_inference_mode = use_inference_mode and hasattr(
+            torch, "inference_mode"
+        )
+
+        set_torch_threads(num_threads, num_interop_threads)
 
         # Load custom ops (if any)
         if load_custom_ops and "custom_ops" in self.neuropod_config:
             for op in self.neuropod_config["custom_ops"]:
                 lib_path = os.path.join(neuropod_path, "0", "ops", op)
-                lib_hash = sha256sum(lib_path)
+                lib_hash = self.manifest.get_hash("0/ops/" + op)
                 if lib_hash not in loaded_op_hashes:
                     torch.ops.load_library(lib_path)
                     loaded_op_hashes.add(lib_hash)
@@ -96,6 +157,27 @@ class TorchScriptNeuropodExecutor(NeuropodExecutor):
         if len(model_inputs) == 1 and model_inputs[0].type.kind() == "DictType":
             self.model_expects_dictionary = True
 
+        if freeze:
+            # Freezing requires the model to be in eval mode
+            self.model.eval()
+            self.model = torch.jit.freeze(self.model)
+            if hasattr(torch.jit, "optimize_for_inference"):
+                self.model = torch.jit.optimize_for_inference(self.model)
+
+        # Warm up the model
+        for inputs in warmup_inputs or []:
+            for _ in range(warmup_iterations):
+                self.infer(inputs)
+
+    def _grad_context(self):
+        """
+        Get the context manager to run inference in
+        """
+        if self.use_inference_mode:
+            return torch.inference_mode()
+
+        return torch.no_grad()
+
     def _get_torch_device(self, target_device):
         """
         Get a concrete device (e.g. `cuda:0` or `cpu`) given a target (e.g. `CPU` or `GPU`)
@@ -146,7 +228,9 @@ class TorchScriptNeuropodExecutor(NeuropodExecutor):
                 converted_inputs[k] = converted_inputs[k].to(target_device)
 
         # Run inference
-        with torch.no_grad():
+        with self._grad_context(), torch.jit.optimized_execution(
+            self.graph_executor_optimize
+        ):
             if self.model_expects_dictionary:
                 out = self.model(converted_inputs)
             else:
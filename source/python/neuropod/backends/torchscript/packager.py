@@ -13,14 +13,15 @@
 # limitations under the License.
 
 import os
-import shutil
 import torch
 
-from neuropod.utils.packaging_utils import packager
+from neuropod.utils.packaging_utils import copy_file, packager
 
 
 @packager(platform="torchscript")
-def create_torchscript_neuropod(neuropod_path, module=None, module_path=None, **kwargs):
+def create_torchscript_neuropod(
+    neuropod_path, module=None, module_path=None, copy_mode="copy", **kwargs
+):
     """
     Packages a TorchScript model as a neuropod package.
 
@@ -56,7 +57,7 @@ def create_torchscript_neuropod(neuropod_path, module=None, module_path=None, **
     model_path = os.path.join(neuropod_data_path, "model.pt")
     if module_path is not None:
         # Copy in the module
-        shutil.copyfile(module_path, model_path)
+        copy_file(module_path, model_path, copy_mode=copy_mode)
     else:
         # Save the model
         torch.jit.save(module, model_path)
@@ -0,0 +1,69 @@
+# Copyright (c) 2020 UATC, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from neuropod.backends.neuropod_executor import NeuropodExecutor
+from neuropod.utils.worker_pool import WorkerPool
+
+
+class WorkerPoolNeuropodExecutor(NeuropodExecutor):
+    """
+    Executes a neuropod in a pool of persistent worker processes. Tensors are passed to
+    and from the workers using shared memory.
+    """
+
+    def __init__(self, neuropod_path, num_workers, make_forward):
+        """
+        Start the workers and load the neuropod in each of them
+
+        :param  neuropod_path:  The path to a (extracted) neuropod package
+        :param  num_workers:    The number of worker processes to start
+        :param  make_forward:   A picklable callable that loads the neuropod in a worker and returns
+                                its `forward` function
+        """
+        super(WorkerPoolNeuropodExecutor, self).__init__(neuropod_path)
+
+        # Workers are started with a fresh interpreter so they don't inherit any state
+        # (e.g. custom ops or threads) from this process
+        self.pool = WorkerPool(num_workers, make_forward, start_method="spawn")
+
+    def forward(self, inputs):
+        """
+        Run inference using the specifed inputs.
+
+        :param  inputs:     A dict mapping input names to values. This must match the input
+                            spec in the neuropod config for the loaded model.
+                            Ex: {'x1': np.array([5]), 'x2': np.array([6])}
+                            *Note:* all the keys in this dict must be strings and all the
+                            values must be numpy arrays
+
+        :returns:   A dict mapping output names to values. All the keys
+                    in this dict are strings and all the values are numpy arrays.
+        """
+        return self.pool.run(inputs)
+
+    def close(self):
+        """
+        Stop the workers
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        # `pool` may not exist if starting the workers failed
+        if getattr(self, "pool", None) is not None:
+            self.close()
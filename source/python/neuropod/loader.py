@@ -12,13 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import logging
+import multiprocessing
 import os
+import sys
+import threading
+import time
 from neuropod.backends import config_utils
-from neuropod.utils import zip_loader
+from neuropod.utils import manifest_utils, prefetch_utils, zip_loader
 
 from neuropod.registry import _REGISTERED_BACKENDS
 from neuropod.utils.dtype_utils import maybe_convert_bindings_types
 
+logger = logging.getLogger(__name__)
+
+# The stages of loading a neuropod (see `load_neuropods`)
+LOAD_STAGES = ["extract", "verify", "load"]
+
 # Add the script's directory to the PATH so we can find the worker binary
 os.environ["PATH"] += ":" + os.path.dirname(os.path.realpath(__file__))
 
@@ -97,11 +108,18 @@ class NativeNeuropodExecutor:
     Executes a Neuropod using the native bindings
     """
 
-    def __init__(self, neuropod_path, **kwargs):
+    def __init__(
+        self, neuropod_path, warmup_inputs=None, warmup_iterations=2, **kwargs
+    ):
         """
         Load a Neuropod using the native bindings
 
-        :param  neuropod_path:  The path to a neuropod package
+        :param  neuropod_path:      The path to a neuropod package
+        :param  warmup_inputs:      An optional list of input dicts with representative shapes. If set,
+                                    inference is run on each of these `warmup_iterations` times at load
+                                    time (e.g. so TorchScript's profiling executor has optimized the graph
+                                    before the first real request).
+        :param  warmup_iterations:  The number of times to run each item in `warmup_inputs`.
         """
         # Load the model
         from neuropod.neuropod_native import Neuropod as NeuropodNative
@@ -110,6 +128,11 @@ class NativeNeuropodExecutor:
             neuropod_path, _REGISTERED_BACKENDS, use_ope=True, **kwargs
         )
 
+        # Warm up the model
+        for inputs in warmup_inputs or []:
+            for _ in range(warmup_iterations):
+                self.infer(inputs)
+
     @property
     def name(self):
         """
@@ -190,22 +213,216 @@ class NativeNeuropodExecutor:
         pass
 
 
-def load_neuropod(neuropod_path, _always_use_native=False, **kwargs):
+def load_neuropod(neuropod_path, _always_use_native=False, _stage_times=None, **kwargs):
     """
     Load a neuropod package. Returns a NeuropodExecutor
 
-    :param  neuropod_path       The path to a neuropod package
+    :param  neuropod_path       The path to a neuropod package or a zipped neuropod in memory (a bytes-like or
+                                file-like object). Neuropods in memory are extracted directly without writing
+                                the archive to disk first.
     :param  visible_gpu:        The index of the GPU that this Neuropod should run on (if any).
                                 This is either `None` or a nonnegative integer. Setting this
                                 to `None` will attempt to run this model on CPU.
     :param  load_custom_ops:    Whether or not to load custom ops included in the model.
+    :param  use_zipimport:      If `neuropod_path` is a zipped python neuropod, import its code directly
+                                from the zipfile instead of extracting it. Bytecode compiled at packaging
+                                time (see `compile_bytecode` in `create_python_neuropod`) is used if it
+                                matches the running interpreter.
+    :param  num_workers:        If this is greater than 0, the neuropod is loaded in a pool of `num_workers`
+                                persistent worker processes instead of the calling process. Tensors are
+                                passed to and from the workers using shared memory and concurrent calls to
+                                `infer` run in parallel. This provides isolation and parallelism for backends
+                                without native out-of-process execution. Requires python 3.8+.
+    :param  verify_integrity:   Whether to check the files of the neuropod against the hashes in its manifest.
+                                By default, the manifest is trusted and nothing is hashed at load time.
+                                "eager" verifies every file before loading (throwing a ValueError on failure)
+                                and "background" verifies them in a background thread while the model loads
+                                (logging an error on failure).
+    :param  base_neuropod:      If `neuropod_path` is a delta package (see `delta_utils.create_delta_neuropod`),
+                                the path to the neuropod it was created against. The full neuropod is
+                                reconstructed locally before loading it.
+    :param  prefetch_threads:   The number of threads to read the model files (e.g. weights) into the page cache
+                                with while the backend initializes. This speeds up loading when the files aren't
+                                cached yet. Defaults to the value of the `NEUROPOD_PREFETCH_THREADS` environment
+                                variable or 0 (disabled). See `prefetch_utils`
     """
+    # The time spent in each stage (see `LOAD_STAGES`)
+    stage_times = _stage_times if _stage_times is not None else {}
+    stage_start = time.time()
+
+    def end_stage(stage):
+        now = time.time()
+        stage_times[stage] = stage_times.get(stage, 0) + now - stage_start
+        return now
+
+    if zip_loader.is_in_memory(neuropod_path):
+        neuropod_path = zip_loader.open_in_memory(neuropod_path)
+        if _always_use_native:
+            # The native bindings load neuropods out of process so they need a path
+            neuropod_path = zip_loader.extract_neuropod_if_necessary(neuropod_path)
+            stage_start = end_stage("extract")
+
     if _always_use_native:
-        return NativeNeuropodExecutor(neuropod_path, **kwargs)
+        executor = NativeNeuropodExecutor(neuropod_path, **kwargs)
+        end_stage("load")
+        return executor
+
+    num_workers = kwargs.pop("num_workers", 0)
+    use_zipimport = kwargs.pop("use_zipimport", False)
+    verify_integrity = kwargs.pop("verify_integrity", None)
+    base_neuropod = kwargs.pop("base_neuropod", None)
+    prefetch_threads = kwargs.pop("prefetch_threads", None)
+    if use_zipimport and (
+        zip_loader.is_in_memory(neuropod_path)
+        or zip_loader.is_delta_neuropod(neuropod_path)
+    ):
+        # zipimport needs a path and delta packages are always fully reconstructed
+        use_zipimport = False
+
+    zip_path = None
+    if use_zipimport and not os.path.isdir(neuropod_path):
+        zip_path = os.path.abspath(neuropod_path)
 
     # If we were given a zipfile, extract it to a temp dir and use it
-    neuropod_path = zip_loader.extract_neuropod_if_necessary(neuropod_path)
+    neuropod_path = zip_loader.extract_neuropod_if_necessary(
+        neuropod_path, skip_python_code=use_zipimport, base_neuropod=base_neuropod
+    )
+    stage_start = end_stage("extract")
+
+    if verify_integrity == "background" and kwargs.get("num_replicas"):
+        # Forked replicas can't be started while other threads are running
+        verify_integrity = "eager"
+
+    if verify_integrity is not None:
+        manifest_utils.verify_neuropod(neuropod_path, verify_integrity)
+        stage_start = end_stage("verify")
+
+    if prefetch_threads is None:
+        prefetch_threads = prefetch_utils.get_prefetch_threads()
+
+    prefetcher = None
+    if prefetch_threads > 0 and not kwargs.get("num_replicas"):
+        # Forked replicas can't be started while the prefetch threads are running
+        # Read the model files while the backend initializes
+        prefetcher = prefetch_utils.prefetch(neuropod_path, prefetch_threads)
+
+    try:
+        if num_workers > 0:
+            from neuropod.backends.worker_pool_executor import (
+                WorkerPoolNeuropodExecutor,
+            )
+
+            executor = WorkerPoolNeuropodExecutor(
+                neuropod_path,
+                num_workers,
+                functools.partial(_load_forward, neuropod_path, zip_path, kwargs),
+            )
+        else:
+            executor = _load_executor(neuropod_path, zip_path, **kwargs)
+    except Exception:
+        if prefetcher is not None:
+            prefetcher.cancel()
+
+        raise
+
+    end_stage("load")
+    if prefetcher is not None:
+        prefetcher.finish()
+
+    return executor
+
+
+class _LoadStats(object):
+    """
+    Sums up the time spent in each stage of loading several neuropods and logs it once all of them are done
+    """
+
+    def __init__(self, num_neuropods):
+        self.lock = threading.Lock()
+        self.remaining = num_neuropods
+        self.stage_times = {stage: 0 for stage in LOAD_STAGES}
+        self.start_time = time.time()
+
+    def record(self, stage_times):
+        with self.lock:
+            for stage, seconds in stage_times.items():
+                self.stage_times[stage] += seconds
+
+            self.remaining -= 1
+            if self.remaining > 0:
+                return
+
+        dominant = max(LOAD_STAGES, key=lambda stage: self.stage_times[stage])
+        logger.info(
+            "Loaded neuropods in %.3fs. Time spent in each stage (summed across neuropods): %s. The %s stage dominated",
+            time.time() - self.start_time,
+            ", ".join(
+                "{} {:.3f}s".format(stage, self.stage_times[stage])
+                for stage in LOAD_STAGES
+            ),
+            dominant,
+        )
+
 
+def _load_and_record(neuropod_path, stats, kwargs):
+    """
+    Loads a neuropod and records the time spent in each stage
+    """
+    stage_times = {}
+    try:
+        return load_neuropod(neuropod_path, _stage_times=stage_times, **kwargs)
+    finally:
+        stats.record(stage_times)
+
+
+def load_neuropods(neuropod_paths, max_workers=None, **kwargs):
+    """
+    Load several neuropod packages concurrently. Returns a list of `concurrent.futures.Future`s (one for each
+    neuropod, in order) that resolve to NeuropodExecutors. Requires python 3.
+
+    Extracting the packages, starting OPE workers (when using the native bindings) and deserializing the
+    weights of different neuropods overlap instead of running one after the other. Once all the neuropods
+    are loaded, the time spent in each stage is logged.
+
+    :param  neuropod_paths: The neuropods to load. Each one is anything `load_neuropod` accepts.
+    :param  max_workers:    The maximum number of neuropods to load at once. Defaults to the number of CPUs.
+    :param  kwargs:         Passed to `load_neuropod` for every neuropod.
+    """
+    if sys.version_info[0] < 3:
+        raise ValueError("load_neuropods requires python 3")
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    neuropod_paths = list(neuropod_paths)
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(neuropod_paths))))
+    stats = _LoadStats(len(neuropod_paths))
+    futures = [
+        pool.submit(_load_and_record, neuropod_path, stats, kwargs)
+        for neuropod_path in neuropod_paths
+    ]
+
+    # Don't wait for the neuropods to load. The threads exit once they're done
+    pool.shutdown(wait=False)
+    return futures
+
+
+def _load_forward(neuropod_path, zip_path, kwargs):
+    """
+    Loads an extracted neuropod in a worker process and returns its `forward` function
+    """
+    return _load_executor(neuropod_path, zip_path, **kwargs).forward
+
+
+def _load_executor(neuropod_path, zip_path, **kwargs):
+    """
+    Loads an extracted neuropod in the current process
+
+    :param  neuropod_path:  The path to an extracted neuropod package
+    :param  zip_path:       If set, the zipfile to import the code of python neuropods from
+    """
     # Figure out what type of neuropod this is
     neuropod_config = config_utils.read_neuropod_config(neuropod_path)
     platform = neuropod_config["platform"]
@@ -213,6 +430,9 @@ def load_neuropod(neuropod_path, _always_use_native=False, **kwargs):
     if platform == "python":
         from neuropod.backends.python.executor import PythonNeuropodExecutor
 
+        if zip_path is not None:
+            kwargs["code_zip_path"] = zip_path
+
         return PythonNeuropodExecutor(neuropod_path, **kwargs)
     elif platform == "torchscript":
         from neuropod.backends.torchscript.executor import TorchScriptNeuropodExecutor
@@ -233,7 +453,7 @@ def load_neuropod(neuropod_path, _always_use_native=False, **kwargs):
     elif platform == "caffe2":
         from neuropod.backends.caffe2.executor import Caffe2NeuropodExecutor
 
-        return Caffe2NeuropodExecutor(neuropod_path, **kwargs)       
+        return Caffe2NeuropodExecutor(neuropod_path, **kwargs)
     elif platform == "mxnet":
         from neuropod.backends.mxnet.executor import MxnetNeuropodExecutor
 
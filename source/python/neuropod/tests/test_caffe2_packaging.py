@@ -20,6 +20,7 @@ from testpath.tempdir import TemporaryDirectory
 from caffe2.python.predictor import mobile_exporter
 from caffe2.python import model_helper, workspace
 
+from neuropod.loader import load_neuropod
 from neuropod.packagers import create_caffe2_neuropod
 from neuropod.tests.utils import (
     get_addition_model_spec,
@@ -53,7 +54,7 @@ def SaveNet(INIT_NET, PREDICT_NET, workspace, model):
 @unittest.skipIf(RUN_NATIVE_TESTS,
                  "ONNX are not supported by the native bindings")
 class TestCaffe2Packaging(unittest.TestCase):
-    def package_simple_addition_model(self, do_fail=False):
+    def package_simple_addition_model(self, do_fail=False, check_fn=None):
         with TemporaryDirectory() as test_dir:
             neuropod_path = os.path.join(test_dir, "test_neuropod")
 
@@ -78,6 +79,9 @@ class TestCaffe2Packaging(unittest.TestCase):
             # Run some additional checks
             check_addition_model(neuropod_path)
 
+            if check_fn is not None:
+                check_fn(neuropod_path)
+
     def test_simple_addition_model(self):
         # Tests a case where packaging works correctly and
         # the model output matches the expected output
@@ -88,6 +92,23 @@ class TestCaffe2Packaging(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.package_simple_addition_model(do_fail=True)
 
+    def test_multiple_models(self):
+        # Tests that several Caffe2 models can be loaded and run in one process
+        # without touching the global workspaces
+        def check_fn(neuropod_path):
+            num_workspaces = len(workspace.Workspaces())
+            first = load_neuropod(neuropod_path)
+            second = load_neuropod(neuropod_path)
+            self.assertEqual(len(workspace.Workspaces()), num_workspaces)
+
+            spec = get_addition_model_spec()
+            for model in [first, second, first]:
+                out = model.infer(spec["test_input_data"])
+                np.testing.assert_equal(out["out"],
+                                        spec["test_expected_out"]["out"])
+
+        self.package_simple_addition_model(check_fn=check_fn)
+
 
 if __name__ == "__main__":
     unittest.main()
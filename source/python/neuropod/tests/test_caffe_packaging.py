@@ -17,6 +17,7 @@ import os
 import unittest
 from testpath.tempdir import TemporaryDirectory
 
+from neuropod.loader import load_neuropod
 from neuropod.packagers import create_caffe_neuropod
 from neuropod.tests.utils import (
     get_addition_model_spec,
@@ -79,7 +80,7 @@ class AdditionLayer(caffe.Layer):
 @unittest.skipIf(RUN_NATIVE_TESTS,
                  "Caffe are not supported by the native bindings")
 class TestCaffePackaging(unittest.TestCase):
-    def package_simple_addition_model(self, do_fail=False):
+    def package_simple_addition_model(self, do_fail=False, check_fn=None):
         with TemporaryDirectory() as test_dir:
             neuropod_path = os.path.join(test_dir, "test_neuropod")
             model_code_dir = os.path.join(test_dir, "model_code")
@@ -111,6 +112,9 @@ class TestCaffePackaging(unittest.TestCase):
             # Run some additional checks
             check_addition_model(neuropod_path)
 
+            if check_fn is not None:
+                check_fn(neuropod_path)
+
     def test_simple_addition_model(self):
         # Tests a case where packaging works correctly and
         # the model output matches the expected output
@@ -121,6 +125,59 @@ class TestCaffePackaging(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.package_simple_addition_model(do_fail=True)
 
+    def test_variable_batch_size(self):
+        # Tests running the model with several batch sizes that differ from the
+        # batch size in the prototxt
+        def check_fn(neuropod_path):
+            model = load_neuropod(neuropod_path)
+            outputs = []
+            for size in [5, 3, 200, 5]:
+                x = np.arange(size, dtype=np.float32)
+                y = np.ones(size, dtype=np.float32)
+                out = model.infer({"x": x, "y": y})
+                np.testing.assert_equal(out["out"], x + y)
+                outputs.append((out["out"], x + y))
+
+            # Outputs are copied by default so they aren't overwritten by later calls
+            for out, expected in outputs:
+                np.testing.assert_equal(out, expected)
+
+        self.package_simple_addition_model(check_fn=check_fn)
+
+    def test_output_views(self):
+        # Tests returning views of the output blobs instead of copies
+        def check_fn(neuropod_path):
+            model = load_neuropod(neuropod_path, copy_outputs=False)
+            x = np.arange(5, dtype=np.float32)
+            first = model.infer({
+                "x": x,
+                "y": np.ones(5, dtype=np.float32)
+            })["out"]
+            np.testing.assert_equal(first, x + 1)
+
+            # The next call with the same shapes writes into the same blob
+            second = model.infer({
+                "x": x,
+                "y": np.full(5, 2, dtype=np.float32)
+            })["out"]
+            np.testing.assert_equal(second, x + 2)
+            self.assertTrue(np.shares_memory(first, second))
+
+            # Nets for recently used shapes are kept, so switching back to a previous
+            # shape reuses its blobs
+            model.infer({
+                "x": np.arange(3, dtype=np.float32),
+                "y": np.ones(3, dtype=np.float32)
+            })
+            third = model.infer({
+                "x": x,
+                "y": np.full(5, 3, dtype=np.float32)
+            })["out"]
+            np.testing.assert_equal(third, x + 3)
+            self.assertTrue(np.shares_memory(first, third))
+
+        self.package_simple_addition_model(check_fn=check_fn)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,127 @@
+# Copyright (c) 2020 UATC, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import hashlib
+import os
+import shutil
+import unittest
+import zipfile
+from testpath.tempdir import TemporaryDirectory
+
+from neuropod.utils import content_store
+
+
+def make_zip(path, files):
+    manifest = {}
+    with zipfile.ZipFile(path, "w") as z:
+        for name, contents in files.items():
+            z.writestr(name, contents)
+            manifest[name] = {
+                "sha256": hashlib.sha256(contents).hexdigest(),
+                "size": len(contents),
+            }
+
+    return manifest
+
+
+class TestContentStore(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = TemporaryDirectory()
+        self.tmp = self.test_dir.__enter__()
+        self.store_dir = os.path.join(self.tmp, "store")
+
+    def tearDown(self):
+        self.test_dir.__exit__(None, None, None)
+
+    def extract(self, name, files, manifest=None):
+        zip_path = os.path.join(self.tmp, name + ".zip")
+        dest = os.path.join(self.tmp, name)
+        expected_manifest = make_zip(zip_path, files)
+        with zipfile.ZipFile(zip_path) as z:
+            content_store.extract(
+                z, dest, manifest or expected_manifest, store_dir=self.store_dir
+            )
+
+        return dest
+
+    def test_shared_files(self):
+        weights = b"a" * 1000
+        first = self.extract(
+            "first", {"0/data/weights.bin": weights, "config.json": b"1"}
+        )
+        second = self.extract(
+            "second", {"0/data/weights.bin": weights, "config.json": b"2"}
+        )
+
+        # The weights are stored once and linked into both neuropods
+        first_weights = os.path.join(first, "0", "data", "weights.bin")
+        second_weights = os.path.join(second, "0", "data", "weights.bin")
+        self.assertTrue(os.path.samefile(first_weights, second_weights))
+        self.assertEqual(os.stat(first_weights).st_nlink, 3)
+        with open(second_weights, "rb") as f:
+            self.assertEqual(f.read(), weights)
+
+        # Other files aren't stored
+        self.assertFalse(
+            os.path.samefile(
+                os.path.join(first, "config.json"), os.path.join(second, "config.json")
+            )
+        )
+        self.assertEqual(len(os.listdir(self.store_dir)), 1)
+
+        # Files are only removed once no neuropod uses them
+        self.assertEqual(content_store.gc(self.store_dir), 0)
+        shutil.rmtree(first)
+        self.assertEqual(content_store.gc(self.store_dir), 0)
+        shutil.rmtree(second)
+        self.assertEqual(content_store.gc(self.store_dir), len(weights))
+        self.assertEqual(os.listdir(self.store_dir), [])
+
+    def test_hash_mismatch(self):
+        manifest = {
+            "0/data/weights.bin": {"sha256": "0" * 64, "size": 4},
+        }
+        dest = self.extract("bad", {"0/data/weights.bin": b"data"}, manifest)
+
+        # The file is extracted but not added to the store
+        with open(os.path.join(dest, "0", "data", "weights.bin"), "rb") as f:
+            self.assertEqual(f.read(), b"data")
+
+        self.assertEqual(os.listdir(self.store_dir), [])
+
+    def test_gc_without_store(self):
+        # Nothing was added to the store yet
+        self.assertEqual(content_store.gc(self.store_dir), 0)
+
+    def test_different_filesystem(self):
+        def link(src, dst):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+        original_link = os.link
+        os.link = link
+        try:
+            dest = self.extract("first", {"0/data/weights.bin": b"data"})
+        finally:
+            os.link = original_link
+
+        # The file is extracted without the store
+        with open(os.path.join(dest, "0", "data", "weights.bin"), "rb") as f:
+            self.assertEqual(f.read(), b"data")
+
+        self.assertEqual(os.listdir(self.store_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
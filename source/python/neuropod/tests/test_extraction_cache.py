@@ -0,0 +1,141 @@
+# Copyright (c) 2020 UATC, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fcntl
+import os
+import shutil
+import time
+import unittest
+import zipfile
+from multiprocessing.pool import ThreadPool
+from testpath.tempdir import TemporaryDirectory
+
+from neuropod.utils import extraction_cache
+
+
+def make_zip(path, contents):
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("data.bin", contents)
+
+
+class TestExtractionCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = TemporaryDirectory()
+        self.tmp = self.test_dir.__enter__()
+        self.cache_dir = os.path.join(self.tmp, "cache")
+
+    def tearDown(self):
+        extraction_cache.release_all()
+        self.test_dir.__exit__(None, None, None)
+
+    def test_reuse(self):
+        first = os.path.join(self.tmp, "first.zip")
+        second = os.path.join(self.tmp, "second.zip")
+        make_zip(first, b"a" * 100)
+        make_zip(second, b"a" * 100)
+
+        # Identical archives share an entry
+        path = extraction_cache.extract_to_cache(first, self.cache_dir)
+        self.assertEqual(
+            path, extraction_cache.extract_to_cache(second, self.cache_dir)
+        )
+
+        with open(os.path.join(path, "data.bin"), "rb") as f:
+            self.assertEqual(f.read(), b"a" * 100)
+
+        # No temporary directories are left behind
+        self.assertEqual(
+            sorted(n for n in os.listdir(self.cache_dir) if not n.startswith(".")),
+            sorted([os.path.basename(path), os.path.basename(path) + ".lock"]),
+        )
+
+    def test_concurrent_extraction(self):
+        # Tests extracting the same archive from several threads at once
+        zip_path = os.path.join(self.tmp, "first.zip")
+        make_zip(zip_path, b"a" * 1000)
+
+        pool = ThreadPool(8)
+        try:
+            paths = pool.map(
+                lambda _: extraction_cache.extract_to_cache(zip_path, self.cache_dir),
+                range(16),
+            )
+        finally:
+            pool.close()
+
+        self.assertEqual(len(set(paths)), 1)
+
+        # Only one lock is held for the entry
+        self.assertEqual(len(extraction_cache._HELD_LOCKS), 1)
+
+    def test_eviction(self):
+        paths = []
+        for i in range(3):
+            zip_path = os.path.join(self.tmp, "{}.zip".format(i))
+            make_zip(zip_path, str(i).encode("ascii") * 1000)
+            paths.append(extraction_cache.extract_to_cache(zip_path, self.cache_dir))
+
+            # Make sure the mtimes are distinct
+            os.utime(paths[-1], (time.time() - 10 + i, time.time() - 10 + i))
+
+        # Entries used by this process are never evicted
+        extraction_cache.evict(self.cache_dir, 0)
+        self.assertTrue(all(os.path.isdir(p) for p in paths))
+
+        # Simulate another process using the newest entry
+        extraction_cache.release_all()
+        fd = os.open(paths[2] + ".lock", os.O_RDWR)
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        try:
+            # Each entry is 1000 bytes so this evicts one entry: the oldest goes first
+            extraction_cache.evict(self.cache_dir, 2500)
+            self.assertFalse(os.path.exists(paths[0]))
+            self.assertTrue(os.path.isdir(paths[1]))
+            self.assertTrue(os.path.isdir(paths[2]))
+
+            # The in-use entry survives even when everything should be evicted
+            extraction_cache.evict(self.cache_dir, 0)
+            self.assertFalse(os.path.exists(paths[1]))
+            self.assertTrue(os.path.isdir(paths[2]))
+        finally:
+            os.close(fd)
+
+    def test_concurrent_removal(self):
+        # Tests that entries removed by other processes while evicting are skipped
+        zip_path = os.path.join(self.tmp, "first.zip")
+        make_zip(zip_path, b"a" * 1000)
+        path = extraction_cache.extract_to_cache(zip_path, self.cache_dir)
+
+        # Simulate an extraction that another process renames into place during the scan
+        tmpdir = os.path.join(self.cache_dir, "abc" + extraction_cache.TMP_SUFFIX + "1")
+        os.makedirs(tmpdir)
+        dir_size = extraction_cache._dir_size
+
+        def remove_and_get_size(scanned):
+            if scanned == tmpdir:
+                shutil.rmtree(tmpdir)
+
+            return dir_size(scanned)
+
+        extraction_cache._dir_size = remove_and_get_size
+        try:
+            extraction_cache.evict(self.cache_dir, 0)
+        finally:
+            extraction_cache._dir_size = dir_size
+
+        self.assertTrue(os.path.isdir(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
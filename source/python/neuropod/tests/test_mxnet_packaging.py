@@ -19,6 +19,7 @@ from testpath.tempdir import TemporaryDirectory
 import mxnet as mx
 from mxnet.gluon import nn
 
+from neuropod.loader import load_neuropod
 from neuropod.packagers import create_mxnet_neuropod
 from neuropod.tests.utils import (
     get_addition_model_spec,
@@ -69,6 +70,38 @@ class TestMXNetPackaging(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.package_simple_addition_model(do_fail=True)
 
+    def test_static_shapes(self):
+        # Tests running a hybridized model with inputs of several different shapes
+        with TemporaryDirectory() as test_dir:
+            neuropod_path = os.path.join(test_dir, "test_neuropod")
+
+            net = AdditionModel()
+            net.initialize()
+            net.hybridize()
+            net.forward(mx.nd.array([1, 2, 3]), mx.nd.array([1, 2, 3]))
+
+            create_mxnet_neuropod(
+                neuropod_path=neuropod_path,
+                model_name="addition_model",
+                module=net,
+                input_names=['data0', 'data1'],
+                **get_addition_model_spec())
+
+            # Only the first shape gets a static shape copy of the model
+            neuropod = load_neuropod(neuropod_path,
+                                     static_alloc=True,
+                                     static_shape=True,
+                                     max_cached_shapes=1)
+
+            for size in [3, 5, 3]:
+                x = np.arange(size, dtype=np.float32)
+                y = np.ones(size, dtype=np.float32)
+                out = neuropod.infer({"x": x, "y": y})
+                np.testing.assert_equal(out["out"], x + y)
+
+                # The inputs should not have been modified
+                self.assertTrue(x.flags["WRITEABLE"])
+
 
 if __name__ == "__main__":
     unittest.main()
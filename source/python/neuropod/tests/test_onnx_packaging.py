@@ -19,11 +19,13 @@ from testpath.tempdir import TemporaryDirectory
 from onnx import helper, TensorProto
 
 from neuropod.packagers import create_onnx_neuropod
+from neuropod.loader import load_neuropod
 from neuropod.tests.utils import (
     get_addition_model_spec,
     check_addition_model,
 )
 from neuropod.utils.eval_utils import RUN_NATIVE_TESTS
+from neuropod.utils.hash_utils import sha256sum
 
 
 def create_onnx_addition_model():
@@ -76,6 +78,50 @@ class TestONNXPackaging(unittest.TestCase):
         # the model output matches the expected output
         self.package_simple_addition_model()
 
+    def test_session_options(self):
+        # Packages a model and loads it with custom session options
+        with TemporaryDirectory() as test_dir:
+            neuropod_path = os.path.join(test_dir, "test_neuropod")
+            spec = get_addition_model_spec()
+
+            create_onnx_neuropod(neuropod_path=neuropod_path,
+                                 model_name="addition_model",
+                                 onnx_model=create_onnx_addition_model(),
+                                 node_name_mapping={
+                                     "x": "X",
+                                     "y": "Y",
+                                     "out": "Z",
+                                 },
+                                 package_as_zip=False,
+                                 **spec)
+
+            data_dir = os.path.join(neuropod_path, "0", "data")
+            data_files = sorted(os.listdir(data_dir))
+            cache_dir = os.path.join(test_dir, "cache")
+
+            # The first load writes the optimized model and the second one uses it
+            for use_io_binding in [True, False]:
+                neuropod = load_neuropod(neuropod_path,
+                                         intra_op_parallelism_threads=1,
+                                         execution_mode="parallel",
+                                         graph_optimization_level="basic",
+                                         optimized_model_cache_dir=cache_dir,
+                                         use_io_binding=use_io_binding)
+                out = neuropod.infer(spec["test_input_data"])
+                np.testing.assert_equal(out["out"],
+                                        spec["test_expected_out"]["out"])
+
+            # The cache is keyed on the hash of the model and the package is unchanged
+            cached = os.listdir(cache_dir)
+            self.assertEqual(len(cached), 1)
+            self.assertTrue(cached[0].startswith(
+                sha256sum(os.path.join(data_dir, "model.pb"))))
+            self.assertTrue(cached[0].endswith(".basic.onnx"))
+            self.assertEqual(sorted(os.listdir(data_dir)), data_files)
+
+            with self.assertRaises(ValueError):
+                load_neuropod(neuropod_path, execution_mode="invalid")
+
     def test_simple_addition_model_failure(self):
         # Tests a case where the output does not match the expected output
         with self.assertRaises(ValueError):
@@ -0,0 +1,69 @@
+# Copyright (c) 2020 UATC, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import unittest
+from testpath.tempdir import TemporaryDirectory
+
+from neuropod.utils import prefetch_utils
+
+
+class TestPrefetch(unittest.TestCase):
+    def test_prefetch(self):
+        with TemporaryDirectory() as neuropod_path:
+            data_path = os.path.join(neuropod_path, "0", "data")
+            os.makedirs(data_path)
+            files = {"model.pt": 3000000, "model-0000.params": 1000, "other.bin": 5000}
+            for name, size in files.items():
+                with open(os.path.join(data_path, name), "wb") as f:
+                    f.write(os.urandom(size))
+
+            prefetcher = prefetch_utils.prefetch(neuropod_path, num_threads=4)
+
+            # Wait for all the threads to finish
+            while prefetcher.end_time is None:
+                time.sleep(0.01)
+
+            # Only the files that backends load are read
+            self.assertEqual(
+                prefetcher.bytes_read, files["model.pt"] + files["model-0000.params"]
+            )
+            self.assertEqual(prefetcher.finish(), prefetcher.bytes_read)
+
+    def test_finish_cancels(self):
+        with TemporaryDirectory() as neuropod_path:
+            data_path = os.path.join(neuropod_path, "0", "data")
+            os.makedirs(data_path)
+            path = os.path.join(data_path, "model.pt")
+            with open(path, "wb") as f:
+                f.write(os.urandom(100000))
+
+            # Use tiny chunks so the prefetch is still running when it's finished
+            prefetcher = prefetch_utils.Prefetcher([path], num_threads=2, chunk_size=1)
+            prefetcher.finish()
+
+            # The threads should stop without reading the rest of the file
+            while prefetcher.end_time is None:
+                time.sleep(0.01)
+
+            self.assertLess(prefetcher.bytes_read, prefetcher.bytes_total)
+
+    def test_nothing_to_prefetch(self):
+        with TemporaryDirectory() as neuropod_path:
+            self.assertIsNone(prefetch_utils.prefetch(neuropod_path, num_threads=4))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,13 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
+import json
 import os
 import numpy as np
+import shutil
+import sys
+import threading
 import unittest
+import zipfile
+from multiprocessing.pool import ThreadPool
 from testpath.tempdir import TemporaryDirectory
 
+from neuropod.loader import load_neuropod, load_neuropods
 from neuropod.packagers import create_python_neuropod
 from neuropod.tests.utils import get_addition_model_spec, check_addition_model
+from neuropod.utils import delta_utils, manifest_utils, packaging_utils, zip_loader
+from neuropod.utils.eval_utils import RUN_NATIVE_TESTS
+from neuropod.utils.hash_utils import sha256sum, sha256sum_dir
 
 ADDITION_MODEL_SOURCE = """
 import sys
@@ -47,7 +58,9 @@ def get_model(_):
 
 
 class TestPythonPackaging(unittest.TestCase):
-    def package_simple_addition_model(self, do_fail=False):
+    def package_simple_addition_model(
+        self, do_fail=False, check_fn=None, data_paths=None, **kwargs
+    ):
         with TemporaryDirectory() as test_dir:
             neuropod_path = os.path.join(test_dir, "test_neuropod")
             model_code_dir = os.path.join(test_dir, "model_code")
@@ -62,7 +75,7 @@ class TestPythonPackaging(unittest.TestCase):
             create_python_neuropod(
                 neuropod_path=neuropod_path,
                 model_name="addition_model",
-                data_paths=[],
+                data_paths=data_paths or [],
                 code_path_spec=[
                     {
                         "python_root": model_code_dir,
@@ -74,12 +87,15 @@ class TestPythonPackaging(unittest.TestCase):
                 entrypoint_package="addition_model",
                 entrypoint="get_model",
                 # Get the input/output spec along with test data
-                **get_addition_model_spec(do_fail=do_fail)
+                **dict(get_addition_model_spec(do_fail=do_fail), **kwargs)
             )
 
             # Run some additional checks
             check_addition_model(neuropod_path)
 
+            if check_fn is not None:
+                check_fn(neuropod_path)
+
     def test_simple_addition_model(self):
         # Tests a case where packaging works correctly and
         # the model output matches the expected output
@@ -90,6 +106,505 @@ class TestPythonPackaging(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.package_simple_addition_model(do_fail=True)
 
+    @unittest.skipIf(
+        RUN_NATIVE_TESTS or sys.version_info < (3, 8) or not hasattr(os, "fork"),
+        "Forked replicas require python 3.8+ with fork and are not used by the native bindings",
+    )
+    def test_forked_replicas(self):
+        # Tests running concurrent requests across forked replicas of a model
+        def check_fn(neuropod_path):
+            with load_neuropod(neuropod_path, num_replicas=2) as model:
+
+                def run(size):
+                    x = np.arange(size, dtype=np.float32)
+                    y = np.full(size, size, dtype=np.float32)
+                    out = model.infer({"x": x, "y": y})
+                    np.testing.assert_equal(out["out"], x + y)
+
+                pool = ThreadPool(4)
+                try:
+                    pool.map(run, [0, 1, 10, 1000, 5, 100000, 3, 7])
+                finally:
+                    pool.close()
+
+        self.package_simple_addition_model(check_fn=check_fn)
+
+    @unittest.skipIf(
+        RUN_NATIVE_TESTS or sys.version_info < (3, 8) or not hasattr(os, "fork"),
+        "Forked replicas require python 3.8+ with fork and are not used by the native bindings",
+    )
+    def test_forked_replicas_with_threads(self):
+        def check_fn(neuropod_path):
+            # Forking while other threads are running is unsafe so it should fail
+            done = threading.Event()
+            thread = threading.Thread(target=done.wait)
+            thread.start()
+            try:
+                with self.assertRaises(RuntimeError):
+                    load_neuropod(neuropod_path, num_replicas=1)
+            finally:
+                done.set()
+                thread.join()
+
+            # These start threads while loading so they should be adjusted to allow forking
+            with load_neuropod(
+                neuropod_path,
+                num_replicas=1,
+                prefetch_threads=2,
+                verify_integrity="background",
+            ) as model:
+                spec = get_addition_model_spec()
+                out = model.infer(spec["test_input_data"])
+                np.testing.assert_equal(out["out"], spec["test_expected_out"]["out"])
+
+        self.package_simple_addition_model(check_fn=check_fn)
+
+    @unittest.skipIf(RUN_NATIVE_TESTS, "Not applicable to the native bindings")
+    def test_shared_code(self):
+        # Tests that instances of neuropods with identical code share imported modules
+        def check_fn(neuropod_path):
+            first = load_neuropod(neuropod_path)
+            second = load_neuropod(neuropod_path)
+            self.assertEqual(first.model.__module__, second.model.__module__)
+
+            spec = get_addition_model_spec()
+            for model in [first, second]:
+                out = model.infer(spec["test_input_data"])
+                np.testing.assert_equal(out["out"], spec["test_expected_out"]["out"])
+
+        self.package_simple_addition_model(check_fn=check_fn)
+
+    @unittest.skipIf(RUN_NATIVE_TESTS, "Not applicable to the native bindings")
+    def test_dangling_code_symlink(self):
+        # Tests loading a neuropod whose code symlink was left behind by a deleted neuropod
+        def check_fn(neuropod_path):
+            from neuropod.backends.python import executor
+
+            code_id = "code_" + sha256sum_dir(os.path.join(neuropod_path, "0", "code"))
+            symlink_path = os.path.join(executor.SYMLINKS_DIR, code_id)
+            if os.path.lexists(symlink_path):
+                os.unlink(symlink_path)
+
+            os.symlink(os.path.join(neuropod_path, "deleted"), symlink_path)
+            for name in list(sys.modules):
+                if name == code_id or name.startswith(code_id + "."):
+                    del sys.modules[name]
+
+            spec = get_addition_model_spec()
+            out = load_neuropod(neuropod_path).infer(spec["test_input_data"])
+            np.testing.assert_equal(out["out"], spec["test_expected_out"]["out"])
+            self.assertTrue(os.path.exists(symlink_path))
+
+        self.package_simple_addition_model(check_fn=check_fn, package_as_zip=False)
+
+    @unittest.skipIf(
+        RUN_NATIVE_TESTS or sys.version_info < (3, 7),
+        "Not applicable to the native bindings",
+    )
+    def test_zipimport(self):
+        # Tests importing precompiled code directly from a zipped neuropod
+        def check_fn(neuropod_path):
+            model = load_neuropod(neuropod_path, use_zipimport=True)
+
+            # The code should not have been extracted
+            self.assertFalse(
+                os.path.exists(os.path.join(model.neuropod_path, "0", "code"))
+            )
+
+            spec = get_addition_model_spec()
+            out = model.infer(spec["test_input_data"])
+            np.testing.assert_equal(out["out"], spec["test_expected_out"]["out"])
+
+        self.package_simple_addition_model(
+            check_fn=check_fn, package_as_zip=True, compile_bytecode=True
+        )
+
+    @unittest.skipIf(
+        RUN_NATIVE_TESTS or sys.version_info < (3, 6),
+        "Not applicable to the native bindings",
+    )
+    def test_mmap_data(self):
+        # Tests mapping uncompressed data files directly from a zipped neuropod
+        contents = {"large.bin": os.urandom(10000), "small.bin": b"small"}
+
+        def check_fn(neuropod_path):
+            with zipfile.ZipFile(neuropod_path) as zf:
+                # All the CRCs should be valid
+                self.assertIsNone(zf.testzip())
+                index = json.loads(zf.read(zip_loader.DATA_INDEX_NAME).decode("utf-8"))
+
+            # The files can be read directly from the archive at the offsets in the index
+            self.assertEqual(len(index["files"]), len(contents))
+            with open(neuropod_path, "rb") as f:
+                for name, expected in contents.items():
+                    item = index["files"][os.path.join("0", "data", name)]
+                    self.assertEqual(item["offset"] % 4096, 0)
+                    self.assertEqual(item["size"], len(expected))
+                    f.seek(item["offset"])
+                    self.assertEqual(f.read(item["size"]), expected)
+
+            # The model should still load and run
+            check_addition_model(neuropod_path)
+
+        with TemporaryDirectory() as data_dir:
+            data_paths = []
+            for name, value in contents.items():
+                with open(os.path.join(data_dir, name), "wb") as f:
+                    f.write(value)
+
+                data_paths.append(
+                    {"path": os.path.join(data_dir, name), "packaged_name": name}
+                )
+
+            self.package_simple_addition_model(
+                check_fn=check_fn,
+                data_paths=data_paths,
+                package_as_zip=True,
+                mmap_data=True,
+            )
+
+    @unittest.skipIf(RUN_NATIVE_TESTS, "Not applicable to the native bindings")
+    def test_manifest(self):
+        # Tests that the manifest matches the packaged files and is used to verify them
+        def check_fn(neuropod_path):
+            manifest = manifest_utils.Manifest(neuropod_path)
+            code_path = os.path.join(neuropod_path, "0", "code")
+            self.assertEqual(
+                manifest.get_hash("0/code/addition_model.py"),
+                sha256sum(os.path.join(code_path, "addition_model.py")),
+            )
+            self.assertEqual(
+                manifest.get_dir_hash(zip_loader.PYTHON_CODE_PREFIX),
+                sha256sum_dir(code_path),
+            )
+
+            # Importing the code writes bytecode, which shouldn't change the hash
+            code_hash = sha256sum_dir(code_path)
+            pycache_path = os.path.join(code_path, "__pycache__")
+            os.makedirs(pycache_path)
+            with open(
+                os.path.join(pycache_path, "addition_model.cpython-38.pyc"), "wb"
+            ) as f:
+                f.write(b"bytecode")
+
+            self.assertEqual(sha256sum_dir(code_path), code_hash)
+
+            manifest_utils.verify_neuropod(neuropod_path, "eager")
+            load_neuropod(neuropod_path, verify_integrity="background").infer(
+                {
+                    "x": np.arange(5, dtype=np.float32),
+                    "y": np.arange(5, dtype=np.float32),
+                }
+            )
+
+            # Corrupt a file
+            with open(os.path.join(code_path, "addition_model.py"), "a") as f:
+                f.write("# Modified")
+
+            with self.assertRaises(ValueError):
+                load_neuropod(neuropod_path, verify_integrity="eager")
+
+            with self.assertLogs(manifest_utils.logger, "ERROR"):
+                manifest_utils.verify_neuropod(neuropod_path, "background").join()
+
+        self.package_simple_addition_model(check_fn=check_fn, package_as_zip=False)
+
+    @unittest.skipIf(sys.version_info < (3,), "Requires python 3")
+    def test_copy_mode(self):
+        # Tests linking input files instead of copying them
+        outputs = []
+
+        def save_output(neuropod_path):
+            with open(neuropod_path, "rb") as f:
+                outputs.append(f.read())
+
+        with TemporaryDirectory() as data_dir:
+            data_file = os.path.join(data_dir, "data.bin")
+            with open(data_file, "wb") as f:
+                f.write(os.urandom(10000))
+
+            os.utime(data_file, (1000, 1000))
+            data_paths = [{"path": data_file, "packaged_name": "data.bin"}]
+
+            # Zipping directly from the original files should produce the same output as
+            # zipping copies of them (and shouldn't modify the originals)
+            for copy_mode in ["copy", "hardlink", "reflink"]:
+                self.package_simple_addition_model(
+                    check_fn=save_output,
+                    data_paths=data_paths,
+                    package_as_zip=True,
+                    copy_mode=copy_mode,
+                )
+
+            self.assertEqual(outputs[0], outputs[1])
+            self.assertEqual(outputs[0], outputs[2])
+            self.assertEqual(os.stat(data_file).st_mtime, 1000)
+
+            def check_fn(neuropod_path):
+                self.assertTrue(
+                    os.path.samefile(
+                        os.path.join(neuropod_path, "0", "data", "data.bin"), data_file
+                    )
+                )
+
+            self.package_simple_addition_model(
+                check_fn=check_fn,
+                data_paths=data_paths,
+                package_as_zip=False,
+                copy_mode="hardlink",
+            )
+
+    @unittest.skipIf(RUN_NATIVE_TESTS, "Not applicable to the native bindings")
+    def test_compression(self):
+        # Tests per-pattern compression rules and that the output doesn't depend on the
+        # number of threads used to compress it
+        compression = [
+            {"pattern": "0/code/*", "method": "stored"},
+            {"pattern": "*.json", "method": "deflated", "level": 9},
+        ]
+
+        outputs = []
+
+        def check_fn(neuropod_path):
+            with zipfile.ZipFile(neuropod_path) as zf:
+                self.assertIsNone(zf.testzip())
+                for zinfo in zf.infolist():
+                    if zinfo.filename.startswith("0/code/"):
+                        self.assertEqual(zinfo.compress_type, zipfile.ZIP_STORED)
+                    else:
+                        self.assertEqual(zinfo.compress_type, zipfile.ZIP_DEFLATED)
+
+            with open(neuropod_path, "rb") as f:
+                outputs.append(f.read())
+
+        for num_threads in [1, 4]:
+            self.package_simple_addition_model(
+                check_fn=check_fn,
+                package_as_zip=True,
+                compression=compression,
+                compression_threads=num_threads,
+            )
+
+        self.assertEqual(outputs[0], outputs[1])
+
+    @unittest.skipIf(RUN_NATIVE_TESTS, "Not applicable to the native bindings")
+    def test_incremental_repackaging(self):
+        # Tests that repackaging on top of a previous package gives the same output
+        # as packaging from scratch
+        with TemporaryDirectory() as test_dir:
+            base_path = os.path.join(test_dir, "base_neuropod")
+            data_path = os.path.join(test_dir, "weights.bin")
+            data_paths = [{"path": data_path, "packaged_name": "weights.bin"}]
+            outputs = []
+
+            def save_output(neuropod_path):
+                with open(neuropod_path, "rb") as f:
+                    outputs.append(f.read())
+
+            with open(data_path, "wb") as f:
+                f.write(os.urandom(10000))
+
+            self.package_simple_addition_model(
+                check_fn=lambda path: shutil.copyfile(path, base_path),
+                data_paths=data_paths,
+                package_as_zip=True,
+            )
+
+            # Only the weights change
+            with open(data_path, "wb") as f:
+                f.write(os.urandom(10000))
+
+            # Keep track of which entries are copied from the previous package
+            copied = {}
+            open_raw = packaging_utils._PreviousPackage.open_raw
+
+            def tracking_open_raw(previous, relpath, manifest_entry):
+                raw = open_raw(previous, relpath, manifest_entry)
+                copied[relpath] = raw is not None
+                return raw
+
+            packaging_utils._PreviousPackage.open_raw = tracking_open_raw
+            try:
+                for base_neuropod in [base_path, None]:
+                    self.package_simple_addition_model(
+                        check_fn=save_output,
+                        data_paths=data_paths,
+                        package_as_zip=True,
+                        base_neuropod=base_neuropod,
+                    )
+            finally:
+                packaging_utils._PreviousPackage.open_raw = open_raw
+
+            self.assertEqual(outputs[0], outputs[1])
+
+            # Only the weights should have been compressed again
+            self.assertFalse(copied.pop(os.path.join("0", "data", "weights.bin")))
+            self.assertTrue(copied)
+            self.assertTrue(all(copied.values()))
+
+    @unittest.skipIf(sys.version_info < (3, 7), "Requires python 3.7+")
+    def test_without_raw_writes(self):
+        # Packaging should fall back to the public zipfile API if raw writes aren't supported
+        outputs = []
+
+        def save_output(neuropod_path):
+            with open(neuropod_path, "rb") as f:
+                outputs.append(f.read())
+
+        with TemporaryDirectory() as data_dir:
+            data_path = os.path.join(data_dir, "weights.bin")
+            with open(data_path, "wb") as f:
+                f.write(os.urandom(10000))
+
+            data_paths = [{"path": data_path, "packaged_name": "weights.bin"}]
+            self.package_simple_addition_model(
+                check_fn=save_output, data_paths=data_paths, package_as_zip=True
+            )
+
+            def check_fn(neuropod_path):
+                # The index should still point at the data (which isn't aligned)
+                with zipfile.ZipFile(neuropod_path) as zf:
+                    self.assertIsNone(zf.testzip())
+                    index = json.loads(
+                        zf.read(zip_loader.DATA_INDEX_NAME).decode("utf-8")
+                    )
+
+                item = index["files"][os.path.join("0", "data", "weights.bin")]
+                with open(neuropod_path, "rb") as f, open(data_path, "rb") as expected:
+                    f.seek(item["offset"])
+                    self.assertEqual(f.read(item["size"]), expected.read())
+
+            supports_raw_writes = packaging_utils._supports_raw_writes
+            packaging_utils._supports_raw_writes = lambda zf: False
+            try:
+                self.package_simple_addition_model(
+                    check_fn=save_output, data_paths=data_paths, package_as_zip=True
+                )
+                self.package_simple_addition_model(
+                    check_fn=check_fn,
+                    data_paths=data_paths,
+                    package_as_zip=True,
+                    mmap_data=True,
+                )
+            finally:
+                packaging_utils._supports_raw_writes = supports_raw_writes
+
+            self.assertEqual(outputs[0], outputs[1])
+
+    @unittest.skipIf(RUN_NATIVE_TESTS, "Not applicable to the native bindings")
+    def test_compression_error(self):
+        # Errors while compressing files should be raised without waiting for the other files
+        compress_file = packaging_utils._compress_file
+
+        def failing_compress_file(args):
+            if args[0] == "config.json":
+                raise IOError("Compression failed")
+
+            return compress_file(args)
+
+        packaging_utils._compress_file = failing_compress_file
+        try:
+            with self.assertRaises(IOError):
+                self.package_simple_addition_model(package_as_zip=True)
+        finally:
+            packaging_utils._compress_file = compress_file
+
+    @unittest.skipIf(sys.version_info < (3, 6), "Requires python 3.6+")
+    @unittest.skipIf(RUN_NATIVE_TESTS, "Not applicable to the native bindings")
+    def test_delta_package(self):
+        # Tests creating a delta package between two versions of a neuropod and
+        # reconstructing the second version from it
+        with TemporaryDirectory() as test_dir:
+            paths = [os.path.join(test_dir, name) for name in ["v1", "v2"]]
+            delta_path = os.path.join(test_dir, "delta")
+            data_path = os.path.join(test_dir, "weights.bin")
+            data_paths = [{"path": data_path, "packaged_name": "weights.bin"}]
+            weights = bytearray(os.urandom(4 * 1024 * 1024))
+
+            for i, path in enumerate(paths):
+                if i > 0:
+                    # Only part of the weights change in the second version
+                    weights[1000:2000] = os.urandom(1000)
+
+                with open(data_path, "wb") as f:
+                    f.write(weights)
+
+                self.package_simple_addition_model(
+                    check_fn=lambda neuropod_path: shutil.copyfile(neuropod_path, path),
+                    data_paths=data_paths,
+                    package_as_zip=True,
+                    mmap_data=True,
+                )
+
+            delta_utils.create_delta_neuropod(paths[1], paths[0], delta_path)
+            self.assertLess(os.path.getsize(delta_path), len(weights) // 4)
+            with zipfile.ZipFile(delta_path) as zf:
+                delta = json.loads(zf.read(zip_loader.DELTA_NAME).decode("utf-8"))
+
+            self.assertEqual(delta["files"]["0/data/weights.bin"]["op"], "patch")
+            self.assertEqual(delta["files"]["config.json"]["op"], "base")
+
+            # The reconstructed package is identical to the second version
+            output_path = os.path.join(test_dir, "output")
+            delta_utils.apply_delta_neuropod(paths[0], delta_path, output_path)
+            with open(output_path, "rb") as f, open(paths[1], "rb") as expected:
+                self.assertEqual(f.read(), expected.read())
+
+            # The delta package can be loaded directly given the base
+            with load_neuropod(
+                delta_path, base_neuropod=paths[0], verify_integrity="eager"
+            ) as neuropod:
+                x = np.arange(5, dtype=np.float32)
+                out = neuropod.infer({"x": x, "y": x})
+                self.assertTrue(np.array_equal(out["out"], x + x))
+
+            with self.assertRaises(ValueError):
+                load_neuropod(delta_path)
+
+    @unittest.skipIf(RUN_NATIVE_TESTS, "Not applicable to the native bindings")
+    def test_load_from_memory(self):
+        # Tests loading a zipped neuropod from a buffer or file-like object
+        def check_fn(neuropod_path):
+            with open(neuropod_path, "rb") as f:
+                data = f.read()
+
+            sources = [data, bytearray(data), memoryview(data), io.BytesIO(data)]
+            with open(neuropod_path, "rb") as f:
+                sources.append(f)
+
+                spec = get_addition_model_spec()
+                for source in sources:
+                    model = load_neuropod(source)
+                    out = model.infer(spec["test_input_data"])
+                    np.testing.assert_equal(
+                        out["out"], spec["test_expected_out"]["out"]
+                    )
+
+        self.package_simple_addition_model(check_fn=check_fn, package_as_zip=True)
+
+    @unittest.skipIf(sys.version_info < (3,), "Requires python 3")
+    def test_load_neuropods(self):
+        # Tests loading several neuropods concurrently
+        def check_fn(neuropod_path):
+            with open(neuropod_path, "rb") as f:
+                data = f.read()
+
+            futures = load_neuropods(
+                [neuropod_path, data, neuropod_path, "/does/not/exist"], max_workers=2
+            )
+            self.assertEqual(len(futures), 4)
+
+            spec = get_addition_model_spec()
+            for future in futures[:3]:
+                out = future.result().infer(spec["test_input_data"])
+                np.testing.assert_equal(out["out"], spec["test_expected_out"]["out"])
+
+            # Failures are reported through the future of that neuropod
+            with self.assertRaises(Exception):
+                futures[3].result()
+
+        self.package_simple_addition_model(check_fn=check_fn, package_as_zip=True)
+
     def test_noncontiguous_array(self):
         x = np.arange(16).astype(np.int64).reshape(4, 4)
 
@@ -143,6 +143,37 @@ class TestTensorflowPackaging(unittest.TestCase):
                     neuropod_obj.infer({"x": np.float32(4.0)}), {"out": 6.0}
                 )
 
+    def test_session_options(self):
+        # Packages a model and loads it with custom session options
+        with TemporaryDirectory() as test_dir:
+            neuropod_path = os.path.join(test_dir, "test_neuropod")
+            create_tensorflow_neuropod(
+                neuropod_path=neuropod_path,
+                model_name="addition_model",
+                graph_def=create_tf_addition_model(),
+                node_name_mapping={
+                    "x": "some_namespace/in_x:0",
+                    "y": "some_namespace/in_y:0",
+                    "out": "some_namespace/out",
+                },
+                **get_addition_model_spec()
+            )
+
+            neuropod_obj = load_neuropod(
+                neuropod_path,
+                intra_op_parallelism_threads=1,
+                inter_op_parallelism_threads=1,
+                graph_optimizer_level=-1,
+            )
+
+            # Run inference multiple times to make sure cached callables work correctly
+            for i in range(3):
+                x = np.arange(5, dtype=np.float32) * i
+                y = np.arange(5, dtype=np.float32)
+                np.testing.assert_equal(
+                    neuropod_obj.infer({"x": x, "y": y}), {"out": x + y}
+                )
+
     #
     # Note: The following tests only run against the native bindings. This is okay because the
     # native bindings are the default inference implementation (and will soon be the only
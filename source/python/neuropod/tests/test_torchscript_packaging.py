@@ -23,6 +23,7 @@ from torch import Tensor
 from typing import Dict
 
 from neuropod.packagers import create_torchscript_neuropod
+from neuropod.loader import load_neuropod
 from neuropod.tests.utils import (
     get_addition_model_spec,
     get_mixed_model_spec,
@@ -147,6 +148,34 @@ class TestTorchScriptPackaging(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.package_simple_addition_model(do_fail=True)
 
+    def test_runtime_options(self):
+        # Tests loading a model with thread, graph executor, inference mode, freezing and
+        # warmup options
+        with TemporaryDirectory() as test_dir:
+            neuropod_path = os.path.join(test_dir, "test_neuropod")
+            spec = get_addition_model_spec()
+
+            create_torchscript_neuropod(
+                neuropod_path=neuropod_path,
+                model_name="addition_model",
+                module=AdditionModel(),
+                **spec
+            )
+
+            for freeze in [False, True]:
+                neuropod = load_neuropod(
+                    neuropod_path,
+                    num_threads=1,
+                    num_interop_threads=1,
+                    graph_executor_optimize=not freeze,
+                    use_inference_mode=freeze,
+                    freeze=freeze,
+                    warmup_inputs=[spec["test_input_data"]],
+                )
+
+                out = neuropod.infer(spec["test_input_data"])
+                np.testing.assert_equal(out["out"], spec["test_expected_out"]["out"])
+
     def package_mixed_types_model(self, do_fail=False):
         with TemporaryDirectory() as test_dir:
             neuropod_path = os.path.join(test_dir, "test_neuropod")
@@ -220,9 +249,9 @@ class TestTorchScriptPackaging(unittest.TestCase):
                 },
                 test_expected_out={
                     "sum": np.zeros(5) if do_fail else np.arange(5) + np.arange(5),
-                    "difference": np.zeros(5)
-                    if do_fail
-                    else np.arange(5) - np.arange(5),
+                    "difference": (
+                        np.zeros(5) if do_fail else np.arange(5) - np.arange(5)
+                    ),
                     "product": np.zeros(5) if do_fail else np.arange(5) * np.arange(5),
                 },
             )
@@ -0,0 +1,126 @@
+# Copyright (c) 2020 UATC, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import os
+import sys
+import threading
+import unittest
+from multiprocessing.pool import ThreadPool
+from testpath.tempdir import TemporaryDirectory
+
+from neuropod.loader import load_neuropod
+from neuropod.packagers import create_python_neuropod
+from neuropod.tests.utils import get_addition_model_spec
+from neuropod.utils.eval_utils import RUN_NATIVE_TESTS
+
+ADDITION_MODEL_SOURCE = """
+import os
+
+def addition_model(x, y):
+    if x.size and x[0] < 0:
+        # Simulate a crash in native code
+        os._exit(1)
+
+    return {
+        "out": x + y
+    }
+
+def get_model(_):
+    return addition_model
+"""
+
+
+@unittest.skipIf(
+    RUN_NATIVE_TESTS or sys.version_info < (3, 8),
+    "Worker pools require python 3.8+ and are not used by the native bindings",
+)
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = TemporaryDirectory()
+        test_dir = self.test_dir.__enter__()
+
+        self.neuropod_path = os.path.join(test_dir, "test_neuropod")
+        model_code_dir = os.path.join(test_dir, "model_code")
+        os.makedirs(model_code_dir)
+
+        with open(os.path.join(model_code_dir, "addition_model.py"), "w") as f:
+            f.write(ADDITION_MODEL_SOURCE)
+
+        create_python_neuropod(
+            neuropod_path=self.neuropod_path,
+            model_name="addition_model",
+            data_paths=[],
+            code_path_spec=[{"python_root": model_code_dir, "dirs_to_package": [""]}],
+            entrypoint_package="addition_model",
+            entrypoint="get_model",
+            **get_addition_model_spec()
+        )
+
+    def tearDown(self):
+        self.test_dir.__exit__(None, None, None)
+
+    def test_concurrent_requests(self):
+        with load_neuropod(self.neuropod_path, num_workers=2) as model:
+
+            def run(size):
+                x = np.arange(size, dtype=np.float32)
+                y = np.full(size, size, dtype=np.float32)
+                out = model.infer({"x": x, "y": y})
+                np.testing.assert_equal(out["out"], x + y)
+
+            pool = ThreadPool(4)
+            try:
+                pool.map(run, [0, 1, 10, 1000, 5, 100000, 3, 7])
+            finally:
+                pool.close()
+
+    def test_worker_exit(self):
+        # Workers that exit should be replaced
+        x = np.arange(5, dtype=np.float32)
+        with load_neuropod(self.neuropod_path, num_workers=2) as model:
+            for _ in range(3):
+                with self.assertRaises(RuntimeError):
+                    model.infer({"x": -x - 1, "y": x})
+
+                out = model.infer({"x": x, "y": x})
+                np.testing.assert_equal(out["out"], x + x)
+
+    @unittest.skipIf(not hasattr(os, "fork"), "Forked replicas require fork")
+    def test_replica_exit(self):
+        # Forked replicas that exit should be replaced even if other threads are running
+        x = np.arange(5, dtype=np.float32)
+        with load_neuropod(self.neuropod_path, num_replicas=2) as model:
+            done = threading.Event()
+            thread = threading.Thread(target=done.wait)
+            thread.start()
+            try:
+                for _ in range(3):
+                    with self.assertRaises(RuntimeError):
+                        model.infer({"x": -x - 1, "y": x})
+
+                    out = model.infer({"x": x, "y": x})
+                    np.testing.assert_equal(out["out"], x + x)
+            finally:
+                done.set()
+                thread.join()
+
+    def test_worker_load_failure(self):
+        # Errors while loading the model in a worker should be raised when loading
+        with self.assertRaises(RuntimeError):
+            load_neuropod(self.neuropod_path, num_workers=1, invalid_arg=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+# Copyright (c) 2020 UATC, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A content-addressed store of the data files and custom ops of extracted neuropods.
+
+The store is enabled by setting the `NEUROPOD_CONTENT_STORE_DIR` environment variable. When a
+neuropod is extracted, files in `0/data` and `0/ops` are hard linked from the store instead of being
+extracted if the store already has a file with the same hash (from the manifest of the neuropod).
+Otherwise, they're extracted and added to the store. Identical files across neuropods (e.g. versions
+of the same model) are therefore stored once on disk and share pages in memory. The C++ library uses
+the same layout so both can share a store:
+
+    <store_dir>/<sha256>            A file (hard linked into every extracted neuropod that contains it)
+    <store_dir>/<sha256>.tmp-*      A file that's being added
+
+The number of links to a file is its reference count. Files that are only linked from the store
+aren't used by any neuropod and are removed by `gc`. The store must be on the same filesystem as
+the directories neuropods are extracted to (e.g. the extraction cache). Otherwise, neuropods are
+extracted without it (and a warning is logged).
+"""
+
+import errno
+import logging
+import os
+import stat
+import time
+import uuid
+
+from neuropod.utils.hash_utils import sha256sum
+
+logger = logging.getLogger(__name__)
+
+STORE_DIR_ENV_VAR = "NEUROPOD_CONTENT_STORE_DIR"
+
+# Only files in these directories are added to the store
+STORE_PREFIXES = ("0/data/", "0/ops/")
+
+TMP_SUFFIX = ".tmp-"
+
+# Temporary files older than this (in seconds) were left behind by a process that crashed
+ABANDONED_TMP_AGE = 60 * 60
+
+# Whether or not we've warned that the store is on a different filesystem
+_warned_cross_device = False
+
+
+def get_store_dir():
+    """
+    Returns the store directory or None if the store is disabled
+    """
+    return os.getenv(STORE_DIR_ENV_VAR) or None
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _tmp_path(path):
+    return path + TMP_SUFFIX + uuid.uuid4().hex
+
+
+def _link(src, dst):
+    """
+    Atomically creates or replaces `dst` with a hard link to `src`
+
+    Returns False if they're on different filesystems. The store isn't used in that case
+    """
+    global _warned_cross_device
+
+    tmp = _tmp_path(dst)
+    try:
+        os.link(src, tmp)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+        if not _warned_cross_device:
+            _warned_cross_device = True
+            logger.warning(
+                "Can't hard link %s to %s because they're on different filesystems. Extracting without the content store",
+                src,
+                dst,
+            )
+
+        return False
+
+    os.rename(tmp, dst)
+    return True
+
+
+def link_file(store_dir, sha256, dest):
+    """
+    If the store has a file with the hash `sha256`, hard link it to `dest`
+
+    Returns whether or not the file was linked
+    """
+    try:
+        return _link(os.path.join(store_dir, sha256), dest)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            # Not in the store (or it was just garbage collected)
+            return False
+
+        raise
+
+
+def add_file(store_dir, path, sha256):
+    """
+    Add a file to the store. The file is made read-only because its contents are shared with other
+    neuropods. Files whose contents don't match `sha256` are not added.
+
+    Returns whether or not the file was added (files aren't added if the store is on a different
+    filesystem)
+    """
+    actual = sha256sum(path)
+    if actual != sha256:
+        logger.warning(
+            "Not adding %s to the content store: expected a SHA-256 hash of %s, but got %s",
+            path,
+            sha256,
+            actual,
+        )
+        return False
+
+    os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) & ~0o222)
+    return _link(path, os.path.join(store_dir, sha256))
+
+
+def _is_storable(name):
+    parts = name.split("/")
+    return name.startswith(STORE_PREFIXES) and ".." not in parts and "" not in parts
+
+
+def extract(zf, dest, manifest, members=None, store_dir=None):
+    """
+    Extracts a zipped neuropod. Files in `STORE_PREFIXES` are linked from the store if possible and
+    added to it otherwise.
+
+    :param  zf:         A `zipfile.ZipFile` containing a neuropod
+    :param  dest:       The directory to extract to
+    :param  manifest:   The `files` in the manifest of the neuropod (see `manifest_utils`)
+    :param  members:    The names of the entries to extract. Defaults to all of them
+    :param  store_dir:  The store directory. Defaults to the value of `NEUROPOD_CONTENT_STORE_DIR`
+    """
+    if store_dir is None:
+        store_dir = get_store_dir()
+
+    _makedirs(store_dir)
+
+    to_extract = []
+    to_add = []
+    for name in members if members is not None else zf.namelist():
+        entry = manifest.get(name)
+        if entry is None or not _is_storable(name):
+            to_extract.append(name)
+            continue
+
+        path = os.path.join(dest, *name.split("/"))
+        _makedirs(os.path.dirname(path))
+        if not link_file(store_dir, entry["sha256"], path):
+            to_extract.append(name)
+            to_add.append((path, entry["sha256"]))
+
+    zf.extractall(dest, members=to_extract)
+
+    for path, sha256 in to_add:
+        add_file(store_dir, path, sha256)
+
+
+def gc(store_dir=None):
+    """
+    Removes files that aren't used by any extracted neuropod (i.e. the only link to them is from the
+    store). This is safe to run while other processes use the store: a file that is linked while it's
+    being removed stays valid for that neuropod and is added back the next time it's extracted.
+
+    :param  store_dir:  The store directory. Defaults to the value of `NEUROPOD_CONTENT_STORE_DIR`
+
+    Returns the number of bytes freed
+    """
+    if store_dir is None:
+        store_dir = get_store_dir()
+
+    try:
+        names = os.listdir(store_dir)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            # Nothing was ever added to the store
+            return 0
+
+        raise
+
+    freed = 0
+    for name in names:
+        path = os.path.join(store_dir, name)
+        try:
+            st = os.lstat(path)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                # Removed by another process
+                continue
+
+            raise
+
+        if TMP_SUFFIX in name:
+            # Creating a link updates the ctime
+            if time.time() - st.st_ctime < ABANDONED_TMP_AGE:
+                continue
+        elif st.st_nlink > 1:
+            # In use
+            continue
+
+        try:
+            os.unlink(path)
+            freed += st.st_size
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    return freed
@@ -0,0 +1,366 @@
+# Copyright (c) 2020 UATC, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Delta packages between versions of a neuropod.
+
+A delta package is a zipfile that contains everything needed to reconstruct a (zipped) neuropod
+given a base version of it. Files that are in the base package are referenced by path, small or
+completely changed files are included as-is and large files that partially changed (e.g. when only
+some layers were retrained) are included as a binary diff against the same file in the base:
+
+    delta.json          The manifest of the target neuropod, how to reconstruct each file and the
+                        hashes of the files that are used from the base package
+    replace/<path>      Files that are included as-is
+    patch/<path>        Binary diffs against the base package (see `_PatchWriter`)
+
+Every reconstructed file is verified against the hash in the manifest of the target neuropod.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zipfile
+
+from neuropod.utils import manifest_utils, zip_loader
+from neuropod.utils.hash_utils import sha256sum
+from neuropod.utils.packaging_utils import CHUNK_SIZE, SPOOL_SIZE, _zipdir, zip_modtime
+from neuropod.utils.zip_loader import DATA_INDEX_NAME, DELTA_NAME, MANIFEST_NAME
+
+REPLACE_PREFIX = "replace/"
+PATCH_PREFIX = "patch/"
+
+# Patches start with this
+PATCH_MAGIC = b"NPPATCH1"
+
+# Files are diffed in blocks of this size
+DIFF_BLOCK_SIZE = 64 * 1024
+
+# Files smaller than this are included as-is
+MIN_DIFF_SIZE = 1024 * 1024
+
+
+def _read_manifest(zf, path):
+    if MANIFEST_NAME not in zf.NameToInfo:
+        raise ValueError(
+            "{} does not have a manifest. Only neuropods packaged as a zip with this version "
+            "of neuropod can be used".format(path)
+        )
+
+    return json.loads(zf.read(MANIFEST_NAME).decode("utf-8"))["files"]
+
+
+def _new_zinfo(name):
+    zinfo = zipfile.ZipInfo(name, date_time=time.localtime(zip_modtime)[:6])
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    return zinfo
+
+
+class _PatchWriter(object):
+    """
+    Writes a binary diff. After `PATCH_MAGIC`, a patch is a sequence of instructions:
+
+        b"C" <uint64 offset> <uint64 length>    Copy `length` bytes at `offset` in the base file
+        b"D" <uint64 length> <data>             Insert `length` bytes of data
+
+    All integers are little endian. Adjacent copies are merged into one instruction.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.pending_copy = None
+        self.f.write(PATCH_MAGIC)
+
+    def copy(self, offset, length):
+        if self.pending_copy is not None and sum(self.pending_copy) == offset:
+            self.pending_copy[1] += length
+            return
+
+        self.flush()
+        self.pending_copy = [offset, length]
+
+    def data(self, data):
+        self.flush()
+        self.f.write(b"D" + struct.pack("<Q", len(data)) + data)
+
+    def flush(self):
+        if self.pending_copy is not None:
+            self.f.write(b"C" + struct.pack("<QQ", *self.pending_copy))
+            self.pending_copy = None
+
+
+def _diff(base, target, out, block_size):
+    """
+    Writes a patch that reconstructs `target` from `base` to `out`. Blocks of `target` that are
+    identical to a block in `base` are copied from it.
+
+    :param  base:       A file object containing the base file
+    :param  target:     A file object containing the target file
+    :param  out:        The file object to write the patch to
+    """
+    index = {}
+    offset = 0
+    for block in iter(lambda: base.read(block_size), b""):
+        index.setdefault(hashlib.sha256(block).digest(), (offset, len(block)))
+        offset += len(block)
+
+    writer = _PatchWriter(out)
+    for block in iter(lambda: target.read(block_size), b""):
+        match = index.get(hashlib.sha256(block).digest())
+        if match is not None and match[1] == len(block):
+            writer.copy(match[0], len(block))
+        else:
+            writer.data(block)
+
+    writer.flush()
+
+
+def _copy_bytes(src, dst, length):
+    while length > 0:
+        chunk = src.read(min(length, CHUNK_SIZE))
+        if not chunk:
+            raise ValueError("Unexpected end of patch data")
+
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def _apply_patch(patch, base_path, out_path):
+    """
+    Reconstructs a file from a patch written by `_diff`
+
+    :param  patch:      A file object containing the patch
+    :param  base_path:  The path of the base file
+    :param  out_path:   The path to write the reconstructed file to
+    """
+    if patch.read(len(PATCH_MAGIC)) != PATCH_MAGIC:
+        raise ValueError("Invalid patch for {}".format(out_path))
+
+    with open(base_path, "rb") as base, open(out_path, "wb") as out:
+        for op in iter(lambda: patch.read(1), b""):
+            if op == b"C":
+                offset, length = struct.unpack("<QQ", patch.read(16))
+                base.seek(offset)
+                _copy_bytes(base, out, length)
+            elif op == b"D":
+                (length,) = struct.unpack("<Q", patch.read(8))
+                _copy_bytes(patch, out, length)
+            else:
+                raise ValueError("Invalid patch for {}".format(out_path))
+
+
+def create_delta_neuropod(
+    neuropod_path,
+    base_neuropod,
+    delta_path,
+    min_diff_size=MIN_DIFF_SIZE,
+    diff_block_size=DIFF_BLOCK_SIZE,
+):
+    """
+    Creates a delta package that reconstructs `neuropod_path` given `base_neuropod`. Both must be
+    zipped neuropods with manifests (i.e. packaged with this version of neuropod).
+
+    :param  neuropod_path:      The path to the zipped neuropod to create a delta package for
+    :param  base_neuropod:      The path to the zipped neuropod to create the delta against
+    :param  delta_path:         The output path
+    :param  min_diff_size:      Files that changed and are smaller than this are included as-is.
+                                Larger ones are diffed against the file with the same path in the base
+                                package (if any). The diff is used if it's less than half the size of the file.
+    :param  diff_block_size:    Files are diffed in blocks of this many bytes. Unchanged blocks of changed
+                                files are copied from the base package.
+    """
+    if sys.version_info < (3, 6):
+        raise ValueError("Delta packages require python 3.6 or newer")
+
+    with zipfile.ZipFile(neuropod_path) as target, zipfile.ZipFile(
+        base_neuropod
+    ) as base, zipfile.ZipFile(delta_path, "w", zipfile.ZIP_DEFLATED) as out:
+        target_manifest = _read_manifest(target, neuropod_path)
+        base_manifest = _read_manifest(base, base_neuropod)
+
+        # Base files by hash so renamed files can be found as well
+        base_by_hash = {}
+        for relpath, entry in sorted(base_manifest.items()):
+            base_by_hash.setdefault(entry["sha256"], relpath)
+
+        files = {}
+        for relpath, entry in sorted(target_manifest.items()):
+            if base_manifest.get(relpath, {}).get("sha256") == entry["sha256"]:
+                files[relpath] = {"op": "base", "source": relpath}
+                continue
+
+            if entry["sha256"] in base_by_hash:
+                files[relpath] = {"op": "base", "source": base_by_hash[entry["sha256"]]}
+                continue
+
+            if relpath in base_manifest and entry["size"] >= min_diff_size:
+                with tempfile.SpooledTemporaryFile(
+                    max_size=SPOOL_SIZE
+                ) as patch, base.open(relpath) as base_file, target.open(
+                    relpath
+                ) as target_file:
+                    _diff(base_file, target_file, patch, diff_block_size)
+
+                    if patch.tell() < entry["size"] // 2:
+                        patch.seek(0)
+                        with out.open(
+                            _new_zinfo(PATCH_PREFIX + relpath), "w", force_zip64=True
+                        ) as dst:
+                            shutil.copyfileobj(patch, dst, CHUNK_SIZE)
+
+                        files[relpath] = {"op": "patch", "source": relpath}
+                        continue
+
+            with target.open(relpath) as src, out.open(
+                _new_zinfo(REPLACE_PREFIX + relpath), "w", force_zip64=True
+            ) as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+            files[relpath] = {"op": "replace"}
+
+        delta = {
+            "files": files,
+            "manifest": target_manifest,
+            "base": {
+                item["source"]: base_manifest[item["source"]]["sha256"]
+                for item in files.values()
+                if "source" in item
+            },
+            "mmap_data": DATA_INDEX_NAME in target.NameToInfo,
+            "modes": {
+                relpath: target.getinfo(relpath).external_attr >> 16
+                for relpath in target_manifest
+            },
+        }
+
+        out.writestr(_new_zinfo(DELTA_NAME), json.dumps(delta, sort_keys=True))
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def overlay_delta_neuropod(base_path, delta_path, dest):
+    """
+    Reconstructs the neuropod in a delta package as a directory. Files that are unchanged from the
+    base are hard linked from it (if possible).
+
+    :param  base_path:  The path to the unzipped base neuropod
+    :param  delta_path: The path to the delta package
+    :param  dest:       The directory to reconstruct the neuropod in. It must not exist
+    """
+    base_manifest = manifest_utils.Manifest(base_path)
+
+    with zipfile.ZipFile(delta_path) as zf:
+        delta = json.loads(zf.read(DELTA_NAME).decode("utf-8"))
+
+        # Make sure this is the right base package
+        for relpath, expected in delta["base"].items():
+            if base_manifest.get_hash(relpath) != expected:
+                raise ValueError(
+                    "{} in the base neuropod does not match the base of the delta package {}".format(
+                        relpath, delta_path
+                    )
+                )
+
+        os.makedirs(dest)
+        for relpath, item in sorted(delta["files"].items()):
+            path = os.path.join(dest, *relpath.split("/"))
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            if item["op"] == "base":
+                _link_or_copy(os.path.join(base_path, *item["source"].split("/")), path)
+                continue
+
+            if item["op"] == "replace":
+                with zf.open(REPLACE_PREFIX + relpath) as src, open(path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            else:
+                with zf.open(PATCH_PREFIX + relpath) as patch:
+                    _apply_patch(
+                        patch,
+                        os.path.join(base_path, *item["source"].split("/")),
+                        path,
+                    )
+
+            actual = sha256sum(path)
+            if actual != delta["manifest"][relpath]["sha256"]:
+                raise ValueError(
+                    "Integrity check failed for '{}': expected a SHA-256 hash of {}, but got {}".format(
+                        relpath, delta["manifest"][relpath]["sha256"], actual
+                    )
+                )
+
+        with open(os.path.join(dest, MANIFEST_NAME), "w") as f:
+            json.dump({"files": delta["manifest"]}, f, sort_keys=True)
+
+    return delta
+
+
+def apply_delta_neuropod(base_neuropod, delta_path, neuropod_path):
+    """
+    Reconstructs a zipped neuropod from a delta package. The output is identical to the neuropod the
+    delta package was created from.
+
+    :param  base_neuropod:  The path to the base neuropod (zipped or unzipped)
+    :param  delta_path:     The path to the delta package
+    :param  neuropod_path:  The output path
+    """
+    if os.path.exists(neuropod_path):
+        raise ValueError(
+            "The specified neuropod path ({}) already exists! Aborting...".format(
+                neuropod_path
+            )
+        )
+
+    base_path = zip_loader.extract_neuropod_if_necessary(base_neuropod)
+    stage_dir = tempfile.mkdtemp()
+    try:
+        package_path = os.path.join(stage_dir, "neuropod")
+        delta = overlay_delta_neuropod(base_path, delta_path, package_path)
+
+        # The manifest is regenerated while zipping
+        os.remove(os.path.join(package_path, MANIFEST_NAME))
+
+        # Compress every file the same way it was compressed in the original package
+        compression = [
+            {
+                "pattern": glob.escape(relpath),
+                "method": entry["method"],
+                "level": entry["level"],
+            }
+            for relpath, entry in sorted(delta["manifest"].items())
+        ]
+
+        with zipfile.ZipFile(neuropod_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            _zipdir(
+                package_path,
+                zf,
+                mmap_data=delta["mmap_data"],
+                compression=compression,
+                base_neuropod=None if os.path.isdir(base_neuropod) else base_neuropod,
+                modes=delta["modes"],
+            )
+    finally:
+        shutil.rmtree(stage_dir)
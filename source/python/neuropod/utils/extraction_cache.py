@@ -0,0 +1,257 @@
+# Copyright (c) 2020 UATC, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A persistent on-disk cache of extracted neuropods that is shared across processes.
+
+The cache is enabled by setting the `NEUROPOD_CACHE_DIR` environment variable. The C++ library
+uses the same layout and locking protocol so both can share a cache directory:
+
+    <cache_dir>/<sha256 of archive>         An extracted neuropod
+    <cache_dir>/<sha256 of archive>.lock    Held with a shared lock while the extracted neuropod is
+                                            in use and with an exclusive lock while it's being created
+                                            or evicted
+    <cache_dir>/<sha256 of archive>.tmp-*   An extraction in progress
+    <cache_dir>/.evict.lock                 Held while evicting entries
+
+Entries are extracted to a temporary directory and atomically renamed into place. Once the total
+size of the cache exceeds `NEUROPOD_CACHE_MAX_SIZE_BYTES` (default 10 GiB), the least recently used
+entries that are not in use are evicted.
+"""
+
+import errno
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+
+from neuropod.utils import content_store
+from neuropod.utils.hash_utils import sha256sum, sha256sum_fileobj
+
+CACHE_DIR_ENV_VAR = "NEUROPOD_CACHE_DIR"
+CACHE_MAX_SIZE_ENV_VAR = "NEUROPOD_CACHE_MAX_SIZE_BYTES"
+DEFAULT_CACHE_MAX_SIZE = 10 * 1024 * 1024 * 1024
+
+LOCK_SUFFIX = ".lock"
+TMP_SUFFIX = ".tmp-"
+EVICT_LOCK_NAME = ".evict.lock"
+
+# File descriptors of the locks for the entries used by this process
+# These are held until the process exits so the entries aren't evicted while in use
+_HELD_LOCKS = {}
+
+# Neuropods can be loaded from several threads at once (e.g. `load_neuropods`)
+_HELD_LOCKS_LOCK = threading.Lock()
+
+
+def get_cache_dir():
+    """
+    Returns the cache directory or None if the cache is disabled
+    """
+    return os.getenv(CACHE_DIR_ENV_VAR) or None
+
+
+def get_max_cache_size():
+    return int(os.getenv(CACHE_MAX_SIZE_ENV_VAR, DEFAULT_CACHE_MAX_SIZE))
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError as e:
+                # Files can be removed by other processes while we scan
+                if e.errno != errno.ENOENT:
+                    raise
+
+    return total
+
+
+def extract_to_cache(zip_path, cache_dir=None, extract=None):
+    """
+    Returns the path of the extracted neuropod in the cache (extracting it if necessary)
+
+    :param  zip_path:   The path to a zipped neuropod or a seekable file-like object containing one
+    :param  cache_dir:  The cache directory. Defaults to the value of `NEUROPOD_CACHE_DIR`
+    :param  extract:    An optional function that extracts a `zipfile.ZipFile` to a directory.
+                        Defaults to `ZipFile.extractall`
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+
+    _makedirs(cache_dir)
+
+    key = (
+        sha256sum_fileobj(zip_path)
+        if hasattr(zip_path, "read")
+        else sha256sum(zip_path)
+    )
+    target = os.path.join(cache_dir, key)
+
+    with _HELD_LOCKS_LOCK:
+        fd = _HELD_LOCKS.get(key)
+
+    if fd is None:
+        fd = os.open(target + LOCK_SUFFIX, os.O_CREAT | os.O_RDWR, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_SH)
+
+    created = False
+    if not os.path.isdir(target):
+        # Upgrade to an exclusive lock so only one process extracts this archive
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if not os.path.isdir(target):
+            tmpdir = tempfile.mkdtemp(prefix=key + TMP_SUFFIX, dir=cache_dir)
+            try:
+                with zipfile.ZipFile(zip_path) as z:
+                    if extract is None:
+                        z.extractall(tmpdir)
+                    else:
+                        extract(z, tmpdir)
+
+                os.rename(tmpdir, target)
+            except Exception:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+                raise
+
+            created = True
+
+        fcntl.flock(fd, fcntl.LOCK_SH)
+
+    with _HELD_LOCKS_LOCK:
+        held_fd = _HELD_LOCKS.setdefault(key, fd)
+
+    if held_fd != fd:
+        # Another thread loaded this entry at the same time and already holds a lock for it
+        os.close(fd)
+
+    # Mark this entry as recently used
+    os.utime(target, None)
+
+    if created:
+        evict(cache_dir, get_max_cache_size())
+
+    return target
+
+
+def evict(cache_dir, max_size):
+    """
+    Evicts the least recently used entries that aren't in use until the size of the cache is
+    at most `max_size` bytes
+    """
+    evict_fd = os.open(
+        os.path.join(cache_dir, EVICT_LOCK_NAME), os.O_CREAT | os.O_RDWR, 0o644
+    )
+    try:
+        fcntl.flock(evict_fd, fcntl.LOCK_EX)
+
+        entries = []
+        total = 0
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if name.startswith(".") or name.endswith(LOCK_SUFFIX):
+                continue
+
+            try:
+                size = _dir_size(path)
+                mtime = os.stat(path).st_mtime
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    # Renamed or removed by another process (e.g. a finished extraction)
+                    continue
+
+                raise
+
+            total += size
+            entries.append((mtime, name, size))
+
+        # Oldest first
+        entries.sort()
+        for _, name, size in entries:
+            if total <= max_size:
+                break
+
+            key = name.split(TMP_SUFFIX)[0]
+            if _try_remove(cache_dir, key, name):
+                total -= size
+    finally:
+        os.close(evict_fd)
+
+    if content_store.get_store_dir() is not None:
+        # Remove the files that were only used by the evicted entries
+        content_store.gc()
+
+
+def _try_remove(cache_dir, key, name):
+    """
+    Removes an entry (or an abandoned extraction) if no process is using it
+    """
+    with _HELD_LOCKS_LOCK:
+        if key in _HELD_LOCKS:
+            # This process is using it
+            return False
+
+    fd = os.open(
+        os.path.join(cache_dir, key + LOCK_SUFFIX), os.O_CREAT | os.O_RDWR, 0o644
+    )
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError) as e:
+            if e.errno in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                # Another process is using this entry
+                return False
+
+            raise
+
+        # Move the entry out of the way before deleting it so other processes never
+        # see a partially deleted entry
+        path = os.path.join(cache_dir, name)
+        trash = tempfile.mkdtemp(prefix=".trash-", dir=cache_dir)
+        try:
+            os.rename(path, os.path.join(trash, name))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+            # Already gone
+            return False
+        finally:
+            shutil.rmtree(trash, ignore_errors=True)
+
+        return True
+    finally:
+        os.close(fd)
+
+
+def release_all():
+    """
+    Releases the locks held by this process
+    """
+    with _HELD_LOCKS_LOCK:
+        for fd in _HELD_LOCKS.values():
+            os.close(fd)
+
+        _HELD_LOCKS.clear()
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import hashlib
+import os
 
 # From https://stackoverflow.com/a/44873382
 
@@ -25,3 +26,79 @@ def sha256sum(filename):
         for n in iter(lambda: f.readinto(mv), 0):
             h.update(mv[:n])
     return h.hexdigest()
+
+
+def sha256sum_fileobj(f):
+    """
+    Returns the SHA-256 hash of the contents of a seekable file-like object
+    """
+    h = hashlib.sha256()
+    f.seek(0)
+    for chunk in iter(lambda: f.read(128 * 1024), b""):
+        h.update(chunk)
+
+    f.seek(0)
+    return h.hexdigest()
+
+
+def _is_bytecode(rel_path):
+    """
+    Whether a path refers to python bytecode. These files are written when the code is
+    imported so they're excluded from directory hashes
+    """
+    return rel_path.endswith((".pyc", ".pyo")) or "__pycache__" in rel_path.split("/")
+
+
+def _hash_file_list(files):
+    """
+    Hashes a list of (relative path, file hash) tuples. Python bytecode is skipped
+    """
+    h = hashlib.sha256()
+    for rel_path, file_hash in sorted(files):
+        if _is_bytecode(rel_path):
+            continue
+
+        h.update(rel_path.encode("utf-8"))
+        h.update(b"\0")
+        h.update(file_hash.encode("ascii"))
+        h.update(b"\0")
+
+    return h.hexdigest()
+
+
+def sha256sum_dir(path):
+    """
+    Returns a hash of the contents of a directory tree. This includes the relative
+    path of every file so renaming a file changes the hash. Python bytecode (e.g.
+    `__pycache__`) is ignored so importing code from the directory doesn't change it.
+    """
+    files = []
+    for root, dirs, filenames in os.walk(path):
+        # Don't bother reading bytecode
+        dirs[:] = [d for d in dirs if d != "__pycache__"]
+        for name in filenames:
+            file_path = os.path.join(root, name)
+            rel_path = os.path.relpath(file_path, path).replace(os.sep, "/")
+            if not _is_bytecode(rel_path):
+                files.append((rel_path, sha256sum(file_path)))
+
+    return _hash_file_list(files)
+
+
+def sha256sum_zip_dir(zf, prefix):
+    """
+    Returns a hash of the contents of all the files under `prefix` in a zipfile.
+    This matches `sha256sum_dir` for the same directory tree.
+
+    :param  zf:         A `zipfile.ZipFile`
+    :param  prefix:     The directory in the zipfile to hash (e.g. "0/code/")
+    """
+    files = []
+    for info in zf.infolist():
+        if info.filename.startswith(prefix) and not info.filename.endswith("/"):
+            with zf.open(info) as f:
+                file_hash = hashlib.sha256(f.read()).hexdigest()
+
+            files.append((info.filename[len(prefix) :], file_hash))
+
+    return _hash_file_list(files)
@@ -0,0 +1,158 @@
+# Copyright (c) 2020 UATC, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The manifest of a neuropod package. This stores the SHA-256 hash and size of every file in the
+package (computed at packaging time) so loaders can get the hash of a file (e.g. to dedup custom ops)
+without reading it:
+
+    {"files": {"0/ops/addition_op.so": {"sha256": "...", "size": 1234, ...}, ...}}
+
+Zipped neuropods also store the compression of each file (see `packaging_utils._zipdir`).
+"""
+
+import json
+import logging
+import os
+import threading
+
+from neuropod.utils.hash_utils import _hash_file_list, sha256sum
+from neuropod.utils.zip_loader import MANIFEST_NAME
+
+logger = logging.getLogger(__name__)
+
+VERIFY_MODES = ["eager", "background"]
+
+
+def get_manifest_entry(path):
+    return {"sha256": sha256sum(path), "size": os.path.getsize(path)}
+
+
+def write_manifest(neuropod_path):
+    """
+    Writes a manifest for all the files in an unzipped neuropod
+    """
+    files = {}
+    for root, _, filenames in os.walk(neuropod_path):
+        for name in filenames:
+            path = os.path.join(root, name)
+            relpath = os.path.relpath(path, neuropod_path).replace(os.sep, "/")
+            if relpath != MANIFEST_NAME:
+                files[relpath] = get_manifest_entry(path)
+
+    with open(os.path.join(neuropod_path, MANIFEST_NAME), "w") as f:
+        json.dump({"files": files}, f, sort_keys=True)
+
+
+class Manifest(object):
+    """
+    The manifest of an unzipped neuropod. Neuropods packaged before manifests were added have
+    an empty manifest and files are hashed when needed.
+    """
+
+    def __init__(self, neuropod_path):
+        self.neuropod_path = neuropod_path
+        self.files = {}
+
+        manifest_path = os.path.join(neuropod_path, MANIFEST_NAME)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, "r") as f:
+                self.files = json.load(f)["files"]
+
+    def get_hash(self, relpath):
+        """
+        Returns the SHA-256 hash of a file in the neuropod
+
+        :param  relpath:    The path of the file relative to the root of the neuropod (e.g. "0/ops/op.so")
+        """
+        entry = self.files.get(relpath)
+        if entry is not None:
+            return entry["sha256"]
+
+        return sha256sum(os.path.join(self.neuropod_path, relpath))
+
+    def get_dir_hash(self, prefix):
+        """
+        Returns a hash of all the files under `prefix` (e.g. "0/code/") that matches
+        `hash_utils.sha256sum_dir` for the same directory tree or None if the manifest is empty
+        """
+        if not self.files:
+            return None
+
+        return _hash_file_list(
+            (relpath[len(prefix) :], entry["sha256"])
+            for relpath, entry in self.files.items()
+            if relpath.startswith(prefix)
+        )
+
+    def verify(self):
+        """
+        Checks the size and hash of every file in the neuropod against the manifest.
+        Throws a ValueError if any of them don't match
+        """
+        for relpath, expected in sorted(self.files.items()):
+            path = os.path.join(self.neuropod_path, relpath)
+            if not os.path.isfile(path):
+                # Some files are intentionally not extracted (e.g. python code when using zipimport)
+                continue
+
+            size = os.path.getsize(path)
+            if size != expected["size"]:
+                raise ValueError(
+                    "Integrity check failed for '{}': expected a size of {} bytes, but got {}".format(
+                        path, expected["size"], size
+                    )
+                )
+
+            actual = sha256sum(path)
+            if actual != expected["sha256"]:
+                raise ValueError(
+                    "Integrity check failed for '{}': expected a SHA-256 hash of {}, but got {}".format(
+                        path, expected["sha256"], actual
+                    )
+                )
+
+
+def _verify_in_background(manifest):
+    try:
+        manifest.verify()
+    except ValueError as e:
+        logger.error("%s", e)
+
+
+def verify_neuropod(neuropod_path, mode):
+    """
+    Checks the files of an unzipped neuropod against its manifest
+
+    :param  neuropod_path:  The path to an unzipped neuropod
+    :param  mode:           "eager" to verify before returning (throwing a ValueError on failure) or
+                            "background" to verify in a daemon thread (logging an error on failure).
+                            In the latter case, the thread is returned.
+    """
+    if mode not in VERIFY_MODES:
+        raise ValueError(
+            "Invalid integrity verification mode: {}. Expected one of {}".format(
+                mode, VERIFY_MODES
+            )
+        )
+
+    manifest = Manifest(neuropod_path)
+    if mode == "eager":
+        manifest.verify()
+        return None
+
+    thread = threading.Thread(target=_verify_in_background, args=(manifest,))
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -12,16 +12,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import datetime
+import fcntl
+import fnmatch
+import functools
 import inspect
+import json
+import multiprocessing
 import os
+import struct
+import sys
 import tempfile
+import threading
 import time
 import shutil
 import zipfile
+import zlib
+from multiprocessing.pool import ThreadPool
 
 from neuropod.backends import config_utils
+from neuropod.utils import manifest_utils
 from neuropod.utils.eval_utils import save_test_data, load_and_test_neuropod
+from neuropod.utils.hash_utils import sha256sum
+from neuropod.utils.zip_loader import DATA_INDEX_NAME, LOCAL_HEADER_SIZE, MANIFEST_NAME
 
 # Set a consistent time on the files we're zipping so the hash of the zipfile is the same
 # if the content didn't change
@@ -29,10 +43,364 @@ zip_date = datetime.datetime(year=2000, month=1, day=1, hour=0, minute=0, second
 zip_modtime = time.mktime(zip_date.timetuple())
 
 
-def _zipdir(path, zf):
+# Files in `0/data` are aligned to this many bytes when they are stored uncompressed
+DATA_ALIGNMENT = 4096
+
+# The ID of the extra field used to pad local file headers (the same one used by Android's zipalign)
+ALIGNMENT_EXTRA_ID = 0xD935
+
+# The compression methods that can be used in a `compression` rule
+COMPRESSION_METHODS = {"stored": zipfile.ZIP_STORED, "deflated": zipfile.ZIP_DEFLATED}
+
+# The size of the chunks files are read and compressed in
+CHUNK_SIZE = 1024 * 1024
+
+# Compressed data smaller than this is kept in memory instead of a temporary file
+SPOOL_SIZE = 16 * 1024 * 1024
+
+# The ways input files can be added to a neuropod (see `copy_mode` in `_create_neuropod`)
+COPY_MODES = ["copy", "hardlink", "reflink"]
+
+# The ioctl used to create a copy-on-write clone of a file on Linux (from linux/fs.h)
+FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """
+    Try to make `dst` a copy-on-write clone of `src`. Falls back to `copy_file_range` (if available)
+    which lets the filesystem share or copy the data without going through userspace.
+
+    Returns whether or not the copy succeeded
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return True
+        except (IOError, OSError):
+            # Not supported by this platform or filesystem
+            pass
+
+        if not hasattr(os, "copy_file_range"):
+            return False
+
+        remaining = os.fstat(fsrc.fileno()).st_size
+        try:
+            while remaining > 0:
+                num_copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if num_copied == 0:
+                    break
+
+                remaining -= num_copied
+        except OSError:
+            return False
+
+        return remaining == 0
+
+
+def copy_file(src, dst, copy_mode="copy", copy_fn=shutil.copyfile):
+    """
+    Add a file to a neuropod that's being packaged
+
+    :param  copy_mode:  "copy", "hardlink" or "reflink" (see `_create_neuropod`) or "symlink" to
+                        link to the original file (used when staging files that are zipped directly
+                        from their original paths)
+    :param  copy_fn:    The function used to copy the file if `copy_mode` is "copy" or the file can't
+                        be linked (e.g. across filesystems)
+    """
+    if copy_mode == "symlink":
+        os.symlink(os.path.abspath(src), dst)
+        return dst
+
+    if copy_mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return dst
+        except OSError:
+            pass
+    elif copy_mode == "reflink" and _reflink(src, dst):
+        return dst
+
+    copy_fn(src, dst)
+    return dst
+
+
+def copy_tree(src, dst, copy_mode="copy", ignore=None):
+    """
+    Add a directory tree to a neuropod that's being packaged. See `copy_file` for details
+    """
+    if copy_mode == "copy":
+        shutil.copytree(src, dst, ignore=ignore)
+    else:
+        shutil.copytree(
+            src,
+            dst,
+            ignore=ignore,
+            copy_function=functools.partial(
+                copy_file, copy_mode=copy_mode, copy_fn=shutil.copy2
+            ),
+        )
+
+
+def _get_compression(relpath, compression):
+    """
+    Returns a tuple of (compress_type, compresslevel) for a file given a list of `compression` rules
+    (see `_create_neuropod`). Files that don't match any rule are deflated with the default level.
+    """
+    for rule in compression or []:
+        if fnmatch.fnmatch(relpath, rule["pattern"]):
+            method = rule.get("method", "deflated")
+            if method not in COMPRESSION_METHODS:
+                raise ValueError(
+                    "Unsupported compression method {}. Expected one of {}".format(
+                        method, sorted(COMPRESSION_METHODS)
+                    )
+                )
+
+            return COMPRESSION_METHODS[method], rule.get("level")
+
+    return zipfile.ZIP_DEFLATED, None
+
+
+class _PreviousPackage(object):
     """
-    Zip all the files in a directory in a determinisitc order along with a constant timestamp
+    A previously packaged neuropod that unchanged entries can be copied from without compressing
+    them again
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with zipfile.ZipFile(path) as zf:
+            if MANIFEST_NAME not in zf.NameToInfo:
+                raise ValueError(
+                    "The previous package ({}) does not have a manifest. Only neuropods packaged "
+                    "as a zip with this version of neuropod can be used".format(path)
+                )
+
+            self.manifest = json.loads(zf.read(MANIFEST_NAME).decode("utf-8"))["files"]
+            self.infos = {zinfo.filename: zinfo for zinfo in zf.infolist()}
+
+    def open_raw(self, relpath, manifest_entry):
+        """
+        If the previous package contains `relpath` with the same contents and compression settings,
+        returns a tuple of (ZipInfo, file object positioned at the start of the compressed data).
+        Otherwise, returns None.
+        """
+        if self.manifest.get(relpath) != manifest_entry:
+            return None
+
+        zinfo = self.infos[relpath]
+        f = open(self.path, "rb")
+        f.seek(zinfo.header_offset)
+        name_len, extra_len = struct.unpack("<HH", f.read(LOCAL_HEADER_SIZE)[26:30])
+        f.seek(zinfo.header_offset + LOCAL_HEADER_SIZE + name_len + extra_len)
+        return zinfo, f
+
+
+def _compress_file(args):
     """
+    Compress a file into a temporary file (or find its compressed data in a previous package).
+    This runs in a thread pool (zlib and hashlib release the GIL).
+
+    If `raw_writes` is False, the data isn't compressed here (see `_supports_raw_writes`).
+
+    Returns a tuple of (ZipInfo, file object containing the compressed data, manifest entry)
+    """
+    relpath, abspath, compress_type, compresslevel, mode, previous, raw_writes = args
+
+    st = os.stat(abspath)
+    zinfo = zipfile.ZipInfo(relpath, date_time=time.localtime(zip_modtime)[:6])
+    zinfo.external_attr = ((st.st_mode if mode is None else mode) & 0xFFFF) << 16
+    zinfo.compress_type = compress_type
+    zinfo.file_size = st.st_size
+
+    manifest_entry = {
+        "sha256": sha256sum(abspath),
+        "size": st.st_size,
+        "method": "stored" if compress_type == zipfile.ZIP_STORED else "deflated",
+        "level": compresslevel,
+    }
+
+    if not raw_writes:
+        # The file is compressed while it's written to the archive
+        return zinfo, open(abspath, "rb"), manifest_entry
+
+    raw = previous.open_raw(relpath, manifest_entry) if previous is not None else None
+    if raw is not None:
+        # The file didn't change so we can reuse the compressed data
+        previous_zinfo, data = raw
+        zinfo.CRC = previous_zinfo.CRC
+        zinfo.compress_size = previous_zinfo.compress_size
+        return zinfo, data, manifest_entry
+
+    compressor = None
+    if compress_type == zipfile.ZIP_DEFLATED:
+        # This matches what `zipfile` does so the output is the same as `ZipFile.write`
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel,
+            zlib.DEFLATED,
+            -15,
+        )
+
+    crc = 0
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    with open(abspath, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+            out.write(compressor.compress(chunk) if compressor else chunk)
+
+    if compressor:
+        out.write(compressor.flush())
+
+    zinfo.CRC = crc & 0xFFFFFFFF
+    zinfo.compress_size = out.tell()
+    out.seek(0)
+    return zinfo, out, manifest_entry
+
+
+# `zipfile` has no public API for adding an entry whose data is already compressed so `_raw_entry`
+# uses internals of `zipfile.ZipFile`. These are the same in python 2.7 and 3.x up to this version
+MAX_RAW_WRITE_PYTHON_VERSION = (3, 13)
+
+
+def _supports_raw_writes(zf):
+    """
+    Whether or not `_write_raw` can be used with `zf`. Otherwise, files are written with
+    `_write_compressed` instead (which doesn't compress in parallel or reuse a previous package)
+    """
+    return sys.version_info[:2] <= MAX_RAW_WRITE_PYTHON_VERSION and all(
+        hasattr(zf, attr) for attr in ("_writecheck", "_didModify", "fp")
+    )
+
+
+@contextlib.contextmanager
+def _raw_entry(zf, zinfo):
+    """
+    Appends an entry to `zf` whose local file header and data are written by the caller. Yields the
+    file object of the archive positioned at `zinfo.header_offset`. This is the only place that
+    depends on the internals of `zipfile.ZipFile` (see `_supports_raw_writes`)
+    """
+    # Python 3 guards writes with a lock
+    with getattr(zf, "_lock", None) or threading.RLock():
+        if getattr(zf, "_writing", False):
+            raise ValueError(
+                "Can't write to the archive while an open writing handle exists"
+            )
+
+        zf._writecheck(zinfo)
+        zf._didModify = True
+        if hasattr(zf, "start_dir") and getattr(zf, "_seekable", True):
+            # Python 3 keeps track of where the central directory starts and writes entries there
+            zf.fp.seek(zf.start_dir)
+
+        zinfo.header_offset = zf.fp.tell()
+        yield zf.fp
+
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+        if hasattr(zf, "start_dir"):
+            zf.start_dir = zf.fp.tell()
+
+
+def _write_compressed(zf, zinfo, src, compresslevel):
+    """
+    Compress and write an entry with the public `zipfile` API. The output is the same as `_write_raw`
+    except that files in `0/data` aren't aligned when `mmap_data` is set.
+
+    Returns the offset of the data within the archive
+    """
+    if hasattr(zipfile.ZipInfo, "compress_level"):
+        # Python 3.13+
+        zinfo.compress_level = compresslevel
+    else:
+        zinfo._compresslevel = compresslevel
+
+    with zf.open(zinfo, "w") as dest:
+        shutil.copyfileobj(src, dest, CHUNK_SIZE)
+
+    zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    return zinfo.header_offset + len(zinfo.FileHeader(zip64))
+
+
+def _write_raw(zf, zinfo, src, align=False):
+    """
+    Write an entry whose data has already been compressed (and whose CRC and sizes are set).
+    `zinfo.compress_size` bytes are copied from `src`. The output is the same as writing the
+    uncompressed data with `ZipFile.write`.
+
+    If `align` is True, the local file header is padded with an extra field so the data starts at
+    an offset that is a multiple of `DATA_ALIGNMENT`.
+
+    Returns the offset of the data within the archive
+    """
+    # This matches the check in `ZipFile.write` for whether the header needs zip64 fields
+    zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+
+    with _raw_entry(zf, zinfo) as fp:
+        if align:
+            header_size = len(zinfo.FileHeader(zip64)) + struct.calcsize("<HHH")
+            pad = -(zinfo.header_offset + header_size) % DATA_ALIGNMENT
+            zinfo.extra = struct.pack(
+                "<HHH", ALIGNMENT_EXTRA_ID, 2 + pad, DATA_ALIGNMENT
+            ) + (b"\0" * pad)
+
+        fp.write(zinfo.FileHeader(zip64))
+        offset = fp.tell()
+
+        remaining = zinfo.compress_size
+        while remaining > 0:
+            chunk = src.read(min(remaining, CHUNK_SIZE))
+            if not chunk:
+                raise IOError("Unexpected end of data for {}".format(zinfo.filename))
+
+            fp.write(chunk)
+            remaining -= len(chunk)
+
+    return offset
+
+
+def _writestr(zf, name, data):
+    """
+    Write generated metadata to the archive with a deterministic timestamp
+    """
+    zf.writestr(
+        zipfile.ZipInfo(name, date_time=time.localtime(zip_modtime)[:6]),
+        data,
+        compress_type=zf.compression,
+    )
+
+
+def _zipdir(
+    path,
+    zf,
+    mmap_data=False,
+    compression=None,
+    num_threads=None,
+    base_neuropod=None,
+    modes=None,
+):
+    """
+    Zip all the files in a directory in a determinisitc order along with a constant timestamp.
+    The files are only read so they can be links to the original inputs.
+
+    Files are compressed in parallel and written in sorted order so the output only depends on
+    the inputs (and not on the number of threads). A manifest of the hash, size and compression
+    of every file is added to the archive (see `MANIFEST_NAME`).
+
+    If `mmap_data` is True, files in `0/data` are stored uncompressed at aligned offsets and
+    an index of their locations is added to the archive (see `DATA_INDEX_NAME`)
+
+    :param  compression:    A list of rules for how to compress files (see `_create_neuropod`)
+    :param  num_threads:    The number of threads to compress files with. Defaults to the number of CPUs
+    :param  base_neuropod:  An optional path to a previous version of this package. Files that are unchanged
+                            are copied from it instead of being compressed again.
+    :param  modes:          An optional dict mapping relative paths to the file modes to store in the archive
+                            (instead of the modes of the files in `path`)
+    """
+    raw_writes = _supports_raw_writes(zf)
+    previous = None
+    if base_neuropod is not None and raw_writes:
+        previous = _PreviousPackage(base_neuropod)
+
     files_to_add = []
     for root, dirs, files in os.walk(path):
         for file in files:
@@ -44,12 +412,54 @@ def _zipdir(path, zf):
     # Sort by the relative path
     files_to_add.sort()
 
+    tasks = []
     for relpath, abspath in files_to_add:
-        # Set the modification time to a deterministic value
-        os.utime(abspath, (zip_modtime, zip_modtime))
+        if mmap_data and relpath.startswith(os.path.join("0", "data", "")):
+            compress_type, compresslevel = zipfile.ZIP_STORED, None
+        else:
+            compress_type, compresslevel = _get_compression(relpath, compression)
+
+        mode = modes.get(relpath) if modes is not None else None
+        tasks.append(
+            (relpath, abspath, compress_type, compresslevel, mode, previous, raw_writes)
+        )
+
+    index = {}
+    manifest = {}
+    pool = ThreadPool(num_threads or multiprocessing.cpu_count())
+    try:
+        # `imap` returns results in order so entries are written in sorted order as
+        # soon as they're ready
+        for zinfo, data, manifest_entry in pool.imap(_compress_file, tasks):
+            with data:
+                align = mmap_data and zinfo.filename.startswith(
+                    os.path.join("0", "data", "")
+                )
+                if raw_writes:
+                    offset = _write_raw(zf, zinfo, data, align=align)
+                else:
+                    offset = _write_compressed(zf, zinfo, data, manifest_entry["level"])
+
+            manifest[zinfo.filename] = manifest_entry
+            if align:
+                index[zinfo.filename] = {"offset": offset, "size": zinfo.file_size}
+    except BaseException:
+        # Don't wait for the rest of the files to be compressed
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+    if mmap_data:
+        _writestr(
+            zf,
+            DATA_INDEX_NAME,
+            json.dumps({"alignment": DATA_ALIGNMENT, "files": index}, sort_keys=True),
+        )
 
-        # Add to the zip file
-        zf.write(abspath, arcname=relpath)
+    _writestr(zf, MANIFEST_NAME, json.dumps({"files": manifest}, sort_keys=True))
 
 
 # A docstring common to all packagers
@@ -123,6 +533,44 @@ COMMON_DOC_POST = """
 
     :param  package_as_zip:     Whether to package the neuropod as a single file or as a directory.
 
+    :param  mmap_data:          Whether to store the files in `0/data` uncompressed at page aligned offsets
+                                when packaging as a zip. This lets loaders memory map them directly from the
+                                archive instead of extracting them. Requires python 3.6 or newer.
+
+    :param  compression:        An optional list of rules for how to compress files when packaging as a zip.
+                                Each rule is a dict with a `pattern` that is matched against the path of
+                                each file within the neuropod, a `method` (`stored` or `deflated`) and an
+                                optional compression `level`. The first matching rule is used. Files that
+                                don't match any rule are deflated with the default level.
+
+                                !!! note ""
+                                    ***Example***:
+                                    ```
+                                    [
+                                        # Weights that are already compressed
+                                        {"pattern": "0/data/*.pt", "method": "stored"},
+                                        {"pattern": "*", "method": "deflated", "level": 9},
+                                    ]
+                                    ```
+
+    :param  compression_threads:    The number of threads to use to compress files when packaging as
+                                    a zip. Defaults to the number of CPUs. The output does not depend
+                                    on the number of threads.
+
+    :param  base_neuropod:      An optional path to a previously packaged (zipped) version of this neuropod.
+                                Files that are unchanged and compressed the same way are copied from it
+                                instead of being compressed again so repackaging (e.g. after retraining)
+                                only compresses what changed. The output is the same as packaging from scratch.
+
+    :param  copy_mode:          How input files (e.g. models, data, code and custom ops) are added to the neuropod.
+                                `copy` copies them. `hardlink` creates hard links to them and `reflink` creates
+                                copy-on-write clones of them (on filesystems that support it). Both fall back to
+                                copying if necessary. These avoid copying large models, but files that are hard
+                                linked share their contents with the originals so neither should be modified.
+
+                                When packaging as a zip, `hardlink` and `reflink` zip the input files directly
+                                from their original paths instead of staging copies of them.
+
     :param  test_input_data:    Optional sample input data. This is a dict mapping input names to
                                 values. If this is provided, inference will be run in an isolated environment
                                 immediately after packaging to ensure that the neuropod was created
@@ -239,12 +687,36 @@ def _create_neuropod(
     neuropod_path,
     packager_fn,
     package_as_zip=True,
+    mmap_data=False,
+    compression=None,
+    compression_threads=None,
+    base_neuropod=None,
+    copy_mode="copy",
     custom_ops=[],
     test_input_data=None,
     test_expected_out=None,
     persist_test_data=True,
     **kwargs
 ):
+    if mmap_data and sys.version_info < (3, 6):
+        raise ValueError("`mmap_data` requires python 3.6 or newer")
+
+    if base_neuropod is not None and not package_as_zip:
+        raise ValueError("`base_neuropod` can only be used when packaging as a zip")
+
+    if copy_mode not in COPY_MODES:
+        raise ValueError(
+            "Invalid copy_mode: {}. Expected one of {}".format(copy_mode, COPY_MODES)
+        )
+
+    if copy_mode != "copy" and sys.version_info < (3,):
+        raise ValueError("`copy_mode` requires python 3")
+
+    # When packaging as a zip, the files are only staged in a temporary directory before being
+    # zipped so we link to the originals and zip them directly from their original paths
+    if package_as_zip and copy_mode != "copy":
+        copy_mode = "symlink"
+
     if package_as_zip:
         package_path = tempfile.mkdtemp()
     else:
@@ -265,7 +737,12 @@ def _create_neuropod(
     neuropod_custom_op_path = os.path.join(package_path, "0", "ops")
     os.makedirs(neuropod_custom_op_path)
     for op in custom_ops:
-        shutil.copy(op, neuropod_custom_op_path)
+        copy_file(
+            op,
+            os.path.join(neuropod_custom_op_path, os.path.basename(op)),
+            copy_mode=copy_mode,
+            copy_fn=shutil.copy,
+        )
 
     # Write the neuropod config file
     config_utils.write_neuropod_config(
@@ -275,14 +752,17 @@ def _create_neuropod(
     )
 
     # Run the packager
-    packager_fn(neuropod_path=package_path, **kwargs)
+    packager_fn(neuropod_path=package_path, copy_mode=copy_mode, **kwargs)
 
     # Persist the test data
     if test_input_data is not None and persist_test_data:
         save_test_data(package_path, test_input_data, test_expected_out)
 
     # Zip the directory if necessary
-    if package_as_zip:
+    # (zipped neuropods get a manifest of file hashes as part of the zipping process)
+    if not package_as_zip:
+        manifest_utils.write_manifest(package_path)
+    else:
         if os.path.exists(neuropod_path):
             raise ValueError(
                 "The specified neuropod path ({}) already exists! Aborting...".format(
@@ -291,7 +771,14 @@ def _create_neuropod(
             )
 
         zf = zipfile.ZipFile(neuropod_path, "w", zipfile.ZIP_DEFLATED)
-        _zipdir(package_path, zf)
+        _zipdir(
+            package_path,
+            zf,
+            mmap_data=mmap_data,
+            compression=compression,
+            num_threads=compression_threads,
+            base_neuropod=base_neuropod,
+        )
         zf.close()
 
         # Remove our tempdir
@@ -0,0 +1,180 @@
+# Copyright (c) 2020 UATC, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Prefetching the files of a neuropod into the page cache while it loads.
+
+On a host where a neuropod isn't in the page cache yet, loading is dominated by page faults while the
+framework deserializes the weights. Prefetching reads the files that backends load (`PREFETCH_PATTERNS`)
+sequentially in background threads while the backend initializes so they're (at least partly) in
+memory by the time they're deserialized. The C++ library prefetches the same files.
+
+Prefetching is enabled by setting the `NEUROPOD_PREFETCH_THREADS` environment variable to the number of
+threads to read with (or with the `prefetch_threads` argument of `load_neuropod`).
+"""
+
+import glob
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_THREADS_ENV_VAR = "NEUROPOD_PREFETCH_THREADS"
+
+# The files that backends load (relative to the root of a neuropod)
+PREFETCH_PATTERNS = [
+    # TorchScript
+    "0/data/model.pt",
+    # TensorFlow and ONNX
+    "0/data/model.pb",
+    # Caffe2
+    "0/data/init_net.pb",
+    # Caffe
+    "0/data/model.caffemodel",
+    # MXNet
+    "0/data/*.params",
+]
+
+# Files are split into chunks of this size that are read in parallel
+PREFETCH_CHUNK_SIZE = 16 * 1024 * 1024
+
+READ_SIZE = 1024 * 1024
+
+
+def get_prefetch_threads():
+    """
+    Returns the number of threads to prefetch with (0 if prefetching is disabled)
+    """
+    return int(os.getenv(PREFETCH_THREADS_ENV_VAR) or 0)
+
+
+def _read_chunk(path, offset, size, buf):
+    """
+    Reads part of a file (discarding the data). Returns the number of bytes read
+    """
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            # Start reading the whole chunk asynchronously
+            os.posix_fadvise(f.fileno(), offset, size, os.POSIX_FADV_WILLNEED)
+
+        f.seek(offset)
+        remaining = size
+        while remaining > 0:
+            num_read = f.readinto(buf[: min(remaining, len(buf))])
+            if not num_read:
+                break
+
+            remaining -= num_read
+
+    return size - remaining
+
+
+class Prefetcher(object):
+    """
+    Reads files in background threads. This never blocks the caller: `finish` stops the prefetch
+    without waiting for the chunks that are already being read
+    """
+
+    def __init__(self, paths, num_threads, chunk_size=PREFETCH_CHUNK_SIZE):
+        self.chunks = [
+            (path, offset, min(chunk_size, size - offset))
+            for path, size in ((path, os.path.getsize(path)) for path in paths)
+            for offset in range(0, size, chunk_size)
+        ]
+        self.bytes_total = sum(size for _, _, size in self.chunks)
+        self.lock = threading.Lock()
+        self.next_chunk = 0
+        self.bytes_read = 0
+        self.end_time = None
+        self.start_time = time.time()
+
+        # The number of threads that are still reading
+        self.num_running = max(1, min(num_threads, len(self.chunks)))
+        for _ in range(self.num_running):
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+
+    def _run(self):
+        buf = memoryview(bytearray(READ_SIZE))
+        while True:
+            with self.lock:
+                if self.next_chunk >= len(self.chunks):
+                    self.num_running -= 1
+                    if self.num_running == 0:
+                        self.end_time = time.time()
+
+                    return
+
+                path, offset, size = self.chunks[self.next_chunk]
+                self.next_chunk += 1
+
+            try:
+                num_read = _read_chunk(path, offset, size, buf)
+            except (IOError, OSError) as e:
+                # Prefetching is best effort
+                logger.warning("Error prefetching %s: %s", path, e)
+                continue
+
+            with self.lock:
+                self.bytes_read += num_read
+
+    def cancel(self):
+        """
+        Stops handing out chunks to the threads. Chunks that are already being read are finished
+        """
+        with self.lock:
+            self.next_chunk = len(self.chunks)
+
+    def finish(self):
+        """
+        Call once the model is loaded. Cancels the rest of the prefetch and returns the number of bytes
+        that were read by the time loading finished. Reading these while deserializing would have been
+        slower if they weren't in the page cache already
+        """
+        self.cancel()
+        load_time = time.time() - self.start_time
+        with self.lock:
+            bytes_read = self.bytes_read
+
+        logger.info(
+            "Prefetched %d of %d bytes while loading the model (%.3fs)",
+            bytes_read,
+            self.bytes_total,
+            load_time,
+        )
+
+        return bytes_read
+
+
+def prefetch(neuropod_path, num_threads, patterns=PREFETCH_PATTERNS):
+    """
+    Starts reading the files in an unzipped neuropod that match `patterns` into the page cache.
+    Returns a `Prefetcher` or None if there is nothing to prefetch
+
+    :param  neuropod_path:  The path to an unzipped neuropod
+    :param  num_threads:    The number of threads to read with
+    :param  patterns:       Glob patterns relative to the root of the neuropod
+    """
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(os.path.join(neuropod_path, *pattern.split("/"))))
+
+    paths = sorted(path for path in paths if os.path.isfile(path))
+    if not paths:
+        return None
+
+    return Prefetcher(paths, num_threads)
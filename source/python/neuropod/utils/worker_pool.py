@@ -0,0 +1,419 @@
+# Copyright (c) 2020 UATC, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A pool of worker processes that run inference. Tensors are passed to and from the
+workers using shared memory so array data is never pickled.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import traceback
+
+import numpy as np
+from six.moves import queue
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # Python < 3.8
+    resource_tracker = None
+    shared_memory = None
+
+logger = logging.getLogger(__name__)
+
+# Tensors are aligned to this many bytes within a shared memory buffer
+ALIGNMENT = 64
+
+
+def _align(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def is_supported():
+    """
+    Whether or not worker pools are supported by this version of python
+    """
+    return shared_memory is not None
+
+
+def _num_threads():
+    """
+    Returns the number of threads in this process (including threads that weren't started by python)
+    """
+    try:
+        return len(os.listdir("/proc/self/task"))
+    except OSError:
+        return threading.active_count()
+
+
+class SharedBufferWriter(object):
+    """
+    A growable shared memory buffer owned by the current process that tensors are written into
+    """
+
+    def __init__(self):
+        self.shm = None
+
+    def pack(self, items):
+        """
+        Copies a dict of numpy arrays into shared memory and returns a small, picklable
+        message that can be passed to `SharedBufferReader.unpack` in another process.
+
+        Arrays that can't be represented in shared memory (e.g. object arrays) are
+        included in the message directly.
+        """
+        specs = []
+        extra = {}
+        size = 0
+        for name, value in items.items():
+            if value.dtype.hasobject:
+                extra[name] = value
+                continue
+
+            specs.append((name, value.dtype.str, value.shape, size))
+            size = _align(size + value.nbytes)
+
+        if specs and (self.shm is None or self.shm.size < size):
+            # Grow the buffer (at least doubling it to avoid frequent reallocation)
+            new_size = max(size, 1, self.shm.size * 2 if self.shm is not None else 0)
+            self.close()
+            self.shm = shared_memory.SharedMemory(create=True, size=new_size)
+
+        for name, dtype, shape, offset in specs:
+            dst = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            dst[...] = items[name]
+
+        return (self.shm.name if specs else None, specs, extra)
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class SharedBufferReader(object):
+    """
+    Reads tensors written by a `SharedBufferWriter` in another process
+    """
+
+    def __init__(self):
+        self.shm = None
+
+    def unpack(self, message, copy):
+        """
+        Returns a dict of numpy arrays given a message from `SharedBufferWriter.pack`.
+
+        If `copy` is False, the returned arrays are views of the shared buffer and are only
+        valid until the writer writes to it again.
+        """
+        shm_name, specs, extra = message
+        if specs and (self.shm is None or self.shm.name != shm_name):
+            # The writer created a new buffer
+            self.close()
+            self.shm = shared_memory.SharedMemory(name=shm_name)
+
+        out = dict(extra)
+        for name, dtype, shape, offset in specs:
+            value = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            out[name] = value.copy() if copy else value
+
+        return out
+
+    def close(self):
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:
+                # Something still holds a view of the buffer. The mapping is released
+                # when the process exits
+                pass
+
+            self.shm = None
+
+
+def _worker_main(conn, make_forward, inherited_conns):
+    """
+    The main loop of a worker process
+
+    :param  conn:               The connection to the parent process
+    :param  make_forward:       A callable that returns the function to run inference with
+    :param  inherited_conns:    Connections inherited from the parent (when forking) that this
+                                worker should close so it notices when the parent exits
+    """
+    for item in inherited_conns:
+        item.close()
+
+    try:
+        forward = make_forward()
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+        return
+
+    conn.send(("ready", None))
+
+    reader = SharedBufferReader()
+    writer = SharedBufferWriter()
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                # The parent went away
+                break
+
+            if message is None:
+                break
+
+            try:
+                out = forward(reader.unpack(message, copy=False))
+                response = ("ok", writer.pack(out))
+            except Exception:
+                response = ("error", traceback.format_exc())
+
+            # Make sure we don't hold references to the input buffer
+            out = None
+            conn.send(response)
+    finally:
+        reader.close()
+        writer.close()
+
+
+class _Worker(object):
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.writer = SharedBufferWriter()
+        self.reader = SharedBufferReader()
+        self.exited = False
+
+    def is_alive(self):
+        return not self.exited and self.process.is_alive()
+
+    def wait_until_ready(self):
+        self._recv()
+
+    def run(self, inputs):
+        try:
+            self.conn.send(self.writer.pack(inputs))
+        except (IOError, OSError):
+            self.exited = True
+            raise RuntimeError(
+                "Worker process {} exited unexpectedly".format(self.process.pid)
+            )
+
+        return self.reader.unpack(self._recv(), copy=True)
+
+    def _recv(self):
+        try:
+            status, payload = self.conn.recv()
+        except EOFError:
+            self.exited = True
+            raise RuntimeError(
+                "Worker process {} exited unexpectedly".format(self.process.pid)
+            )
+
+        if status == "error":
+            raise RuntimeError("Error in worker process:\n{}".format(payload))
+
+        return payload
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):
+            pass
+
+        self.process.join()
+        self.conn.close()
+        self.reader.close()
+        self.writer.close()
+
+
+class WorkerPool(object):
+    """
+    Runs inference across a pool of worker processes. Each call to `run` is dispatched to an idle
+    worker so concurrent callers (e.g. multiple threads) run in parallel.
+    """
+
+    def __init__(
+        self, num_workers, make_forward, start_method, respawn_make_forward=None
+    ):
+        """
+        Start the workers
+
+        :param  num_workers:            The number of worker processes to start
+        :param  make_forward:           A callable that is run once in each worker and returns the function
+                                        used to run inference (a dict of numpy arrays to a dict of numpy
+                                        arrays). With the "fork" start method, anything this references is
+                                        shared copy-on-write with the workers. Otherwise, it must be picklable.
+        :param  start_method:           The multiprocessing start method to use (e.g. "fork" or "spawn").
+                                        "fork" is only allowed while this process has a single thread
+        :param  respawn_make_forward:   Required with the "fork" start method. Workers that exit are replaced
+                                        using the "spawn" start method (callers usually have other threads
+                                        running by then so forking isn't safe) and this picklable callable
+                                        is used instead of `make_forward` in the replacements
+        """
+        if not is_supported():
+            raise RuntimeError("Worker pools require python 3.8 or newer")
+
+        if num_workers < 1:
+            raise ValueError(
+                "num_workers must be at least 1. Got {}".format(num_workers)
+            )
+
+        if start_method == "fork" and respawn_make_forward is None:
+            raise ValueError(
+                "respawn_make_forward is required with the fork start method so workers "
+                "that exit can be replaced"
+            )
+
+        # Make sure all the workers share our resource tracker. Otherwise, forked workers
+        # start their own tracker that would unlink our shared memory when they exit
+        resource_tracker.ensure_running()
+
+        self.ctx = multiprocessing.get_context(start_method)
+        self.make_forward = make_forward
+        self.start_method = start_method
+        self.respawn_make_forward = respawn_make_forward
+        self.workers = []
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+
+        try:
+            for _ in range(num_workers):
+                self.workers.append(self._start_worker())
+
+            # Wait for all the workers to finish loading
+            for worker in self.workers:
+                worker.wait_until_ready()
+                self.idle.put(worker)
+        except Exception:
+            self.close()
+            raise
+
+    def _start_worker(self, replacement=False):
+        """
+        Starts a worker process. Call `wait_until_ready` on the returned worker before using it
+
+        :param  replacement:    Whether this worker replaces one that exited
+        """
+        ctx = self.ctx
+        start_method = self.start_method
+        make_forward = self.make_forward
+        if replacement and start_method == "fork":
+            ctx = multiprocessing.get_context("spawn")
+            start_method = "spawn"
+            make_forward = self.respawn_make_forward
+
+        num_threads = _num_threads()
+        if start_method == "fork" and num_threads > 1:
+            # `fork` only copies the calling thread so locks held by other threads (e.g. in malloc
+            # or in the interpreter) stay locked forever in the child
+            raise RuntimeError(
+                "Can't fork worker processes because this process has {} threads. Load the model "
+                "before starting any threads or use `num_workers` instead".format(
+                    num_threads
+                )
+            )
+
+        parent_conn, child_conn = ctx.Pipe()
+
+        # Forked workers inherit the parent ends of all the pipes created so far
+        inherited = []
+        if start_method == "fork":
+            inherited = [w.conn for w in self.workers] + [parent_conn]
+
+        process = ctx.Process(
+            target=_worker_main, args=(child_conn, make_forward, inherited)
+        )
+        process.daemon = True
+        process.start()
+        child_conn.close()
+
+        return _Worker(process, parent_conn)
+
+    def _replace_worker(self, worker):
+        """
+        Closes a worker that exited and starts a new one in its place. Returns the new worker
+        or None if it couldn't be started
+        """
+        worker.close()
+        with self.lock:
+            self.workers.remove(worker)
+            if self.closed:
+                return None
+
+        try:
+            replacement = self._start_worker(replacement=True)
+        except Exception:
+            logger.exception("Error restarting a worker process")
+            return None
+
+        try:
+            replacement.wait_until_ready()
+        except Exception:
+            logger.exception("Error restarting a worker process")
+            replacement.close()
+            return None
+
+        with self.lock:
+            self.workers.append(replacement)
+
+        return replacement
+
+    def run(self, inputs):
+        """
+        Run inference on an idle worker
+
+        :param  inputs:     A dict mapping input names to numpy arrays
+        :returns:   A dict mapping output names to numpy arrays
+        """
+        worker = self.idle.get()
+        if worker is None:
+            # Put the marker back for other callers
+            self.idle.put(None)
+            raise RuntimeError("All the worker processes exited")
+
+        try:
+            return worker.run(inputs)
+        finally:
+            if not worker.is_alive():
+                # The worker crashed (e.g. in native code). Replace it so later calls don't fail
+                worker = self._replace_worker(worker)
+
+            if worker is not None:
+                self.idle.put(worker)
+            else:
+                with self.lock:
+                    if not self.workers:
+                        # Wake up callers waiting for a worker
+                        self.idle.put(None)
+
+    def close(self):
+        """
+        Stop all the workers
+        """
+        with self.lock:
+            if self.closed:
+                return
+
+            self.closed = True
+
+        for worker in list(self.workers):
+            worker.close()
@@ -13,11 +13,32 @@
 # limitations under the License.
 
 import atexit
+import io
+import json
 import os
 import shutil
 import tempfile
 import zipfile
 
+import six
+
+from neuropod.utils import content_store, extraction_cache
+
+# The directory in a python neuropod that contains the packaged code
+PYTHON_CODE_PREFIX = "0/code/"
+
+# The index of uncompressed data files in a neuropod packaged with `mmap_data=True`
+DATA_INDEX_NAME = "data_index.json"
+
+# A manifest of the hash, size and compression of every file in a zipped neuropod
+MANIFEST_NAME = "manifest.json"
+
+# Describes how to reconstruct the neuropod in a delta package (see `delta_utils`)
+DELTA_NAME = "delta.json"
+
+# The size of the fixed part of a zip local file header
+LOCAL_HEADER_SIZE = 30
+
 # Delete the created directories at process shutdown
 TO_CLEANUP = []
 
@@ -30,18 +51,142 @@ def cleanup():
 atexit.register(cleanup)
 
 
-def extract_neuropod_if_necessary(path):
-    if os.path.isdir(path):
+def extract_neuropod_if_necessary(path, skip_python_code=False, base_neuropod=None):
+    """
+    Extracts a zipped neuropod to a temporary directory (if `path` is not already a directory)
+
+    :param  path:               The path to a neuropod directory or zipfile or a zipped neuropod in memory
+                                (see `is_in_memory`)
+    :param  skip_python_code:   Don't extract the code of python neuropods (i.e. `0/code`) because
+                                it will be imported directly from the zipfile
+    :param  base_neuropod:      If `path` is a delta package, the path to the neuropod (zipped or
+                                unzipped) it was created against. The full neuropod is reconstructed
+                                from both (see `delta_utils`)
+
+    If the `NEUROPOD_CACHE_DIR` environment variable is set, the neuropod is extracted into a
+    persistent cache shared with other processes instead (see `extraction_cache`)
+
+    If the `NEUROPOD_CONTENT_STORE_DIR` environment variable is set, data files and custom ops that
+    are identical to ones in other extracted neuropods are shared with them (see `content_store`)
+    """
+    if is_in_memory(path):
+        # Extract directly from memory
+        path = open_in_memory(path)
+    elif os.path.isdir(path):
         # `path` is already a directory
         return path
 
+    if is_delta_neuropod(path):
+        return _extract_delta(path, base_neuropod)
+
+    if extraction_cache.get_cache_dir() is not None:
+        # Cached entries are always fully extracted so they can be shared
+        return extraction_cache.extract_to_cache(path, extract=_extract)
+
     # Assume it's a zipfile
     neuropod_path = tempfile.mkdtemp(suffix=".neuropod")
     z = zipfile.ZipFile(path)
-    z.extractall(neuropod_path)
+    members = None
+    if skip_python_code and is_python_neuropod(z):
+        members = [
+            item for item in z.namelist() if not item.startswith(PYTHON_CODE_PREFIX)
+        ]
+
+    _extract(z, neuropod_path, members=members)
     z.close()
 
     # Make sure we delete this once we're done
     TO_CLEANUP.append(neuropod_path)
 
     return neuropod_path
+
+
+def is_in_memory(neuropod):
+    """
+    Whether or not `neuropod` is a zipped neuropod in memory (a bytes-like or file-like object)
+    instead of a path
+    """
+    if isinstance(neuropod, (bytearray, memoryview)) or hasattr(neuropod, "read"):
+        return True
+
+    # On python 2, `bytes` are paths
+    return isinstance(neuropod, six.binary_type) and not isinstance(
+        neuropod, six.string_types
+    )
+
+
+def open_in_memory(neuropod):
+    """
+    Returns a seekable file-like object for a zipped neuropod in memory. Streams that can't seek
+    are read into memory
+    """
+    if hasattr(neuropod, "read"):
+        if hasattr(neuropod, "seekable") and neuropod.seekable():
+            return neuropod
+
+        neuropod = neuropod.read()
+
+    return io.BytesIO(neuropod)
+
+
+def is_delta_neuropod(path):
+    """
+    Whether or not `path` is a delta package
+    """
+    if is_in_memory(path):
+        path = open_in_memory(path)
+    elif os.path.isdir(path):
+        return False
+
+    if not zipfile.is_zipfile(path):
+        return False
+
+    with zipfile.ZipFile(path) as zf:
+        return DELTA_NAME in zf.NameToInfo
+
+
+def _extract_delta(path, base_neuropod):
+    """
+    Reconstructs the neuropod in a delta package in a temporary directory
+    """
+    # Avoid a circular import
+    from neuropod.utils import delta_utils
+
+    if base_neuropod is None:
+        raise ValueError(
+            "{} is a delta package. `base_neuropod` must be specified to load it".format(
+                path
+            )
+        )
+
+    base_path = extract_neuropod_if_necessary(base_neuropod)
+    tmpdir = tempfile.mkdtemp(suffix=".neuropod")
+
+    # Make sure we delete this once we're done
+    TO_CLEANUP.append(tmpdir)
+
+    neuropod_path = os.path.join(tmpdir, "neuropod")
+    delta_utils.overlay_delta_neuropod(base_path, path, neuropod_path)
+    return neuropod_path
+
+
+def _extract(zf, path, members=None):
+    """
+    Extracts a zipped neuropod using the content store (if it's enabled)
+    """
+    if content_store.get_store_dir() is None or MANIFEST_NAME not in zf.NameToInfo:
+        zf.extractall(path, members=members)
+        return
+
+    manifest = json.loads(zf.read(MANIFEST_NAME).decode("utf-8"))["files"]
+    content_store.extract(zf, path, manifest, members=members)
+
+
+def is_python_neuropod(zf):
+    """
+    Whether or not a zipped neuropod is a python neuropod
+
+    :param  zf:     A `zipfile.ZipFile` containing a neuropod
+    """
+    config = json.loads(zf.read("config.json").decode("utf-8"))
+    return config["platform"] == "python"